@@ -0,0 +1,36 @@
+"""add_pvp_battle_snapshots_table
+
+Revision ID: 3b9e1f7c2a44
+Revises: 82a32d00ba25
+Create Date: 2026-01-05 18:20:11.402315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9e1f7c2a44'
+down_revision = '82a32d00ba25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create pvp_battle_snapshots table (latest state per live PVP battle)
+    op.create_table(
+        'pvp_battle_snapshots',
+        sa.Column('battle_id', sa.String(), nullable=False),
+        sa.Column('duel_id', sa.Integer(), nullable=False),
+        sa.Column('turn', sa.Integer(), nullable=False),
+        sa.Column('state', sa.JSON(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['duel_id'], ['duels.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('battle_id')
+    )
+    op.create_index(op.f('ix_pvp_battle_snapshots_duel_id'), 'pvp_battle_snapshots', ['duel_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_pvp_battle_snapshots_duel_id'), table_name='pvp_battle_snapshots')
+    op.drop_table('pvp_battle_snapshots')
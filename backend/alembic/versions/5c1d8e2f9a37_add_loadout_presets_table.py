@@ -0,0 +1,43 @@
+"""add_loadout_presets_table
+
+Revision ID: 5c1d8e2f9a37
+Revises: 3b9e1f7c2a44
+Create Date: 2026-01-07 20:41:36.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1d8e2f9a37'
+down_revision = '3b9e1f7c2a44'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create loadout_presets table (named equipment + pet set snapshots)
+    op.create_table(
+        'loadout_presets',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('player_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('slots', sa.JSON(), nullable=False),
+        sa.Column('bonus_attack', sa.Integer(), nullable=False),
+        sa.Column('bonus_defense', sa.Integer(), nullable=False),
+        sa.Column('bonus_hp', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['player_id'], ['players.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('player_id', 'name', name='uq_loadout_presets_player_name')
+    )
+    op.create_index(op.f('ix_loadout_presets_id'), 'loadout_presets', ['id'], unique=False)
+    op.create_index(op.f('ix_loadout_presets_player_id'), 'loadout_presets', ['player_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_loadout_presets_player_id'), table_name='loadout_presets')
+    op.drop_index(op.f('ix_loadout_presets_id'), table_name='loadout_presets')
+    op.drop_table('loadout_presets')
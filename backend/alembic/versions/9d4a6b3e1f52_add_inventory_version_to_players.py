@@ -0,0 +1,25 @@
+"""add_inventory_version_to_players
+
+Revision ID: 9d4a6b3e1f52
+Revises: 5c1d8e2f9a37
+Create Date: 2026-01-08 16:12:54.730119
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4a6b3e1f52'
+down_revision = '5c1d8e2f9a37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Per-player counter bumped on inventory changes (used for inventory ETags)
+    op.add_column('players', sa.Column('inventory_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('players', 'inventory_version')
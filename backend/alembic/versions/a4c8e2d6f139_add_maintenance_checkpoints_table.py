@@ -0,0 +1,35 @@
+"""add_maintenance_checkpoints_table
+
+Revision ID: a4c8e2d6f139
+Revises: f1a7c3e8b264
+Create Date: 2026-01-14 16:02:41.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c8e2d6f139'
+down_revision = 'f1a7c3e8b264'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create maintenance_checkpoints table (resume position of batch maintenance jobs)
+    op.create_table(
+        'maintenance_checkpoints',
+        sa.Column('job', sa.String(), nullable=False),
+        sa.Column('last_id', sa.BigInteger(), nullable=False),
+        sa.Column('rows_scanned', sa.BigInteger(), nullable=False),
+        sa.Column('rows_changed', sa.BigInteger(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('job')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('maintenance_checkpoints')
@@ -0,0 +1,149 @@
+"""partition_chat_messages_and_battle_logs
+
+Revision ID: b7d3e9f1a582
+Revises: d8f2b6a4e913
+Create Date: 2026-01-21 09:36:12.804519
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e9f1a582'
+down_revision = 'd8f2b6a4e913'
+branch_labels = None
+depends_on = None
+
+# Monthly partitions created up front after the legacy partition; the
+# retention manager keeps creating them ahead from then on
+MONTHS_AHEAD = 2
+
+# Indexes of each table besides the primary key: (name, columns)
+INDEXES = {
+    'chat_messages': [
+        ('ix_chat_messages_id', ['id']),
+        ('ix_chat_messages_created_at', ['created_at']),
+        ('ix_chat_messages_channel_created_at_id', ['channel', 'created_at', 'id']),
+    ],
+    'battle_logs': [
+        ('ix_battle_logs_id', ['id']),
+        ('ix_battle_logs_created_at', ['created_at']),
+        ('ix_battle_logs_battle_id_created_at_id', ['battle_id', 'created_at', 'id']),
+    ],
+}
+
+
+def _columns(table):
+    # id keeps drawing from the existing sequence, so IDs continue where they left off
+    id_column = sa.Column('id', sa.Integer(), nullable=False, server_default=sa.text(f"nextval('{table}_id_seq'::regclass)"))
+    created_at = sa.Column('created_at', sa.DateTime(), nullable=False)
+    if table == 'chat_messages':
+        return [
+            id_column,
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('username', sa.String(), nullable=False),
+            sa.Column('text', sa.Text(), nullable=False),
+            sa.Column('message_type', sa.String(), nullable=True),
+            sa.Column('channel', sa.String(), server_default='tavern:1', nullable=False),
+            created_at,
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        ]
+    return [
+        id_column,
+        # No foreign key to battles: logs outlive the battles deleted by the pool
+        # cleanup and are removed by dropping whole partitions instead
+        sa.Column('battle_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('username', sa.String(), nullable=True),
+        sa.Column('log_type', sa.String(), nullable=False),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.Column('enemy_id', sa.Integer(), nullable=True),
+        sa.Column('enemy_name', sa.String(), nullable=True),
+        sa.Column('damage', sa.BigInteger(), nullable=True),
+        sa.Column('enemy_hp_remaining', sa.BigInteger(), nullable=True),
+        created_at,
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    ]
+
+
+def _next_month(month: datetime) -> datetime:
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _partition_table(table):
+    """Turn table into a RANGE (created_at) partitioned table, keeping the existing rows in place"""
+    legacy = f'{table}_legacy'
+
+    # The existing table becomes the first partition (no rows are copied);
+    # move its names out of the way of the new parent table's
+    op.rename_table(table, legacy)
+    op.execute(f'ALTER TABLE {legacy} RENAME CONSTRAINT {table}_pkey TO {legacy}_pkey')
+    for name, _ in INDEXES[table]:
+        op.execute(f'ALTER INDEX IF EXISTS {name} RENAME TO {name.replace(table, legacy, 1)}')
+    if table == 'battle_logs':
+        op.drop_constraint('battle_logs_battle_id_fkey', legacy, type_='foreignkey')
+
+    # The partition key must be part of the primary key, so it cannot be NULL
+    op.execute(f"UPDATE {legacy} SET created_at = now() at time zone 'utc' WHERE created_at IS NULL")
+    op.alter_column(legacy, 'created_at', nullable=False)
+
+    op.create_table(
+        table,
+        *_columns(table),
+        sa.PrimaryKeyConstraint('id', 'created_at'),
+        postgresql_partition_by='RANGE (created_at)'
+    )
+    for name, columns in INDEXES[table]:
+        op.create_index(name, table, columns, unique=False)
+    op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id')
+
+    # Everything up to the end of the current month (or of the newest row) stays in the legacy partition
+    bound = op.get_bind().execute(sa.text(
+        f"SELECT date_trunc('month', greatest(now() at time zone 'utc', max(created_at))) + interval '1 month' FROM {legacy}"
+    )).scalar()
+    op.execute(f"ALTER TABLE {table} ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO ('{bound:%Y-%m-%d}')")
+
+    month = datetime(bound.year, bound.month, 1)
+    for _ in range(MONTHS_AHEAD):
+        end = _next_month(month)
+        op.execute(
+            f"CREATE TABLE {table}_p{month:%Y_%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        )
+        month = end
+
+    # Safety net for rows outside every range; the retention manager keeps it empty
+    op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+
+def _unpartition_table(table):
+    """Copy a partitioned table back into a plain table"""
+    plain = f'{table}_plain'
+    op.create_table(plain, *_columns(table))
+    op.execute(f'INSERT INTO {plain} SELECT * FROM {table}')
+    op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {plain}.id')
+    op.execute(f'DROP TABLE {table} CASCADE')
+    op.rename_table(plain, table)
+    op.create_primary_key(f'{table}_pkey', table, ['id'])
+    op.alter_column(table, 'created_at', nullable=True)
+    if table == 'battle_logs':
+        op.create_foreign_key('battle_logs_battle_id_fkey', table, 'battles', ['battle_id'], ['id'])
+    for name, columns in INDEXES[table]:
+        op.create_index(name, table, columns, unique=False)
+
+
+def upgrade() -> None:
+    # Time-partition the two append-only log tables so old data is removed by
+    # dropping whole partitions (see app/services/log_retention.py)
+    _partition_table('chat_messages')
+    _partition_table('battle_logs')
+
+
+def downgrade() -> None:
+    # Orphaned logs of battles that no longer exist would violate the restored foreign key
+    op.execute('DELETE FROM battle_logs WHERE battle_id NOT IN (SELECT id FROM battles)')
+    _unpartition_table('battle_logs')
+    _unpartition_table('chat_messages')
@@ -0,0 +1,29 @@
+"""add_item_created_at_and_auto_salvage
+
+Revision ID: b7e2c4a9d813
+Revises: 9d4a6b3e1f52
+Create Date: 2026-01-09 11:27:03.558921
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2c4a9d813'
+down_revision = '9d4a6b3e1f52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Item age for "salvage older than" filters; existing items count as created now
+    op.add_column('inventory_items', sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=True))
+
+    # Per-player auto-salvage threshold applied when claiming loot
+    op.add_column('players', sa.Column('auto_salvage_rarity', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('players', 'auto_salvage_rarity')
+    op.drop_column('inventory_items', 'created_at')
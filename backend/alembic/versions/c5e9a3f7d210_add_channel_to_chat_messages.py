@@ -0,0 +1,27 @@
+"""add_channel_to_chat_messages
+
+Revision ID: c5e9a3f7d210
+Revises: a4c8e2d6f139
+Create Date: 2026-01-15 11:47:09.302716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e9a3f7d210'
+down_revision = 'a4c8e2d6f139'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Chat channel a message was sent to; existing messages belong to the first tavern room
+    op.add_column('chat_messages', sa.Column('channel', sa.String(), server_default='tavern:1', nullable=False))
+    op.create_index('ix_chat_messages_channel_created_at', 'chat_messages', ['channel', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_chat_messages_channel_created_at', table_name='chat_messages')
+    op.drop_column('chat_messages', 'channel')
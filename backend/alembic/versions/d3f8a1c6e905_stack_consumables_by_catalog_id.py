@@ -0,0 +1,86 @@
+"""stack_consumables_by_catalog_id
+
+Revision ID: d3f8a1c6e905
+Revises: b7e2c4a9d813
+Create Date: 2026-01-10 14:05:48.216733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f8a1c6e905'
+down_revision = 'b7e2c4a9d813'
+branch_labels = None
+depends_on = None
+
+
+# Shop catalog IDs of every stackable consumable, by the name purchases stored
+CONSUMABLE_CATALOG_IDS = {
+    'Basic Pet Food': 'food_basic',
+    'Quality Pet Food': 'food_quality',
+    'Premium Pet Food': 'food_premium',
+    'Legendary Pet Food': 'food_legendary',
+    'Minor Stamina Potion': 'potion_stamina_small',
+    'Stamina Potion': 'potion_stamina_medium',
+    'Greater Stamina Potion': 'potion_stamina_large',
+    'Full Stamina Elixir': 'potion_stamina_full',
+    'Endurance Elixir': 'potion_stamina_boost',
+    "Titan's Endurance": 'potion_stamina_mega_boost',
+    'Strength Potion': 'potion_attack_2x',
+    'Greater Strength Potion': 'potion_attack_3x',
+    "Berserker's Rage": 'potion_attack_5x',
+    'Divine Fury': 'potion_attack_10x',
+}
+
+
+def upgrade() -> None:
+    op.add_column('inventory_items', sa.Column('catalog_id', sa.String(), nullable=True))
+
+    # Tag existing consumables with their catalog ID
+    inventory_items = sa.table(
+        'inventory_items',
+        sa.column('name', sa.String()),
+        sa.column('catalog_id', sa.String())
+    )
+    op.execute(
+        inventory_items.update()
+        .where(inventory_items.c.name.in_(list(CONSUMABLE_CATALOG_IDS)))
+        .values(catalog_id=sa.case(CONSUMABLE_CATALOG_IDS, value=inventory_items.c.name))
+    )
+
+    # Fold duplicate rows into the oldest row of each (player, catalog ID) group
+    op.execute("""
+        UPDATE inventory_items AS i
+        SET quantity = s.total
+        FROM (
+            SELECT MIN(id) AS keep_id, SUM(COALESCE(quantity, 1)) AS total
+            FROM inventory_items
+            WHERE catalog_id IS NOT NULL
+            GROUP BY player_id, catalog_id
+            HAVING COUNT(*) > 1
+        ) AS s
+        WHERE i.id = s.keep_id
+    """)
+    op.execute("""
+        DELETE FROM inventory_items AS i
+        USING (
+            SELECT player_id, catalog_id, MIN(id) AS keep_id
+            FROM inventory_items
+            WHERE catalog_id IS NOT NULL
+            GROUP BY player_id, catalog_id
+            HAVING COUNT(*) > 1
+        ) AS s
+        WHERE i.player_id = s.player_id
+          AND i.catalog_id = s.catalog_id
+          AND i.id <> s.keep_id
+    """)
+
+    op.create_unique_constraint('uq_inventory_items_player_catalog', 'inventory_items', ['player_id', 'catalog_id'])
+
+
+def downgrade() -> None:
+    # Merged stacks stay merged; only the key and constraint are removed
+    op.drop_constraint('uq_inventory_items_player_catalog', 'inventory_items', type_='unique')
+    op.drop_column('inventory_items', 'catalog_id')
@@ -0,0 +1,29 @@
+"""add_keyset_pagination_indexes
+
+Revision ID: d8f2b6a4e913
+Revises: c5e9a3f7d210
+Create Date: 2026-01-19 10:22:41.518307
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f2b6a4e913'
+down_revision = 'c5e9a3f7d210'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Composite indexes matching the (created_at, id) keyset order of history pages
+    op.create_index('ix_chat_messages_channel_created_at_id', 'chat_messages', ['channel', 'created_at', 'id'], unique=False)
+    op.drop_index('ix_chat_messages_channel_created_at', table_name='chat_messages')
+    op.create_index('ix_battle_logs_battle_id_created_at_id', 'battle_logs', ['battle_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_battle_logs_battle_id_created_at_id', table_name='battle_logs')
+    op.create_index('ix_chat_messages_channel_created_at', 'chat_messages', ['channel', 'created_at'], unique=False)
+    op.drop_index('ix_chat_messages_channel_created_at_id', table_name='chat_messages')
@@ -0,0 +1,25 @@
+"""add_owner_to_pvp_battle_snapshots
+
+Revision ID: e2c7a9f4b618
+Revises: b7d3e9f1a582
+Create Date: 2026-01-23 14:08:52.617402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2c7a9f4b618'
+down_revision = 'b7d3e9f1a582'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Worker that last wrote the snapshot; only that worker may cancel the battle's duel
+    op.add_column('pvp_battle_snapshots', sa.Column('owner', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('pvp_battle_snapshots', 'owner')
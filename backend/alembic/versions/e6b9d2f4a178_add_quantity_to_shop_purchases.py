@@ -0,0 +1,25 @@
+"""add_quantity_to_shop_purchases
+
+Revision ID: e6b9d2f4a178
+Revises: d3f8a1c6e905
+Create Date: 2026-01-11 10:48:22.907614
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b9d2f4a178'
+down_revision = 'd3f8a1c6e905'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Cart checkouts record one row per line with the number of units bought
+    op.add_column('shop_purchases', sa.Column('quantity', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('shop_purchases', 'quantity')
@@ -0,0 +1,39 @@
+"""add_currency_ledger_table
+
+Revision ID: f1a7c3e8b264
+Revises: e6b9d2f4a178
+Create Date: 2026-01-12 09:33:17.640258
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a7c3e8b264'
+down_revision = 'e6b9d2f4a178'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Create currency_ledger table (append-only audit of gold/gem changes)
+    op.create_table(
+        'currency_ledger',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('player_id', sa.Integer(), nullable=False),
+        sa.Column('currency', sa.String(), nullable=False),
+        sa.Column('amount', sa.BigInteger(), nullable=False),
+        sa.Column('balance_after', sa.BigInteger(), nullable=False),
+        sa.Column('reason', sa.String(), nullable=False),
+        sa.Column('reference', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['player_id'], ['players.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_currency_ledger_player_id_id', 'currency_ledger', ['player_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_currency_ledger_player_id_id', table_name='currency_ledger')
+    op.drop_table('currency_ledger')
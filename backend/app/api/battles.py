@@ -1,6 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Optional
 from app.db.database import get_db
+from app.db.pagination import keyset_page
 from app.models.user import User
 from app.models.player import Player
 from app.models.battle import Battle, DifficultyLevel, BattleParticipant, BattleType, BattleStatus, BattleEnemy
@@ -8,7 +13,7 @@ from app.models.battle_log import BattleLog
 from app.core.security import get_current_active_user
 from app.services.battle_service import BattleService
 from app.services.battle_pool_manager import BattlePoolManager
-from app.websocket.battle_ws import get_battle_manager
+from app.websocket.battle_ws import broadcast_to_battle
 from app.schemas.battle import (
     BattleInfo,
     BattleListItem,
@@ -16,6 +21,8 @@ from app.schemas.battle import (
     JoinBattleResponse,
     AttackRequest,
     AttackResponse,
+    BatchAttackRequest,
+    BatchAttackResponse,
     ClaimLootResponse,
     BattleParticipantInfo
 )
@@ -60,6 +67,23 @@ def persist_battle_log(
         return None
 
 
+def persist_battle_logs(db: Session, rows: list[dict]):
+    """
+    Persist several battle log rows with a single multi-row INSERT
+
+    Each row is a dict of BattleLog column values.
+    """
+    if not rows:
+        return
+    try:
+        now = datetime.utcnow()
+        db.execute(insert(BattleLog), [{"created_at": now, **row} for row in rows])
+        db.commit()
+    except Exception as e:
+        logger.error("failed_to_persist_battle_logs", error=str(e), count=len(rows))
+        db.rollback()
+
+
 @router.post("/create", response_model=BattleInfo)
 async def create_battle(
     battle_req: CreateBattleRequest,
@@ -289,9 +313,8 @@ async def join_battle(
         )
 
     # Broadcast player joined event via WebSocket
-    manager = get_battle_manager()
     background_tasks.add_task(
-        manager.broadcast_to_battle,
+        broadcast_to_battle,
         battle_id,
         {
             "type": "player_joined_battle",
@@ -377,9 +400,8 @@ async def attack_enemy(
     )
 
     # Broadcast attack event to all players in battle via WebSocket
-    manager = get_battle_manager()
     background_tasks.add_task(
-        manager.broadcast_to_battle,
+        broadcast_to_battle,
         battle_id,
         {
             "type": "attack",
@@ -410,7 +432,7 @@ async def attack_enemy(
         )
 
         background_tasks.add_task(
-            manager.broadcast_to_battle,
+            broadcast_to_battle,
             battle_id,
             {
                 "type": "enemy_defeated",
@@ -422,7 +444,7 @@ async def attack_enemy(
     # If battle completed, broadcast that event
     if result.get("battle_completed"):
         background_tasks.add_task(
-            manager.broadcast_to_battle,
+            broadcast_to_battle,
             battle_id,
             {
                 "type": "battle_completed",
@@ -435,7 +457,7 @@ async def attack_enemy(
     if result.get("phase_transition"):
         phase_data = result.get("phase_transition")
         background_tasks.add_task(
-            manager.broadcast_to_battle,
+            broadcast_to_battle,
             battle_id,
             {
                 "type": "boss_phase_change",
@@ -449,6 +471,126 @@ async def attack_enemy(
     return AttackResponse(**result)
 
 
+@router.post("/{battle_id}/attack/batch", response_model=BatchAttackResponse)
+async def attack_enemies_batch(
+    battle_id: int,
+    batch_req: BatchAttackRequest,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Perform an ordered list of attacks in a single request
+
+    Intended for multi-hit skills and auto-attack clients. All hits are
+    resolved in one transaction, written to the battle log with one INSERT
+    and announced with one consolidated `attack_batch` broadcast.
+    """
+    player = db.query(Player).filter(Player.user_id == current_user.id).first()
+    if not player:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Player not found"
+        )
+
+    battle = db.query(Battle).filter(Battle.id == battle_id).first()
+    if not battle:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Battle not found"
+        )
+
+    attacks = [(a.enemy_id, a.attack_type.value) for a in batch_req.attacks]
+    for attempt in range(2):
+        try:
+            result = BattleService.process_attack_batch(
+                db=db,
+                battle=battle,
+                player=player,
+                attacks=attacks
+            )
+            break
+        except OperationalError as e:
+            # Deadlock or serialization failure against another raider's batch:
+            # nothing was committed, so run the whole batch once more
+            db.rollback()
+            if attempt:
+                raise
+            logger.warning("attack_batch_retry", battle_id=battle_id, player_id=player.id, error=str(e))
+
+    if not result["success"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=result.get("error", "Attack failed")
+        )
+
+    # Enemy names for log messages (single query for every enemy in the battle)
+    enemy_names = {
+        enemy_id: name for enemy_id, name in
+        db.query(BattleEnemy.id, BattleEnemy.name).filter(BattleEnemy.battle_id == battle_id).all()
+    }
+
+    log_rows = []
+    hits = []
+    defeated_enemy_ids = []
+    for hit in result["results"]:
+        if not hit["success"]:
+            continue
+
+        enemy_name = enemy_names.get(hit["enemy_id"], "Enemy")
+        crit_text = " (CRITICAL HIT!)" if hit["is_critical"] else ""
+        log_rows.append({
+            "battle_id": battle_id,
+            "user_id": current_user.id,
+            "username": player.username,
+            "log_type": "attack",
+            "message": f"{player.username} dealt {hit['damage']} damage to {enemy_name}{crit_text}",
+            "enemy_id": hit["enemy_id"],
+            "enemy_name": enemy_name,
+            "damage": hit["damage"],
+            "enemy_hp_remaining": hit["enemy_hp_remaining"]
+        })
+        hits.append({
+            "enemy_id": hit["enemy_id"],
+            "damage": hit["damage"],
+            "is_critical": hit["is_critical"],
+            "enemy_hp_remaining": hit["enemy_hp_remaining"],
+            "enemy_defeated": hit["enemy_defeated"]
+        })
+
+        if hit["enemy_defeated"]:
+            defeated_enemy_ids.append(hit["enemy_id"])
+            log_rows.append({
+                "battle_id": battle_id,
+                "user_id": current_user.id,
+                "username": player.username,
+                "log_type": "enemy_defeated",
+                "message": f"{enemy_name} has been defeated by {player.username}!",
+                "enemy_id": hit["enemy_id"],
+                "enemy_name": enemy_name
+            })
+
+    persist_battle_logs(db, log_rows)
+
+    # One consolidated broadcast for the whole batch
+    background_tasks.add_task(
+        broadcast_to_battle,
+        battle_id,
+        {
+            "type": "attack_batch",
+            "player_name": player.username,
+            "player_level": player.level,
+            "hits": hits,
+            "total_damage": result["total_damage"],
+            "defeated_enemy_ids": defeated_enemy_ids,
+            "battle_completed": result["battle_completed"],
+            "phase_transitions": result["phase_transitions"]
+        }
+    )
+
+    return BatchAttackResponse(**result)
+
+
 @router.post("/{battle_id}/resurrect")
 async def resurrect_player(
     battle_id: int,
@@ -513,9 +655,8 @@ async def resurrect_player(
 
     # Broadcast resurrection event
     if background_tasks:
-        manager = get_battle_manager()
         background_tasks.add_task(
-            manager.broadcast_to_battle,
+            broadcast_to_battle,
             battle_id,
             {
                 "type": "player_resurrected",
@@ -585,9 +726,8 @@ async def claim_loot(
     )
 
     # Broadcast loot claim event
-    manager = get_battle_manager()
     background_tasks.add_task(
-        manager.broadcast_to_battle,
+        broadcast_to_battle,
         battle_id,
         {
             "type": "loot_claimed",
@@ -631,14 +771,16 @@ async def get_my_battle_history(
 async def get_battle_logs(
     battle_id: int,
     limit: int = 100,
-    offset: int = 0,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """
     Get battle log history for a specific battle
 
-    Returns battle events (attacks, enemy defeats, etc.) in chronological order
+    Returns the last N battle events (attacks, enemy defeats, etc.) in
+    chronological order. Pass next_cursor back as cursor to get the events
+    before them; it is null once the start of the log is reached.
     """
     # Verify battle exists
     battle = db.query(Battle).filter(Battle.id == battle_id).first()
@@ -649,21 +791,21 @@ async def get_battle_logs(
         )
 
     try:
-        # Fetch battle logs from database
-        logs = db.query(BattleLog).filter(
-            BattleLog.battle_id == battle_id
-        ).order_by(
-            BattleLog.created_at.desc()
-        ).limit(min(limit, 500)).offset(offset).all()
-
-        # Convert to dictionary format (reverse to get chronological order)
-        result = [log.to_dict() for log in reversed(logs)]
-
-        return {"battle_id": battle_id, "logs": result, "count": len(result)}
-
+        # Fetch one page of battle logs from database (newest first)
+        logs, next_cursor = keyset_page(
+            db.query(BattleLog).filter(BattleLog.battle_id == battle_id),
+            BattleLog, max(1, min(limit, 500)), cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error("failed_to_fetch_battle_logs", battle_id=battle_id, error=str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to fetch battle logs"
         )
+
+    # Convert to dictionary format (reverse to get chronological order)
+    result = [log.to_dict() for log in reversed(logs)]
+
+    return {"battle_id": battle_id, "logs": result, "count": len(result), "next_cursor": next_cursor}
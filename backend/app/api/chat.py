@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from app.db.database import get_db
+from app.db.pagination import keyset_page
 from app.models.user import User
 from app.models.chat_message import ChatMessage
 from app.core.security import get_current_active_user
@@ -20,47 +21,60 @@ class ChatMessageResponse(BaseModel):
     username: str
     text: str
     type: str
+    channel: str
     timestamp: str
 
     class Config:
         from_attributes = True
 
 
-@router.get("/history", response_model=List[ChatMessageResponse])
+class ChatHistoryResponse(BaseModel):
+    """A page of chat history and the cursor of the next (older) page"""
+    messages: List[ChatMessageResponse]
+    next_cursor: Optional[str] = None
+
+
+@router.get("/history", response_model=ChatHistoryResponse)
 async def get_chat_history(
     limit: int = Query(100, ge=1, le=500),
-    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    channel: str = Query("tavern:1", pattern=r"^tavern:[1-9][0-9]*$", description="Tavern room channel"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """
-    Get chat message history
+    Get chat message history of a tavern room
 
-    Returns last N messages in chronological order (oldest to newest)
+    Returns the last N messages in chronological order (oldest to newest).
+    Pass next_cursor back as cursor to get the N messages before them;
+    it is null once the start of the history is reached.
     """
     try:
-        # Fetch messages from database
-        messages = db.query(ChatMessage).order_by(
-            ChatMessage.created_at.desc()
-        ).limit(limit).offset(offset).all()
-
-        # Convert to response format (reverse to get chronological order)
-        result = []
-        for msg in reversed(messages):
-            result.append(ChatMessageResponse(
-                id=msg.id,
-                userId=msg.user_id,
-                username=msg.username,
-                text=msg.text,
-                type=msg.message_type,
-                timestamp=msg.created_at.isoformat()
-            ))
-
-        return result
-
+        # Fetch one page from database (newest first)
+        messages, next_cursor = keyset_page(
+            db.query(ChatMessage).filter(ChatMessage.channel == channel),
+            ChatMessage, limit, cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error("failed_to_fetch_chat_history", error=str(e))
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to fetch chat history"
         )
+
+    # Convert to response format (reverse to get chronological order)
+    result = []
+    for msg in reversed(messages):
+        result.append(ChatMessageResponse(
+            id=msg.id,
+            userId=msg.user_id,
+            username=msg.username,
+            text=msg.text,
+            type=msg.message_type,
+            channel=msg.channel,
+            timestamp=msg.created_at.isoformat()
+        ))
+
+    return ChatHistoryResponse(messages=result, next_cursor=next_cursor)
@@ -10,6 +10,7 @@ from app.db.database import get_db
 from app.models.user import User
 from app.models.player import Player
 from app.core.security import get_current_active_user
+from app.services import currency_service
 
 router = APIRouter()
 
@@ -51,10 +52,10 @@ async def update_player_stats(
         player.base_hp = player.base_hp + updates.base_hp
 
     if updates.gold is not None:
-        player.gold = player.gold + updates.gold
+        currency_service.adjust(db, player, updates.gold, "debug_adjust")
 
     if updates.gems is not None:
-        player.gems = player.gems + updates.gems
+        currency_service.adjust(db, player, updates.gems, "debug_adjust", currency_service.GEMS)
 
     if updates.stamina is not None:
         player.stamina = min(player.stamina + updates.stamina, player.stamina_max)
@@ -10,7 +10,9 @@ from app.db.database import get_db
 from app.models.user import User
 from app.models.player import Player
 from app.core.security import get_current_active_user
+from app.services import currency_service
 from app.services.progression_service import ProgressionService
+from app.services.loadout_service import invalidate_combat_profile
 import structlog
 
 router = APIRouter()
@@ -33,7 +35,7 @@ async def add_gold(
     if not player:
         raise HTTPException(status_code=404, detail="Player not found")
 
-    player.gold += req.amount
+    currency_service.adjust(db, player, req.amount, "dev_grant")
     db.commit()
     db.refresh(player)
 
@@ -58,7 +60,7 @@ async def add_gems(
     if not player:
         raise HTTPException(status_code=404, detail="Player not found")
 
-    player.gems += req.amount
+    currency_service.adjust(db, player, req.amount, "dev_grant", currency_service.GEMS)
     db.commit()
     db.refresh(player)
 
@@ -176,6 +178,7 @@ async def set_level(
 
     db.commit()
     db.refresh(player)
+    invalidate_combat_profile(player.id)
 
     logger.info(
         "dev_set_level",
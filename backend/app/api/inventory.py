@@ -1,11 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Query, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from datetime import datetime, timedelta, timezone
 from app.db.database import get_db
 from app.models.user import User
 from app.models.player import Player
-from app.models.inventory import InventoryItem, EquipmentSet, SetType, EquipmentSlot, ItemType
+from app.models.inventory import InventoryItem, EquipmentSet, SetType, EquipmentSlot, ItemType, ItemRarity
 from app.models.buff import ActiveBuff, BuffType
 from app.core.security import get_current_active_user
 from app.schemas.inventory import (
@@ -13,27 +13,67 @@ from app.schemas.inventory import (
     InventoryItemResponse,
     EquipmentSetResponse,
     EquipItemRequest,
+    EquipLoadoutRequest,
     UnequipItemRequest,
     EquipmentStatsResponse,
+    SaveLoadoutPresetRequest,
+    LoadoutPresetResponse,
+    SalvageRequest,
+    SalvageResponse,
+    AutoSalvageRequest,
     UsePotionResponse,
     ActiveBuffResponse
 )
 import structlog
+from app.models.loadout import LoadoutPreset
+from app.services.loadout_service import (
+    invalidate_combat_profile,
+    get_combat_profile,
+    get_loadout_presets,
+    save_loadout_preset,
+    activate_loadout_preset
+)
 from app.services.inventory_service import (
     get_or_create_equipment_set,
     equip_item_to_slot,
+    equip_loadout,
     unequip_item_from_slot,
     calculate_equipment_stats,
     create_item_for_player,
-    give_starter_items
+    give_starter_items,
+    bump_inventory_version,
+    query_inventory_items,
+    salvage_items,
+    INVENTORY_ITEM_FIELDS
 )
 
 router = APIRouter()
 logger = structlog.get_logger()
 
 
-def build_equipment_set_response(equipment_set: EquipmentSet, db: Session) -> EquipmentSetResponse:
-    """Build equipment set response with all equipped items"""
+def inventory_etag(player: Player) -> str:
+    """Weak ETag for everything derived from a player's inventory and equipment"""
+    return f'W/"inv-{player.id}-{player.inventory_version or 0}"'
+
+
+def is_not_modified(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against the current ETag"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def build_equipment_set_response(
+    equipment_set: EquipmentSet,
+    db: Session,
+    items: Optional[dict] = None
+) -> EquipmentSetResponse:
+    """
+    Build equipment set response with all equipped items
+
+    Pass items (ID -> InventoryItem) when they are already loaded to skip the lookup query.
+    """
 
     # Get all equipped items
     item_ids = [
@@ -49,7 +89,11 @@ def build_equipment_set_response(equipment_set: EquipmentSet, db: Session) -> Eq
 
     # Filter None and fetch items
     item_ids = [id for id in item_ids if id is not None]
-    items = {}
+
+    if items is None:
+        items = {}
+    elif all(item_id in items for item_id in item_ids):
+        item_ids = []
 
     if item_ids:
         items_list = db.query(InventoryItem).filter(InventoryItem.id.in_(item_ids)).all()
@@ -71,6 +115,8 @@ def build_equipment_set_response(equipment_set: EquipmentSet, db: Session) -> Eq
 
 @router.get("/", response_model=InventoryResponse)
 async def get_inventory(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -83,8 +129,15 @@ async def get_inventory(
             detail="Player profile not found"
         )
 
+    etag = inventory_etag(player)
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if is_not_modified(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+    response.headers.update(cache_headers)
+
     # Get all inventory items
     items = db.query(InventoryItem).filter(InventoryItem.player_id == player.id).all()
+    items_by_id = {item.id: item for item in items}
 
     # Get or create equipment sets
     attack_set = get_or_create_equipment_set(db, player.id, SetType.ATTACK)
@@ -92,11 +145,83 @@ async def get_inventory(
 
     return InventoryResponse(
         items=items,
-        attack_set=build_equipment_set_response(attack_set, db),
-        defense_set=build_equipment_set_response(defense_set, db)
+        attack_set=build_equipment_set_response(attack_set, db, items_by_id),
+        defense_set=build_equipment_set_response(defense_set, db, items_by_id)
     )
 
 
+@router.get("/items")
+async def list_inventory_items(
+    response: Response,
+    cursor: Optional[int] = Query(None, description="Last item ID of the previous page"),
+    limit: int = Query(100, ge=1, le=500),
+    item_type: Optional[List[ItemType]] = Query(None),
+    rarity: Optional[List[ItemRarity]] = Query(None),
+    equipped: Optional[bool] = Query(None),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
+    format: str = Query("objects", pattern="^(objects|compact)$"),
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Page through the player's items with filters and column projection
+
+    format=compact returns {"fields": [...], "items": [[...], ...]} instead of
+    one object per item, which keeps large inventories small on the wire.
+    Responses carry an ETag tied to the player's inventory version.
+    """
+
+    player = db.query(Player).filter(Player.user_id == current_user.id).first()
+    if not player:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Player profile not found"
+        )
+
+    etag = inventory_etag(player)
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if is_not_modified(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+    response.headers.update(cache_headers)
+
+    # Properties blobs can be large, so they are only sent when asked for
+    requested = [field.strip() for field in fields.split(",") if field.strip()] if fields else [
+        field for field in INVENTORY_ITEM_FIELDS if field != "properties"
+    ]
+
+    try:
+        columns, rows, next_cursor = query_inventory_items(
+            db,
+            player.id,
+            requested,
+            cursor=cursor,
+            limit=limit,
+            item_types=item_type,
+            rarities=rarity,
+            equipped=equipped
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    if format == "compact":
+        return {
+            "fields": columns,
+            "items": [list(row) for row in rows],
+            "next_cursor": next_cursor,
+            "version": player.inventory_version
+        }
+
+    return {
+        "items": [dict(zip(columns, row)) for row in rows],
+        "next_cursor": next_cursor,
+        "version": player.inventory_version
+    }
+
+
 @router.post("/equip")
 async def equip_item(
     request: EquipItemRequest,
@@ -142,6 +267,55 @@ async def equip_item(
         )
 
 
+@router.post("/equip-loadout")
+async def equip_full_loadout(
+    request: EquipLoadoutRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Equip a whole loadout for one or both sets in a single transaction"""
+
+    player = db.query(Player).filter(Player.user_id == current_user.id).first()
+    if not player:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Player profile not found"
+        )
+
+    try:
+        equipment_sets = equip_loadout(db, player, request.sets)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    logger.info(
+        "loadout_equipped",
+        player_id=player.id,
+        sets=[set_type.value for set_type in request.sets],
+        slots=sum(len(slots) for slots in request.sets.values())
+    )
+
+    profile = get_combat_profile(db, player)
+
+    return {
+        "message": "Loadout equipped successfully",
+        "equipment_sets": {
+            set_type.value: build_equipment_set_response(equipment_set, db)
+            for set_type, equipment_set in equipment_sets.items()
+        },
+        "stats": {
+            "attack": profile["attack"],
+            "defense": profile["defense"],
+            "max_hp": profile["max_hp"],
+            "bonus_attack": profile["bonus_attack"],
+            "bonus_defense": profile["bonus_defense"],
+            "bonus_hp": profile["bonus_hp"]
+        }
+    }
+
+
 @router.post("/unequip")
 async def unequip_item(
     request: UnequipItemRequest,
@@ -175,6 +349,187 @@ async def unequip_item(
         )
 
 
+@router.get("/presets", response_model=List[LoadoutPresetResponse])
+async def list_presets(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get the player's saved loadout presets"""
+
+    player = db.query(Player).filter(Player.user_id == current_user.id).first()
+    if not player:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Player profile not found"
+        )
+
+    return get_loadout_presets(db, player.id)
+
+
+@router.post("/presets", response_model=LoadoutPresetResponse)
+async def save_preset(
+    request: SaveLoadoutPresetRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Save the currently equipped gear and pets as a named preset"""
+
+    player = db.query(Player).filter(Player.user_id == current_user.id).first()
+    if not player:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Player profile not found"
+        )
+
+    try:
+        return save_loadout_preset(db, player, request.name.strip())
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
+@router.post("/presets/{preset_id}/activate")
+async def activate_preset(
+    preset_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Switch to a saved preset in one transaction"""
+
+    player = db.query(Player).filter(Player.user_id == current_user.id).first()
+    if not player:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Player profile not found"
+        )
+
+    preset = db.query(LoadoutPreset).filter(
+        LoadoutPreset.id == preset_id,
+        LoadoutPreset.player_id == player.id
+    ).first()
+    if not preset:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Preset not found"
+        )
+
+    try:
+        profile = activate_loadout_preset(db, player, preset)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    logger.info("loadout_preset_activated", player_id=player.id, preset_id=preset.id)
+
+    return {
+        "message": f"Switched to {preset.name}",
+        "preset_id": preset.id,
+        "stats": profile
+    }
+
+
+@router.delete("/presets/{preset_id}")
+async def delete_preset(
+    preset_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Delete a saved preset"""
+
+    player = db.query(Player).filter(Player.user_id == current_user.id).first()
+    if not player:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Player profile not found"
+        )
+
+    deleted = db.query(LoadoutPreset).filter(
+        LoadoutPreset.id == preset_id,
+        LoadoutPreset.player_id == player.id
+    ).delete(synchronize_session=False)
+    db.commit()
+
+    if not deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Preset not found"
+        )
+
+    return {"message": "Preset deleted"}
+
+
+@router.post("/salvage", response_model=SalvageResponse)
+async def salvage(
+    request: SalvageRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Salvage all unequipped equipment matching the filter for gold"""
+
+    player = db.query(Player).filter(Player.user_id == current_user.id).first()
+    if not player:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Player profile not found"
+        )
+
+    older_than = None
+    if request.older_than_hours is not None:
+        older_than = datetime.utcnow() - timedelta(hours=request.older_than_hours)
+
+    try:
+        result = salvage_items(
+            db,
+            player,
+            max_rarity=request.max_rarity,
+            older_than=older_than,
+            item_types=request.item_types
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    logger.info(
+        "items_salvaged",
+        player_id=player.id,
+        max_rarity=request.max_rarity.value,
+        count=result["salvaged"],
+        gold=result["gold"]
+    )
+
+    return result
+
+
+@router.put("/auto-salvage")
+async def set_auto_salvage(
+    request: AutoSalvageRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Set the rarity at or below which loot drops are salvaged on claim"""
+
+    player = db.query(Player).filter(Player.user_id == current_user.id).first()
+    if not player:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Player profile not found"
+        )
+
+    player.auto_salvage_rarity = request.max_rarity
+    db.commit()
+
+    return {
+        "message": "Auto-salvage updated" if request.max_rarity else "Auto-salvage disabled",
+        "max_rarity": request.max_rarity.value if request.max_rarity else None
+    }
+
+
 @router.get("/stats/{set_type}", response_model=EquipmentStatsResponse)
 async def get_equipment_stats(
     set_type: SetType,
@@ -452,8 +807,12 @@ async def use_potion(
     if potion.quantity <= 0:
         db.delete(potion)
 
+    bump_inventory_version(db, player.id)
     db.commit()
 
+    if potion_type == "ATTACK_BOOST":
+        invalidate_combat_profile(player.id)
+
     # Refresh player to get latest data
     if potion.quantity > 0:
         db.refresh(potion)
@@ -16,9 +16,11 @@ from app.schemas.pet import (
     PetStatsResponse,
     HatchPetRequest,
     FeedPetRequest,
+    FeedPetFoodRequest,
     EquipPetRequest,
     UnequipPetRequest,
     FeedResultResponse,
+    FeedFoodResultResponse,
     EquipResultResponse,
     UnequipResultResponse,
 )
@@ -165,6 +167,48 @@ async def feed_pet(
     )
 
 
+@router.post("/feed-food", response_model=FeedFoodResultResponse)
+async def feed_pet_food(
+    request: FeedPetFoodRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Feed a pet any number of units from one pet food stack in a single call"""
+    # Get player
+    player = db.query(Player).filter(Player.user_id == current_user.id).first()
+    if not player:
+        raise HTTPException(status_code=404, detail="Player not found")
+
+    # Get pet
+    pet = pet_service.get_pet_by_id(db, request.pet_id, player.id)
+    if not pet:
+        raise HTTPException(status_code=404, detail="Pet not found")
+
+    # Feed the pet
+    try:
+        result = pet_service.feed_pet_food(db, player, pet, request.item_id, request.quantity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Build message
+    if result["levels_gained"] > 0:
+        message = f"{pet.name} gained {result['levels_gained']} level(s)! Now level {result['new_level']}!"
+    else:
+        message = f"{pet.name} gained {result['xp_gained']} XP!"
+
+    return FeedFoodResultResponse(
+        message=message,
+        levels_gained=result["levels_gained"],
+        new_level=result["new_level"],
+        exp=result["xp"],
+        exp_max=result["xp_max"],
+        stats=PetStatsResponse(**result["stats"]),
+        pet=PetResponse.from_pet(pet),
+        xp_gained=result["xp_gained"],
+        food_remaining=result["food_remaining"]
+    )
+
+
 @router.post("/equip", response_model=EquipResultResponse)
 async def equip_pet(
     request: EquipPetRequest,
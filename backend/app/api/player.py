@@ -15,6 +15,7 @@ from app.schemas.player import (
 from app.core.security import get_current_active_user
 from app.core.config import settings
 from app.services.progression_service import ProgressionService
+from app.services.loadout_service import invalidate_combat_profile
 import structlog
 
 router = APIRouter()
@@ -130,6 +131,7 @@ async def allocate_stats(
     player.updated_at = datetime.now(timezone.utc)
     db.commit()
     db.refresh(player)
+    invalidate_combat_profile(player.id)
 
     return {
         "message": "Stats allocated successfully",
@@ -254,6 +256,7 @@ async def debug_set_level(
 
     db.commit()
     db.refresh(player)
+    invalidate_combat_profile(player.id)
 
     logger.info("debug_level_set", player_id=player.id, new_level=level)
 
@@ -13,8 +13,10 @@ from app.models.player import Player
 from app.models.pvp import Duel, DuelStatus, PvPStats
 from app.models.user import User
 from app.core.security import get_current_user
+from app.services import currency_service
 from app.services.websocket_manager import manager
 from app.services.pvp_battle_manager import pvp_battle_manager
+from app.services.loadout_service import get_combat_profiles, duel_player_data
 
 
 router = APIRouter(prefix="/pvp", tags=["pvp"])
@@ -102,14 +104,15 @@ async def get_online_players(
 
     # Get their player data
     players = [u.player for u in online_users if u.player is not None]
+    profiles = get_combat_profiles(db, players)
 
     return [
         OnlinePlayerInfo(
             id=p.id,
             username=p.username,
             level=p.level,
-            attack=p.calculate_total_attack(),
-            defense=p.calculate_total_defense()
+            attack=profiles[p.id]["attack"],
+            defense=profiles[p.id]["defense"]
         )
         for p in players
     ]
@@ -283,13 +286,16 @@ async def respond_to_challenge(
         duel.status = DuelStatus.DECLINED
         db.commit()
 
-        # Penalty for declining: 10% of stake
+        # Penalty for declining: 10% of stake, only taken if the defender can cover it
         penalty = int(duel.gold_stake * 0.1)
-        if player.gold >= penalty:
-            player.gold -= penalty
-            challenger = duel.challenger
-            challenger.gold += penalty
-            db.commit()
+        challenger = duel.challenger
+        if penalty > 0:
+            try:
+                currency_service.debit(db, player, penalty, "duel_decline_penalty", reference=f"duel_{duel.id}")
+                currency_service.credit(db, challenger, penalty, "duel_decline_penalty", reference=f"duel_{duel.id}")
+                db.commit()
+            except currency_service.InsufficientFunds:
+                db.rollback()
 
         # Send real-time notification to challenger
         await manager.notify_challenge_response(
@@ -462,23 +468,9 @@ async def start_duel_battle(
     challenger = duel.challenger
     defender = duel.defender
 
-    challenger_data = {
-        'id': challenger.id,
-        'username': challenger.username,
-        'level': challenger.level,
-        'attack': challenger.calculate_total_attack(),
-        'defense': challenger.calculate_total_defense(),
-        'max_hp': challenger.base_hp + (challenger.level * 10)
-    }
-
-    defender_data = {
-        'id': defender.id,
-        'username': defender.username,
-        'level': defender.level,
-        'attack': defender.calculate_total_attack(),
-        'defense': defender.calculate_total_defense(),
-        'max_hp': defender.base_hp + (defender.level * 10)
-    }
+    profiles = get_combat_profiles(db, [challenger, defender])
+    challenger_data = duel_player_data(challenger, profiles[challenger.id])
+    defender_data = duel_player_data(defender, profiles[defender.id])
 
     # Create battle
     battle = await pvp_battle_manager.create_battle(
@@ -535,13 +527,6 @@ async def complete_duel(
             detail="Duel not found"
         )
 
-    # Verify duel is in progress or accepted
-    if duel.status not in [DuelStatus.IN_PROGRESS, DuelStatus.ACCEPTED]:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Duel cannot be completed (current status: {duel.status})"
-        )
-
     # Verify winner is a participant
     if winner_id not in [duel.challenger_id, duel.defender_id]:
         raise HTTPException(
@@ -549,21 +534,34 @@ async def complete_duel(
             detail="Winner must be a duel participant"
         )
 
-    # Update duel
-    duel.status = DuelStatus.COMPLETED
-    duel.winner_id = winner_id
-    duel.completed_at = datetime.utcnow()
+    # Claim the completion atomically so concurrent calls cannot pay out twice
+    claimed = db.query(Duel).filter(
+        Duel.id == duel_id,
+        Duel.status.in_([DuelStatus.IN_PROGRESS, DuelStatus.ACCEPTED])
+    ).update({
+        Duel.status: DuelStatus.COMPLETED,
+        Duel.winner_id: winner_id,
+        Duel.completed_at: datetime.utcnow()
+    }, synchronize_session=False)
+    if not claimed:
+        db.rollback()
+        db.refresh(duel)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Duel cannot be completed (current status: {duel.status})"
+        )
 
     # Distribute gold
     loser_id = duel.defender_id if winner_id == duel.challenger_id else duel.challenger_id
     winner = db.query(Player).filter(Player.id == winner_id).first()
     loser = db.query(Player).filter(Player.id == loser_id).first()
+    reference = f"duel_{duel.id}"
 
-    # Deduct from loser
-    loser.gold -= duel.gold_stake
+    # Deduct from loser (the stake was checked on accept, so this may dip below zero)
+    currency_service.debit(db, loser, duel.gold_stake, "duel_loss", reference=reference, require_funds=False)
 
     # Award to winner (both stakes)
-    winner.gold += (duel.gold_stake * 2)
+    currency_service.credit(db, winner, duel.gold_stake * 2, "duel_win", reference=reference)
 
     # Update PVP stats
     winner_stats = db.query(PvPStats).filter(PvPStats.player_id == winner_id).first()
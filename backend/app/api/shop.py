@@ -9,6 +9,8 @@ from app.schemas.shop import (
     ShopCatalogResponse,
     PurchaseRequest,
     PurchaseResponse,
+    CartPurchaseRequest,
+    CartPurchaseResponse,
     PurchaseHistoryItem
 )
 import structlog
@@ -91,6 +93,56 @@ async def purchase_item(
     )
 
 
+@router.post("/purchase/cart", response_model=CartPurchaseResponse)
+async def purchase_cart(
+    cart_req: CartPurchaseRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Purchase several items (with quantities) in one checkout
+
+    The total is validated once against the player's balance and everything
+    is applied in a single transaction; either the whole cart is bought or
+    nothing is.
+    """
+    # Get player
+    player = db.query(Player).filter(Player.user_id == current_user.id).first()
+    if not player:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Player not found"
+        )
+
+    # Merge repeated lines for the same item
+    cart = {}
+    for line in cart_req.items:
+        cart[line.item_id] = cart.get(line.item_id, 0) + line.quantity
+
+    success, message, result = ShopService.purchase_cart(
+        db=db,
+        player=player,
+        cart=cart,
+        use_gems=cart_req.use_gems
+    )
+
+    if not success:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=message
+        )
+
+    return CartPurchaseResponse(
+        success=True,
+        message=message,
+        lines=result["lines"],
+        cost_gold=result["cost_gold"],
+        cost_gems=result["cost_gems"],
+        gold_remaining=player.gold,
+        gems_remaining=player.gems
+    )
+
+
 @router.get("/history", response_model=list[PurchaseHistoryItem])
 async def get_purchase_history(
     limit: int = 50,
@@ -1,27 +1,47 @@
 """
 WebSocket API Endpoints for Real-Time PVP Communication
 """
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
+from typing import Optional
+import json
 import logging
 
-from app.db.database import get_db
+from app.db import ws_guard
+from app.db.database import session_scope
 from app.core.security import decode_access_token
 from app.models.user import User
-from app.models.pvp import Duel
+from app.models.pvp import Duel, DuelStatus
 from app.services.websocket_manager import manager
-from app.services.pvp_battle_manager import pvp_battle_manager, ActionType
+from app.services.chat_writer import chat_writer
+from app.websocket.chat_ws import chat_manager
+from app.services.pvp_battle_manager import pvp_battle_manager, ActionType, BattleState
+from app.services import rate_limiter, ws_codec
+from app.websocket import compression
+from app.websocket.registry import Connection, registry
+from app.services.rate_limiter import pvp_limiter, pvp_battle_limiter, message_too_large
+from app.services.loadout_service import get_combat_profiles, duel_player_data
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+def _user_id_from_token(token: str) -> Optional[int]:
+    """User ID in a JWT, or None if the token is invalid"""
+    payload = decode_access_token(token)
+    if not payload:
+        return None
+    user_id_str = payload.get("sub") or payload.get("user_id")
+    try:
+        return int(user_id_str)
+    except (ValueError, TypeError):
+        return None
+
+
 @router.websocket("/ws/pvp")
 async def websocket_pvp_endpoint(
     websocket: WebSocket,
-    token: str = Query(...),
-    db: Session = Depends(get_db)
+    token: str = Query(...)
 ):
     """
     WebSocket endpoint for real-time PVP events
@@ -33,49 +53,34 @@ async def websocket_pvp_endpoint(
     - Duel status updates
     - Online/offline status changes
     """
-    user_id = None
+    connection = None
 
     try:
         # Authenticate user from token
-        payload = decode_access_token(token)
-        if not payload:
+        user_id = _user_id_from_token(token)
+        if user_id is None:
             await websocket.close(code=4001, reason="Invalid token")
             return
 
-        user_id_str = payload.get("sub")
-        if not user_id_str:
-            user_id_str = payload.get("user_id")
-        if not user_id_str:
-            await websocket.close(code=4001, reason="Invalid token payload")
-            return
-
-        # Convert user_id to integer
-        try:
-            user_id = int(user_id_str)
-        except (ValueError, TypeError):
-            await websocket.close(code=4001, reason="Invalid user ID in token")
-            return
-
-        # Get user and player info
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user or not user.player:
+        # Get user and player info (the session is closed before the socket starts listening)
+        with session_scope() as db:
+            user = db.query(User).filter(User.id == user_id).first()
+            player = user.player if user else None
+            player_id, username = (player.id, player.username) if player else (None, None)
+        if not player_id:
             await websocket.close(code=4003, reason="User or player not found")
             return
 
-        # Connect to WebSocket manager
-        await manager.connect(
-            websocket=websocket,
-            user_id=user.id,
-            player_id=user.player.id,
-            username=user.player.username
-        )
+        # Connect to the PVP lobby
+        connection = await registry.accept(websocket, user_id, username, player_id)
+        await manager.join(connection)
 
         # Send connection confirmation
-        await websocket.send_json({
+        await registry.send(connection, {
             "type": "connected",
             "message": "Connected to PVP Arena",
-            "player_id": user.player.id,
-            "username": user.player.username
+            "player_id": player_id,
+            "username": username
         })
 
         # Keep connection alive and listen for messages
@@ -83,10 +88,16 @@ async def websocket_pvp_endpoint(
             try:
                 # Receive messages from client (for heartbeat/ping)
                 data = await websocket.receive_text()
+                registry.touch(connection)
+                if message_too_large(data):
+                    pvp_limiter.record_drop(user_id)
+                    continue
+                if not pvp_limiter.allow(user_id):
+                    continue
 
                 # Handle ping/pong for keepalive
                 if data == "ping":
-                    await websocket.send_json({"type": "pong"})
+                    await registry.send(connection, {"type": "pong"})
 
             except WebSocketDisconnect:
                 logger.info(f"WebSocket disconnected for user {user_id}")
@@ -96,21 +107,123 @@ async def websocket_pvp_endpoint(
                 break
 
     except WebSocketDisconnect:
-        logger.info(f"WebSocket disconnected during setup for user {user_id}")
+        logger.info(f"WebSocket disconnected during setup for user {connection.user_id if connection else None}")
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
     finally:
         # Clean up connection
-        if user_id:
-            await manager.disconnect(user_id)
+        if connection is not None:
+            manager.leave(connection)
+            registry.remove(connection)
+
+
+async def load_battle(battle_id: str) -> Optional[BattleState]:
+    """A live PVP battle: in memory, restored from its snapshot or recreated from its duel"""
+    # Get battle
+    battle = await pvp_battle_manager.get_battle(battle_id)
+
+    # If battle doesn't exist in memory, restore it from its last snapshot
+    if not battle:
+        battle = await pvp_battle_manager.restore_battle(battle_id)
+    if battle:
+        return battle
+
+    # No snapshot either - recreate a fresh battle from database
+    logger.info(f"Battle {battle_id} not in memory, recreating from database")
+
+    # Find duel by battle_id; settled duels stay settled
+    with session_scope() as db:
+        duel = db.query(Duel).filter(Duel.battle_id == battle_id).first()
+        if not duel or duel.status not in (DuelStatus.ACCEPTED, DuelStatus.IN_PROGRESS):
+            return None
+
+        # Get player data
+        challenger = duel.challenger
+        defender = duel.defender
+
+        profiles = get_combat_profiles(db, [challenger, defender])
+        challenger_data = duel_player_data(challenger, profiles[challenger.id])
+        defender_data = duel_player_data(defender, profiles[defender.id])
+        duel_id, challenger_id, defender_id, gold_stake = (
+            duel.id, challenger.id, defender.id, duel.gold_stake
+        )
+
+    # Recreate battle in memory under its existing battle_id
+    battle = await pvp_battle_manager.create_battle(
+        duel_id=duel_id,
+        player1_id=challenger_id,
+        player2_id=defender_id,
+        player1_data=challenger_data,
+        player2_data=defender_data,
+        gold_stake=gold_stake,
+        battle_id=battle_id
+    )
+
+    logger.info(f"Recreated battle {battle_id} for duel {duel_id}")
+    return battle
+
+
+async def enter_pvp_battle(connection: Connection, battle: BattleState):
+    """Subscribe a participant's connection to a battle and send them its current state"""
+    await pvp_battle_manager.register_connection(battle.battle_id, connection)
+    logger.info(f"Player {connection.player_id} connected to battle {battle.battle_id}")
+
+    # Send current battle state
+    await registry.send(connection, {
+        "type": "battle_state",
+        "phase": battle.phase.value,
+        "turn": battle.current_turn,
+        "your_id": connection.player_id,
+        "opponent_id": battle.get_opponent_id(connection.player_id)
+    })
+
+
+async def handle_pvp_battle_message(connection: Connection, battle_id: str, message: dict) -> bool:
+    """Handle one (already rate limited) message from a battle participant; False once they have forfeited"""
+    player_id = connection.player_id
+    message_type = message.get("type")
+
+    if message_type == "ready":
+        # Player is ready to fight
+        await pvp_battle_manager.mark_player_ready(battle_id, player_id)
+
+    elif message_type == "action":
+        # Submit combat action
+        action_str = message.get("action")
+        try:
+            action = ActionType(action_str)
+            await pvp_battle_manager.submit_action(battle_id, player_id, action)
+        except ValueError:
+            await registry.send(connection, {
+                "type": "error",
+                "message": f"Invalid action: {action_str}"
+            })
+
+    elif message_type == "forfeit":
+        # Player forfeits
+        await pvp_battle_manager.forfeit_battle(battle_id, player_id)
+        return False
+
+    elif message_type == "history":
+        # Turn log is kept compact in memory and only serialized on request
+        battle = await pvp_battle_manager.get_battle(battle_id)
+        await registry.send(connection, {
+            "type": "battle_history",
+            "battle_id": battle_id,
+            "turns": battle.battle_log if battle else []
+        })
+
+    elif message_type == "ping":
+        await registry.send(connection, {"type": "pong"})
+
+    return True
 
 
 @router.websocket("/ws/pvp-battle/{battle_id}")
 async def websocket_pvp_battle(
     websocket: WebSocket,
     battle_id: str,
-    token: str = Query(...),
-    db: Session = Depends(get_db)
+    token: str = Query(...)
 ):
     """
     WebSocket endpoint for real-time PVP battles
@@ -121,144 +234,60 @@ async def websocket_pvp_battle(
     - Turn resolution
     - Live damage updates
     """
-    user_id = None
+    connection = None
 
     try:
         # Authenticate user
-        payload = decode_access_token(token)
-        if not payload:
+        user_id = _user_id_from_token(token)
+        if user_id is None:
             await websocket.close(code=4001, reason="Invalid token")
             return
 
-        user_id_str = payload.get("sub")
-        if not user_id_str:
-            user_id_str = payload.get("user_id")
-        if not user_id_str:
-            await websocket.close(code=4001, reason="Invalid token payload")
-            return
-
-        # Convert user_id to integer
-        try:
-            user_id = int(user_id_str)
-        except (ValueError, TypeError):
-            await websocket.close(code=4001, reason="Invalid user ID in token")
-            return
-
         # Get user and player
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user or not user.player:
+        with session_scope() as db:
+            user = db.query(User).filter(User.id == user_id).first()
+            player = user.player if user else None
+            player_id, username = (player.id, player.username) if player else (None, None)
+        if not player_id:
             await websocket.close(code=4003, reason="User or player not found")
             return
 
-        player_id = user.player.id
-
-        # Get battle
-        battle = await pvp_battle_manager.get_battle(battle_id)
-
-        # If battle doesn't exist in memory, recreate it from database
+        battle = await load_battle(battle_id)
         if not battle:
-            logger.info(f"Battle {battle_id} not in memory, recreating from database")
-
-            # Find duel by battle_id
-            duel = db.query(Duel).filter(Duel.battle_id == battle_id).first()
-            if not duel:
-                await websocket.close(code=4004, reason="Battle not found in database")
-                return
-
-            # Get player data
-            challenger = duel.challenger
-            defender = duel.defender
-
-            challenger_data = {
-                'id': challenger.id,
-                'username': challenger.username,
-                'level': challenger.level,
-                'attack': challenger.calculate_total_attack(),
-                'defense': challenger.calculate_total_defense(),
-                'max_hp': challenger.base_hp + (challenger.level * 10)
-            }
-
-            defender_data = {
-                'id': defender.id,
-                'username': defender.username,
-                'level': defender.level,
-                'attack': defender.calculate_total_attack(),
-                'defense': defender.calculate_total_defense(),
-                'max_hp': defender.base_hp + (defender.level * 10)
-            }
-
-            # Recreate battle in memory
-            from app.services.pvp_battle_manager import BattleState
-            battle = BattleState(
-                duel_id=duel.id,
-                player1_id=challenger.id,
-                player2_id=defender.id,
-                player1_data=challenger_data,
-                player2_data=defender_data,
-                gold_stake=duel.gold_stake
-            )
-            battle.battle_id = battle_id  # Use existing battle_id
-
-            # Store in battle manager
-            pvp_battle_manager.active_battles[battle_id] = battle
-            pvp_battle_manager.player_battles[challenger.id] = battle_id
-            pvp_battle_manager.player_battles[defender.id] = battle_id
-
-            logger.info(f"Recreated battle {battle_id} for duel {duel.id}")
+            await websocket.close(code=4004, reason="Battle not found in database")
+            return
 
         # Verify player is in battle
         if not battle.is_player_in_battle(player_id):
             await websocket.close(code=4005, reason="Not a participant")
             return
 
-        await websocket.accept()
-        logger.info(f"Player {player_id} connected to battle {battle_id}")
-
-        # Register WebSocket connection
-        await pvp_battle_manager.register_connection(battle_id, player_id, websocket)
-
-        # Send current battle state
-        await websocket.send_json({
-            "type": "battle_state",
-            "phase": battle.phase.value,
-            "turn": battle.current_turn,
-            "your_id": player_id,
-            "opponent_id": battle.get_opponent_id(player_id)
-        })
+        connection = await registry.accept(websocket, user_id, username, player_id)
+        await enter_pvp_battle(connection, battle)
 
         # Listen for messages
         while True:
             try:
                 data = await websocket.receive_text()
-                import json
-                message = json.loads(data)
-
-                message_type = message.get("type")
-
-                if message_type == "ready":
-                    # Player is ready to fight
-                    await pvp_battle_manager.mark_player_ready(battle_id, player_id)
-
-                elif message_type == "action":
-                    # Submit combat action
-                    action_str = message.get("action")
-                    try:
-                        action = ActionType(action_str)
-                        await pvp_battle_manager.submit_action(battle_id, player_id, action)
-                    except ValueError:
-                        await websocket.send_json({
+                registry.touch(connection)
+
+                # Flood control before parsing; the sender is told once per run of drops
+                if message_too_large(data):
+                    pvp_battle_limiter.record_drop(player_id)
+                    continue
+                if not pvp_battle_limiter.allow(player_id):
+                    if not connection.throttled:
+                        connection.throttled = True
+                        await registry.send(connection, {
                             "type": "error",
-                            "message": f"Invalid action: {action_str}"
+                            "message": "Too many messages, slow down"
                         })
+                    continue
+                connection.throttled = False
 
-                elif message_type == "forfeit":
-                    # Player forfeits
-                    await pvp_battle_manager.forfeit_battle(battle_id, player_id)
+                if not await handle_pvp_battle_message(connection, battle_id, json.loads(data)):
                     break
 
-                elif message_type == "ping":
-                    await websocket.send_json({"type": "pong"})
-
             except WebSocketDisconnect:
                 logger.info(f"Player {player_id} disconnected from battle {battle_id}")
                 break
@@ -272,9 +301,10 @@ async def websocket_pvp_battle(
         logger.error(f"WebSocket battle error: {e}")
     finally:
         # Unregister WebSocket connection
-        if 'player_id' in locals() and 'battle_id' in locals():
-            await pvp_battle_manager.unregister_connection(battle_id, player_id)
-        logger.info(f"Battle WebSocket closed for player {player_id if 'player_id' in locals() else 'unknown'}")
+        if connection is not None:
+            await pvp_battle_manager.unregister_connection(battle_id, connection)
+            registry.remove(connection)
+        logger.info(f"Battle WebSocket closed for player {connection.player_id if connection else 'unknown'}")
 
 
 @router.get("/ws/status")
@@ -282,5 +312,16 @@ async def websocket_status():
     """Get WebSocket server status"""
     return {
         "online_users": manager.get_online_count(),
+        "pvp_battles": pvp_battle_manager.get_metrics(),
+        "db_guard_violations": ws_guard.violations,
+        "rate_limits": rate_limiter.get_metrics(),
+        "chat_writer": chat_writer.get_metrics(),
+        "encoding": ws_codec.get_metrics(),
+        "compression": compression.get_metrics(),
+        "connections": registry.get_metrics(),
+        "presence": {
+            "chat": chat_manager.presence.get_metrics(),
+            "pvp": manager.presence.get_metrics()
+        },
         "status": "operational"
     }
@@ -29,6 +29,32 @@ class Settings(BaseSettings):
     STAMINA_REGEN_INTERVAL: int = 10  # seconds
     STAMINA_REGEN_PERCENT: float = 0.1  # 10%
     AUTO_SAVE_INTERVAL: int = 30  # seconds
+    LOADOUT_CACHE_TTL: int = 30  # seconds a resolved combat profile is reused
+    PVP_SNAPSHOT_FLUSH_INTERVAL: float = 1.0  # seconds between background PVP battle snapshot writes
+    PVP_TURN_TIMEOUT: int = 30  # seconds before a missing action defaults to defend
+    PVP_READY_TIMEOUT: int = 120  # seconds for both players to ready up before the battle is cancelled
+    PVP_ABANDON_TIMEOUT: int = 60  # seconds a battle may have no connected players before it is cancelled
+    PVP_DUEL_EXPIRY_SWEEP_INTERVAL: int = 60  # seconds between bulk expiry of pending challenges
+    CHAT_ROOM_SOFT_CAP: int = 200  # players per tavern room before new joiners are placed in the next room
+    CHAT_RATE_LIMIT: float = 1.0  # chat messages per second a user's bucket refills
+    CHAT_RATE_BURST: int = 5  # chat messages a user may send back to back
+    CHAT_MAX_MESSAGE_LENGTH: int = 500  # characters per chat message
+    CHAT_FLUSH_INTERVAL: float = 0.5  # seconds between batched chat message writes
+    WS_RATE_LIMIT: float = 10.0  # battle/PVP socket messages per second
+    WS_RATE_BURST: int = 20
+    WS_MAX_FRAME_BYTES: int = 4096  # largest text frame accepted from a client
+    WS_PER_MESSAGE_DEFLATE: bool = True  # negotiate permessage-deflate (with app.workers.GameUvicornWorker)
+    WS_COMPRESS_THRESHOLD: int = 1024  # outgoing messages smaller than this many bytes are sent uncompressed
+    WS_COMPRESS_LEVEL: int = 6  # zlib level 1 (fastest) - 9 (smallest)
+    WS_PING_INTERVAL: float = 25.0  # seconds a socket may be silent before the server pings it
+    WS_IDLE_TIMEOUT: float = 60.0  # seconds without any client message before a socket is closed
+    CHAT_RETENTION_DAYS: int = 90  # chat_messages partitions entirely older than this are dropped
+    BATTLE_LOG_RETENTION_DAYS: int = 30  # same for battle_logs
+    LOG_PARTITIONS_AHEAD: int = 2  # monthly partitions created in advance
+    LOG_ARCHIVE_DIR: str = ""  # if set, partitions are saved here as .csv.gz before they are dropped
+    LOG_RETENTION_INTERVAL: float = 21600  # seconds between partition maintenance runs
+    PRESENCE_INTERVAL: float = 1.0  # seconds join/leave changes are collected before one presence_delta per channel
+    WEBSOCKET_DB_GUARD: bool = True  # warn when a WebSocket handler holds a DB connection across receive
 
     @property
     def cors_origins_list(self) -> List[str]:
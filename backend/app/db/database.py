@@ -1,6 +1,8 @@
+from contextlib import contextmanager
+from typing import Iterator
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from app.core.config import settings
 
 engine = create_engine(
@@ -23,3 +25,21 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """
+    Short-lived session for one unit of work outside a request
+
+    WebSocket endpoints must not use Depends(get_db): that session (and its
+    pooled connection) would live as long as the socket. Open one of these
+    around each piece of work instead, so the connection goes back to the
+    pool before the next receive. Commit explicitly; anything uncommitted is
+    rolled back on exit.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,51 @@
+"""
+Keyset (cursor) pagination for append-only log tables
+
+Pages are read newest first on (created_at, id). A cursor is the position of
+the last row of a page, and the next page continues strictly below it with a
+row-value comparison that the (…, created_at, id) composite indexes answer
+directly, so every page costs the same no matter how deep it is (unlike
+OFFSET, which scans and throws away all the rows it skips).
+"""
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Opaque cursor for the position (created_at, id)"""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Position encoded in a cursor; ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, _, row_id = raw.partition("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def keyset_page(query: Query, model, limit: int, cursor: Optional[str] = None) -> Tuple[List, Optional[str]]:
+    """
+    One page of query's rows, newest first, and the cursor of the next (older) page
+
+    model must have created_at and id columns. next_cursor is None when there
+    are no older rows.
+    """
+    if cursor:
+        query = query.filter(tuple_(model.created_at, model.id) < decode_cursor(cursor))
+
+    # One extra row tells whether another page exists without a COUNT
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
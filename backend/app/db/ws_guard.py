@@ -0,0 +1,90 @@
+"""
+Guard against WebSocket handlers holding pooled DB connections while idle
+
+Each pool checkout made from inside an asyncio task is counted against that
+task. WebSocketDBGuardMiddleware wraps the ASGI receive callable of every
+WebSocket connection and logs a warning whenever the handler's task waits for
+the next client message while still holding a connection, which is what
+Depends(get_db) on a WebSocket route does for the socket's whole lifetime.
+"""
+import asyncio
+import weakref
+from typing import Optional
+
+import structlog
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = structlog.get_logger()
+
+_TASK_KEY = "ws_guard_task"
+
+# Pooled connections currently checked out per asyncio task
+_held: "weakref.WeakKeyDictionary[asyncio.Task, int]" = weakref.WeakKeyDictionary()
+
+# Warnings raised since startup, exposed on /ws/status
+violations = 0
+
+
+def _current_task() -> Optional[asyncio.Task]:
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        # Worker threads (asyncio.to_thread) have no running loop
+        return None
+
+
+def held_connections(task: Optional[asyncio.Task] = None) -> int:
+    """Number of pooled connections the given (default: current) task has checked out"""
+    task = task or _current_task()
+    return _held.get(task, 0) if task else 0
+
+
+def install(engine: Engine):
+    """Start tracking pool checkouts of engine per asyncio task"""
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        task = _current_task()
+        connection_record.info[_TASK_KEY] = weakref.ref(task) if task else None
+        if task:
+            _held[task] = _held.get(task, 0) + 1
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        ref = connection_record.info.pop(_TASK_KEY, None)
+        task = ref() if ref else None
+        if task is not None and task in _held:
+            remaining = _held[task] - 1
+            if remaining > 0:
+                _held[task] = remaining
+            else:
+                del _held[task]
+
+
+class WebSocketDBGuardMiddleware:
+    """Pure ASGI middleware flagging WebSocket handlers that hold a DB connection across receive"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "websocket":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope.get("path")
+
+        async def guarded_receive():
+            global violations
+            held = held_connections()
+            if held:
+                violations += 1
+                logger.warning(
+                    "websocket_db_connection_held_across_receive",
+                    path=path,
+                    connections=held
+                )
+            return await receive()
+
+        await self.app(scope, guarded_receive, send)
@@ -2,6 +2,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
 from app.db.database import engine
+from app.db import ws_guard
 from app.models import base
 import structlog
 
@@ -37,14 +38,58 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Flag WebSocket handlers that keep a pooled DB connection while waiting for messages
+if settings.WEBSOCKET_DB_GUARD:
+    ws_guard.install(engine)
+    app.add_middleware(ws_guard.WebSocketDBGuardMiddleware)
+
 
 @app.on_event("startup")
 async def startup_event():
     logger.info("application_startup", environment=settings.ENVIRONMENT)
 
+    # PVP battle snapshot writer and timers (battles are restored from snapshots on reconnect)
+    from app.services.pvp_battle_manager import pvp_battle_manager
+    await pvp_battle_manager.start()
+
+    # Background writer for batched chat persistence
+    from app.services.chat_writer import chat_writer
+    await chat_writer.start()
+
+    # Debounced presence_delta broadcasts for chat and the PVP lobby
+    from app.websocket.chat_ws import chat_manager
+    from app.services.websocket_manager import manager
+    await chat_manager.presence.start()
+    await manager.presence.start()
+
+    # Monthly log partitions: create ahead, drop expired
+    from app.services.log_retention import log_retention
+    await log_retention.start()
+
+    # Pings quiet sockets and closes idle ones across every WebSocket endpoint
+    from app.websocket.registry import registry
+    await registry.start()
+
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    from app.services.pvp_battle_manager import pvp_battle_manager
+    await pvp_battle_manager.stop()
+
+    from app.services.log_retention import log_retention
+    await log_retention.stop()
+
+    from app.websocket.registry import registry
+    await registry.stop()
+
+    from app.websocket.chat_ws import chat_manager
+    from app.services.websocket_manager import manager
+    await chat_manager.presence.stop()
+    await manager.presence.stop()
+
+    from app.services.chat_writer import chat_writer
+    await chat_writer.stop()
+
     logger.info("application_shutdown")
 
 
@@ -81,7 +126,8 @@ app.include_router(debug.router, prefix="/api", tags=["Debug"])
 app.include_router(dev.router, prefix="/api/dev", tags=["Development"])
 
 # Include WebSocket
-from app.websocket import battle_ws, chat_ws
+from app.websocket import battle_ws, chat_ws, game_ws
 app.include_router(battle_ws.router)
 app.include_router(chat_ws.router)
+app.include_router(game_ws.router)
 app.include_router(pvp_websocket.router, prefix="/api", tags=["WebSocket"])
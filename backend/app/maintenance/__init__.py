@@ -0,0 +1,20 @@
+"""
+Batch maintenance jobs
+
+Data fixes that must run against the live database are written as
+registered jobs and run in small keyset-paginated chunks of set-based SQL:
+
+    python -m app.maintenance list
+    python -m app.maintenance run player_xp --dry-run
+    python -m app.maintenance run stamina_max --chunk-size 5000 --pause 0.2
+"""
+from app.maintenance.base import JOBS, MaintenanceJob, get_job, register, run_job
+from app.maintenance import jobs  # noqa: F401 - registers the built-in jobs
+
+__all__ = [
+    "JOBS",
+    "MaintenanceJob",
+    "get_job",
+    "register",
+    "run_job",
+]
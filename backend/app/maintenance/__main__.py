@@ -0,0 +1,122 @@
+"""
+Maintenance job CLI
+
+Usage:
+    python -m app.maintenance list
+    python -m app.maintenance run <job> [--dry-run] [--restart]
+        [--chunk-size N] [--pause SECONDS] [--max-chunks N]
+    python -m app.maintenance retention [--dry-run]
+"""
+import argparse
+import sys
+
+import app.models.base  # noqa: F401 - configure every mapper before running jobs
+from app.db.database import SessionLocal
+from app.maintenance import JOBS, run_job
+from app.maintenance.base import DEFAULT_CHUNK_SIZE
+from app.models.maintenance import MaintenanceCheckpoint
+from app.services.log_retention import run_retention
+
+
+def _print_progress(stats):
+    total = stats["rows_total"] or 1
+    percent = min(100.0, 100.0 * stats["rows_scanned"] / total)
+    verb = "would change" if stats["dry_run"] else "changed"
+    print(
+        f"[{stats['job']}] {percent:5.1f}%  scanned {stats['rows_scanned']}/{stats['rows_total']}"
+        f"  {verb} {stats['rows_changed']}  last id {stats['last_id']}  {stats['elapsed']}s",
+        flush=True
+    )
+
+
+def list_jobs():
+    db = SessionLocal()
+    try:
+        checkpoints = {c.job: c for c in db.query(MaintenanceCheckpoint).all()}
+    finally:
+        db.close()
+
+    for name, job in sorted(JOBS.items()):
+        checkpoint = checkpoints.get(name)
+        if checkpoint is None:
+            state = "never run"
+        elif checkpoint.completed_at:
+            state = f"completed {checkpoint.completed_at:%Y-%m-%d %H:%M}, {checkpoint.rows_changed} rows changed"
+        else:
+            state = f"interrupted after id {checkpoint.last_id}, {checkpoint.rows_changed} rows changed"
+        print(f"{name:<16} {job.description}  ({state})")
+
+
+def retention(dry_run: bool) -> int:
+    db = SessionLocal()
+    try:
+        result = run_retention(db, dry_run=dry_run)
+    finally:
+        db.close()
+
+    if result is None:
+        print("Another retention run holds the lock; try again later")
+        return 1
+    if not result:
+        print("Log tables are only partitioned on PostgreSQL; nothing to do")
+        return 0
+    verb = "would drop" if dry_run else "dropped"
+    for table, changes in result.items():
+        print(f"{table:<16} created {changes['created'] or 'none'}, {verb} {changes['dropped'] or 'none'}")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.maintenance", description="Run batch maintenance jobs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="List registered jobs and their checkpoints")
+
+    run = commands.add_parser("run", help="Run a job")
+    run.add_argument("job", choices=sorted(JOBS))
+    run.add_argument("--dry-run", action="store_true", help="Count affected rows without writing")
+    run.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first row")
+    run.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per transaction")
+    run.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between chunks")
+    run.add_argument("--max-chunks", type=int, default=None, help="Stop after this many chunks (resume later)")
+
+    keep = commands.add_parser("retention", help="Create upcoming log partitions and drop expired ones")
+    keep.add_argument("--dry-run", action="store_true", help="Only list the partitions that would be dropped")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        list_jobs()
+        return 0
+    if args.command == "retention":
+        return retention(args.dry_run)
+
+    db = SessionLocal()
+    try:
+        stats = run_job(
+            db,
+            args.job,
+            chunk_size=args.chunk_size,
+            dry_run=args.dry_run,
+            restart=args.restart,
+            pause=args.pause,
+            max_chunks=args.max_chunks,
+            progress=_print_progress
+        )
+    except KeyboardInterrupt:
+        db.rollback()
+        print(f"\nInterrupted; run again to resume {args.job} from its checkpoint")
+        return 130
+    finally:
+        db.close()
+
+    if stats["completed"]:
+        verb = "would change" if args.dry_run else "changed"
+        print(f"\n✓ {args.job} finished: {verb} {stats['rows_changed']} of {stats['rows_scanned']} rows in {stats['elapsed']}s")
+    else:
+        print(f"\n{args.job} stopped after {stats['chunks']} chunks; run again to resume")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Maintenance job base class, registry and runner
+
+A job describes one set-based UPDATE over a table. The runner walks the
+table's primary key in keyset-paginated chunks and applies the UPDATE to one
+ID range at a time, each chunk in its own short transaction together with the
+job's checkpoint. Stopping a run at any point loses at most the chunk in
+flight, and the next run picks up after the last committed chunk.
+"""
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional, Type
+
+import structlog
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import Update
+
+from app.models.maintenance import MaintenanceCheckpoint
+
+logger = structlog.get_logger()
+
+DEFAULT_CHUNK_SIZE = 1000
+# Per-statement lock wait on PostgreSQL; a chunk that cannot get its row locks
+# backs off and retries instead of queueing behind live game traffic
+LOCK_TIMEOUT = "2s"
+MAX_CHUNK_RETRIES = 5
+
+
+class MaintenanceJob:
+    """
+    A set-based data fix
+
+    Subclasses set name, description and model, and implement build_update()
+    to return an UPDATE whose WHERE clause matches only the rows that still
+    need fixing. It is built once per run; the runner adds the primary key
+    range of each chunk.
+    """
+    name: str = ""
+    description: str = ""
+    model = None
+
+    def build_update(self, db: Session) -> Update:
+        raise NotImplementedError
+
+
+JOBS: Dict[str, MaintenanceJob] = {}
+
+
+def register(job_class: Type[MaintenanceJob]) -> Type[MaintenanceJob]:
+    """Class decorator adding a job to the registry under its name"""
+    if job_class.name in JOBS:
+        raise ValueError(f"Maintenance job already registered: {job_class.name}")
+    JOBS[job_class.name] = job_class()
+    return job_class
+
+
+def get_job(name: str) -> MaintenanceJob:
+    job = JOBS.get(name)
+    if not job:
+        raise ValueError(f"Unknown maintenance job: {name}")
+    return job
+
+
+def _next_chunk(db: Session, model, last_id: int, chunk_size: int):
+    """(row count, highest ID) of the next chunk after last_id, using the primary key index"""
+    chunk = (
+        select(model.id)
+        .where(model.id > last_id)
+        .order_by(model.id)
+        .limit(chunk_size)
+        .subquery()
+    )
+    return db.execute(select(func.count(), func.max(chunk.c.id))).one()
+
+
+def _apply_chunk(db: Session, job: MaintenanceJob, stmt: Update, lower: int, upper: int, dry_run: bool) -> int:
+    """Run the job's UPDATE over (lower, upper] and return how many rows it changed (or would change)"""
+    id_range = (job.model.id > lower, job.model.id <= upper)
+
+    if dry_run:
+        # Count the rows the UPDATE would touch without writing anything
+        return db.execute(
+            select(func.count()).select_from(job.model).where(stmt.whereclause, *id_range)
+        ).scalar()
+
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+    return db.execute(
+        stmt.where(*id_range).execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def run_job(
+    db: Session,
+    name: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    dry_run: bool = False,
+    restart: bool = False,
+    pause: float = 0.0,
+    max_chunks: Optional[int] = None,
+    progress: Optional[Callable[[Dict], None]] = None
+) -> Dict:
+    """
+    Run a registered job to completion (or for max_chunks chunks)
+
+    Resumes from the job's checkpoint unless restart is set. A dry run
+    ignores and never writes checkpoints. pause is slept between chunks to
+    throttle the load on a live database. progress, if given, is called with
+    a stats dict after every chunk.
+    """
+    job = get_job(name)
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be positive")
+
+    checkpoint = None
+    if not dry_run:
+        checkpoint = db.get(MaintenanceCheckpoint, name)
+        if checkpoint is None:
+            checkpoint = MaintenanceCheckpoint(job=name, last_id=0, rows_scanned=0, rows_changed=0)
+            db.add(checkpoint)
+        elif restart or checkpoint.completed_at is not None:
+            # A finished job starts over; an explicit restart discards the old position
+            checkpoint.last_id = 0
+            checkpoint.rows_scanned = 0
+            checkpoint.rows_changed = 0
+            checkpoint.started_at = datetime.utcnow()
+            checkpoint.completed_at = None
+        db.commit()
+
+    last_id = checkpoint.last_id if checkpoint else 0
+    base_scanned = checkpoint.rows_scanned if checkpoint else 0
+    base_changed = checkpoint.rows_changed if checkpoint else 0
+    stats = {
+        "job": name,
+        "dry_run": dry_run,
+        "resumed_from": last_id,
+        "rows_total": db.execute(
+            select(func.count()).select_from(job.model).where(job.model.id > last_id)
+        ).scalar(),
+        "rows_scanned": 0,
+        "rows_changed": 0,
+        "chunks": 0,
+        "completed": False
+    }
+    db.rollback()
+
+    stmt = job.build_update(db)
+    started = time.monotonic()
+    logger.info("maintenance_job_started", **stats)
+
+    while max_chunks is None or stats["chunks"] < max_chunks:
+        for attempt in range(1, MAX_CHUNK_RETRIES + 1):
+            try:
+                scanned, upper = _next_chunk(db, job.model, last_id, chunk_size)
+                if not scanned:
+                    break
+                changed = _apply_chunk(db, job, stmt, last_id, upper, dry_run)
+                if checkpoint is not None:
+                    checkpoint.last_id = upper
+                    checkpoint.rows_scanned = base_scanned + stats["rows_scanned"] + scanned
+                    checkpoint.rows_changed = base_changed + stats["rows_changed"] + changed
+                if dry_run:
+                    db.rollback()
+                else:
+                    db.commit()
+                break
+            except OperationalError as e:
+                # Lock timeout or a dropped connection: back off and retry the same chunk
+                db.rollback()
+                if attempt == MAX_CHUNK_RETRIES:
+                    raise
+                logger.warning("maintenance_chunk_retry", job=name, after_id=last_id, attempt=attempt, error=str(e))
+                time.sleep(max(pause, 0.5) * attempt)
+
+        if not scanned:
+            stats["completed"] = True
+            break
+
+        last_id = upper
+        stats["rows_scanned"] += scanned
+        stats["rows_changed"] += changed
+        stats["chunks"] += 1
+        stats["last_id"] = last_id
+        stats["elapsed"] = round(time.monotonic() - started, 2)
+        if progress:
+            progress(stats)
+
+        if pause:
+            time.sleep(pause)
+
+    if stats["completed"] and checkpoint is not None:
+        checkpoint.completed_at = datetime.utcnow()
+        db.commit()
+
+    stats["elapsed"] = round(time.monotonic() - started, 2)
+    logger.info("maintenance_job_finished", **stats)
+    return stats
@@ -0,0 +1,87 @@
+"""
+Registered maintenance jobs
+
+Each job is a single UPDATE that only matches rows still needing the fix, so
+re-running a job (or resuming it after a crash) never changes a row twice.
+"""
+from sqlalchemy import BigInteger, Integer, case, column, exists, func, update, values
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import Update
+
+from app.maintenance.base import MaintenanceJob, register
+from app.models.buff import ActiveBuff, BuffType
+from app.models.player import Player
+from app.services.progression_service import ProgressionService
+
+BASE_STAMINA_MAX = 100
+
+
+@register
+class PlayerXPJob(MaintenanceJob):
+    """
+    Convert per-level XP progress to total lifetime XP
+
+    Old code stored progress within the current level in player.exp. A player
+    whose exp is below the total needed to reach their level still has the
+    old value; their exp becomes that total plus the stored progress and
+    exp_max is reset to the requirement for the next level. The per-level
+    totals are joined in as a VALUES list instead of being computed per row.
+    """
+    name = "player_xp"
+    description = "Convert per-level player XP to total lifetime XP"
+    model = Player
+
+    def build_update(self, db: Session) -> Update:
+        levels = values(
+            column("level", Integer),
+            column("total_xp", BigInteger),
+            column("exp_max", BigInteger),
+            name="xp_levels"
+        ).data([
+            (
+                level,
+                ProgressionService.calculate_total_xp_for_level(level),
+                ProgressionService.calculate_xp_for_level(level + 1)
+            )
+            for level in range(1, ProgressionService.MAX_LEVEL + 1)
+        ])
+
+        return (
+            update(Player)
+            .where(Player.level == levels.c.level, Player.exp < levels.c.total_xp)
+            .values(exp=Player.exp + levels.c.total_xp, exp_max=levels.c.exp_max)
+        )
+
+
+@register
+class StaminaMaxJob(MaintenanceJob):
+    """
+    Reset stamina_max left raised by stamina boosts that expired unrestored
+
+    Every player whose stamina_max is not the base value gets it reset, with
+    current stamina capped to the new max. Players with a boost still running
+    are left alone; the buff restores their value when it expires.
+    """
+    name = "stamina_max"
+    description = f"Reset stamina_max to {BASE_STAMINA_MAX} and cap stamina"
+    model = Player
+
+    def build_update(self, db: Session) -> Update:
+        return (
+            update(Player)
+            .where(
+                Player.stamina_max != BASE_STAMINA_MAX,
+                ~exists().where(
+                    ActiveBuff.player_id == Player.id,
+                    ActiveBuff.buff_type == BuffType.STAMINA_BOOST,
+                    ActiveBuff.expires_at > func.now()
+                )
+            )
+            .values(
+                stamina_max=BASE_STAMINA_MAX,
+                stamina=case(
+                    (Player.stamina > BASE_STAMINA_MAX, BASE_STAMINA_MAX),
+                    else_=Player.stamina
+                )
+            )
+        )
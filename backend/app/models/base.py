@@ -7,7 +7,10 @@ from app.models.inventory import InventoryItem, EquipmentSet
 from app.models.pet import Pet, PetSet
 from app.models.battle import Battle, BattleParticipant, BattleEnemy
 from app.models.shop import ShopPurchase
-from app.models.pvp import Duel, PvPStats
+from app.models.pvp import Duel, PvPStats, PvPBattleSnapshot
+from app.models.loadout import LoadoutPreset
+from app.models.currency import CurrencyLedgerEntry
+from app.models.maintenance import MaintenanceCheckpoint
 
 __all__ = [
     "Base",
@@ -22,5 +25,9 @@ __all__ = [
     "BattleEnemy",
     "ShopPurchase",
     "Duel",
-    "PvPStats"
+    "PvPStats",
+    "PvPBattleSnapshot",
+    "LoadoutPreset",
+    "CurrencyLedgerEntry",
+    "MaintenanceCheckpoint"
 ]
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, BigInteger
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, BigInteger, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.db.database import Base
@@ -8,11 +8,20 @@ class BattleLog(Base):
     """
     Persistent storage for battle event logs
     Stores all battle events (attacks, defeats, player joins/leaves, etc.)
+
+    Partitioned by month on created_at in PostgreSQL (hence the composite
+    primary key); old months are dropped by app.services.log_retention.
+    battle_id has no foreign key so logs can outlive deleted battles.
     """
     __tablename__ = "battle_logs"
+    __table_args__ = (
+        # Log pages are read newest first on (created_at, id) within a battle
+        Index("ix_battle_logs_battle_id_created_at_id", "battle_id", "created_at", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
-    battle_id = Column(Integer, ForeignKey("battles.id"), nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    battle_id = Column(Integer, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # Nullable for system messages
 
     # Log Content
@@ -27,10 +36,10 @@ class BattleLog(Base):
     enemy_hp_remaining = Column(BigInteger, nullable=True)  # Enemy HP after event
 
     # Metadata
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow, index=True)  # Partition key
 
     # Relationships
-    battle = relationship("Battle")
+    battle = relationship("Battle", primaryjoin="foreign(BattleLog.battle_id) == Battle.id")
     user = relationship("User")
 
     def to_dict(self):
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.db.database import Base
@@ -6,21 +6,30 @@ from app.db.database import Base
 
 class ChatMessage(Base):
     """
-    Persistent storage for global chat messages
-    Stores all messages in the tavern chat
+    Persistent storage for chat messages
+    Stores messages of the tavern rooms and battle channels
+
+    Partitioned by month on created_at in PostgreSQL (hence the composite
+    primary key); old months are dropped by app.services.log_retention.
     """
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # History pages are read newest first on (created_at, id) within a channel
+        Index("ix_chat_messages_channel_created_at_id", "channel", "created_at", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 
     # Message Content
     username = Column(String, nullable=False)  # Cached username for faster retrieval
     text = Column(Text, nullable=False)
     message_type = Column(String, default="message")  # "message", "system", "join", "leave"
+    channel = Column(String, default="tavern:1", nullable=False)  # "tavern:<room>", "battle:<id>"
 
     # Metadata
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow, index=True)  # Partition key
 
     # Relationships
     user = relationship("User")
@@ -33,5 +42,6 @@ class ChatMessage(Base):
             "username": self.username,
             "text": self.text,
             "type": self.message_type,
+            "channel": self.channel,
             "timestamp": self.created_at.isoformat()
         }
@@ -0,0 +1,26 @@
+"""
+Currency Ledger Model
+"""
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger, Index
+from datetime import datetime
+from app.db.database import Base
+
+
+class CurrencyLedgerEntry(Base):
+    """Append-only record of every gold/gem balance change"""
+    __tablename__ = "currency_ledger"
+    __table_args__ = (
+        Index("ix_currency_ledger_player_id_id", "player_id", "id"),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    player_id = Column(Integer, ForeignKey("players.id", ondelete="CASCADE"), nullable=False)
+
+    currency = Column(String, nullable=False)  # "gold" or "gems"
+    amount = Column(BigInteger, nullable=False)  # Signed change
+    balance_after = Column(BigInteger, nullable=False)
+
+    reason = Column(String, nullable=False)  # "shop_purchase", "loot", "duel_win", ...
+    reference = Column(String, nullable=True)  # Battle/duel/catalog ID the change belongs to
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
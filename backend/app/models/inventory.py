@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum as SQLEnum, JSON
+from sqlalchemy import Column, Integer, String, ForeignKey, Enum as SQLEnum, JSON, DateTime, UniqueConstraint, func
 from sqlalchemy.orm import relationship
 from enum import Enum
+from datetime import datetime
 from app.db.database import Base
 
 
@@ -42,6 +43,10 @@ class SetType(str, Enum):
 
 class InventoryItem(Base):
     __tablename__ = "inventory_items"
+    __table_args__ = (
+        # One stack per consumable per player; unique items leave catalog_id NULL
+        UniqueConstraint("player_id", "catalog_id", name="uq_inventory_items_player_catalog"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     player_id = Column(Integer, ForeignKey("players.id"), nullable=False)
@@ -62,6 +67,9 @@ class InventoryItem(Base):
 
     # Stack info (for consumables)
     quantity = Column(Integer, default=1)
+    catalog_id = Column(String, nullable=True)  # Shop catalog ID for stackable consumables
+
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=func.now())
 
     # Relationships
     player = relationship("Player", back_populates="inventory_items")
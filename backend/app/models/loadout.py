@@ -0,0 +1,36 @@
+"""
+Saved Loadout Preset Models
+"""
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, UniqueConstraint
+from sqlalchemy.orm import relationship
+from datetime import datetime
+from app.db.database import Base
+
+
+class LoadoutPreset(Base):
+    """Named snapshot of a player's equipment and pet sets"""
+    __tablename__ = "loadout_presets"
+    __table_args__ = (
+        UniqueConstraint("player_id", "name", name="uq_loadout_presets_player_name"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    player_id = Column(Integer, ForeignKey("players.id", ondelete="CASCADE"), nullable=False, index=True)
+    name = Column(String, nullable=False)
+
+    # Slot columns per set, ready to be written back as-is:
+    # {"equipment": {"attack": {"weapon_id": 12, ...}, "defense": {...}},
+    #  "pets": {"attack": {"pet_1_id": 3, ...}, "defense": {...}}}
+    slots = Column(JSON, nullable=False)
+
+    # Stat totals of the gear and pets above, so activation can prime the stat cache directly
+    bonus_attack = Column(Integer, default=0, nullable=False)
+    bonus_defense = Column(Integer, default=0, nullable=False)
+    bonus_hp = Column(Integer, default=0, nullable=False)
+
+    # Timestamps
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    player = relationship("Player", back_populates="loadout_presets")
@@ -0,0 +1,22 @@
+"""
+Maintenance Job Checkpoint Model
+"""
+from sqlalchemy import Column, String, DateTime, BigInteger
+from datetime import datetime
+from app.db.database import Base
+
+
+class MaintenanceCheckpoint(Base):
+    """Progress of a maintenance job, so an interrupted run can resume where it stopped"""
+    __tablename__ = "maintenance_checkpoints"
+
+    job = Column(String, primary_key=True)
+
+    # Highest primary key already processed (keyset position)
+    last_id = Column(BigInteger, default=0, nullable=False)
+    rows_scanned = Column(BigInteger, default=0, nullable=False)
+    rows_changed = Column(BigInteger, default=0, nullable=False)
+
+    started_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    completed_at = Column(DateTime, nullable=True)
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger, Float
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger, Float, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.db.database import Base
+from app.models.inventory import ItemRarity
 
 
 class Player(Base):
@@ -30,6 +31,12 @@ class Player(Base):
     base_hp = Column(Integer, default=100)
     unspent_stat_points = Column(Integer, default=0)
 
+    # Bumped on every inventory/equipment change; backs the inventory ETag
+    inventory_version = Column(Integer, default=0, server_default="0", nullable=False)
+
+    # Loot drops at or below this rarity are salvaged for gold instead of stored (None = keep everything)
+    auto_salvage_rarity = Column(SQLEnum(ItemRarity), nullable=True)
+
     # Timestamps
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -44,6 +51,7 @@ class Player(Base):
     battle_participations = relationship("BattleParticipant", back_populates="player", cascade="all, delete-orphan")
     shop_purchases = relationship("ShopPurchase", back_populates="player", cascade="all, delete-orphan")
     active_buffs = relationship("ActiveBuff", back_populates="player", cascade="all, delete-orphan")
+    loadout_presets = relationship("LoadoutPreset", back_populates="player", cascade="all, delete-orphan")
 
     def calculate_total_attack(self):
         """Calculate total attack including equipment and pets"""
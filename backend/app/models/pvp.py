@@ -1,7 +1,7 @@
 """
 PVP Duel System Models
 """
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger, Boolean, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, BigInteger, Boolean, JSON, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from enum import Enum
@@ -79,3 +79,19 @@ class PvPStats(Base):
 
     # Relationships
     player = relationship("Player", backref="pvp_stats")
+
+
+class PvPBattleSnapshot(Base):
+    """
+    Latest serialized state of a live PVP battle
+    Written in the background by PvPBattleManager so in-progress duels
+    survive a worker restart. The worker that wrote it last owns the battle.
+    """
+    __tablename__ = "pvp_battle_snapshots"
+
+    battle_id = Column(String, primary_key=True)  # Matches Duel.battle_id
+    duel_id = Column(Integer, ForeignKey("duels.id", ondelete="CASCADE"), nullable=False, index=True)
+    turn = Column(Integer, nullable=False, default=1)
+    state = Column(JSON, nullable=False)  # BattleState.to_snapshot()
+    owner = Column(String, nullable=True)  # Worker ("host:pid") running the battle
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
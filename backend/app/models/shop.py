@@ -14,6 +14,7 @@ class ShopPurchase(Base):
     # Purchase Info
     item_type = Column(String, nullable=False)
     item_name = Column(String, nullable=False)
+    quantity = Column(Integer, default=1, server_default="1", nullable=False)  # Units bought in this line
     cost_gold = Column(BigInteger, default=0)
     cost_gems = Column(Integer, default=0)
     purchased_at = Column(DateTime, default=datetime.utcnow)
@@ -104,6 +104,29 @@ class AttackResponse(BaseModel):
     error: Optional[str] = None
 
 
+class BatchAttackRequest(BaseModel):
+    """Request to perform an ordered list of attacks in one call"""
+    attacks: List[AttackRequest] = Field(..., min_length=1, max_length=50, description="Attacks to resolve, in order (max 50)")
+
+
+class BatchAttackHit(AttackResponse):
+    """Result of a single attack within a batch"""
+    phase_transition: Optional[Dict] = None
+
+
+class BatchAttackResponse(BaseModel):
+    """Response after a batch of attacks"""
+    success: bool
+    results: List[BatchAttackHit] = []
+    hits: int = 0
+    total_damage: int = 0
+    stamina_cost: int = 0
+    stamina_remaining: Optional[int] = None
+    battle_completed: bool = False
+    phase_transitions: List[Dict] = []
+    error: Optional[str] = None
+
+
 class LootItem(BaseModel):
     """Item dropped as loot"""
     id: int
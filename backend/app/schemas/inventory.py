@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from app.models.inventory import ItemType, ItemRarity, EquipmentSlot, SetType
@@ -14,6 +14,7 @@ class InventoryItemResponse(BaseModel):
     defense_bonus: int
     hp_bonus: int
     quantity: int
+    catalog_id: Optional[str] = None
     properties: Optional[Dict[str, Any]] = None
 
     class Config:
@@ -54,12 +55,53 @@ class UnequipItemRequest(BaseModel):
     slot: EquipmentSlot
 
 
+class EquipLoadoutRequest(BaseModel):
+    """Slot -> item ID per set; a null item clears the slot, omitted slots are left alone"""
+    sets: Dict[SetType, Dict[EquipmentSlot, Optional[int]]]
+
+
 class EquipmentStatsResponse(BaseModel):
     attack: int
     defense: int
     hp: int
 
 
+class SaveLoadoutPresetRequest(BaseModel):
+    name: str = Field(..., min_length=1, max_length=32)
+
+
+class LoadoutPresetResponse(BaseModel):
+    id: int
+    name: str
+    slots: Dict[str, Dict[str, Dict[str, Optional[int]]]]
+    bonus_attack: int
+    bonus_defense: int
+    bonus_hp: int
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class SalvageRequest(BaseModel):
+    """Salvage unequipped equipment at or below a rarity"""
+    max_rarity: ItemRarity
+    older_than_hours: Optional[int] = Field(None, ge=0)
+    item_types: Optional[List[ItemType]] = None
+
+
+class SalvageResponse(BaseModel):
+    salvaged: int
+    item_ids: List[int]
+    gold: int
+    gold_total: int
+
+
+class AutoSalvageRequest(BaseModel):
+    """Loot at or below max_rarity is salvaged on claim; null turns it off"""
+    max_rarity: Optional[ItemRarity] = None
+
+
 class ActiveBuffResponse(BaseModel):
     """Response for an active buff"""
     id: int
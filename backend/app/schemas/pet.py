@@ -23,6 +23,13 @@ class FeedPetRequest(BaseModel):
     xp_amount: int = Field(..., gt=0, description="Amount of XP to give (must be positive)")
 
 
+class FeedPetFoodRequest(BaseModel):
+    """Request to feed a pet from a pet food stack"""
+    pet_id: int = Field(..., description="ID of the pet to feed")
+    item_id: int = Field(..., description="Inventory ID of the pet food stack")
+    quantity: int = Field(1, ge=1, le=999, description="How many units of food to use")
+
+
 class EquipPetRequest(BaseModel):
     """Request to equip a pet"""
     pet_id: int = Field(..., description="ID of the pet to equip")
@@ -120,6 +127,12 @@ class FeedResultResponse(BaseModel):
     pet: PetResponse
 
 
+class FeedFoodResultResponse(FeedResultResponse):
+    """Result of feeding a pet from a pet food stack"""
+    xp_gained: int
+    food_remaining: int
+
+
 class EquipResultResponse(BaseModel):
     """Result of equipping a pet"""
     message: str
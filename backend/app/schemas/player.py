@@ -41,9 +41,11 @@ class PlayerResponse(PlayerBase, PlayerStats):
     created_at: datetime
     updated_at: datetime
     active_buffs: List[ActiveBuffSchema] = []
+    auto_salvage_rarity: Optional[str] = None
 
     class Config:
         from_attributes = True
+        use_enum_values = True
 
 
 class StatAllocation(BaseModel):
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 
@@ -61,6 +61,39 @@ class PurchaseResponse(BaseModel):
     gems_remaining: Optional[int] = None
 
 
+class CartLine(BaseModel):
+    """One catalog item and how many to buy"""
+    item_id: str
+    quantity: int = Field(default=1, ge=1, le=99)
+
+
+class CartPurchaseRequest(BaseModel):
+    """Request to buy several items in one checkout"""
+    items: List[CartLine] = Field(..., min_length=1, max_length=20)
+    use_gems: bool = Field(default=False, description="Pay with gems where an item has a gem price")
+
+
+class CartPurchaseLine(BaseModel):
+    """Result for one cart line"""
+    item_id: str
+    name: str
+    quantity: int
+    cost_gold: int
+    cost_gems: int
+    item_ids: List[str]  # New inventory/pet IDs (a single stack ID for consumables)
+
+
+class CartPurchaseResponse(BaseModel):
+    """Response after checking out a cart"""
+    success: bool
+    message: str
+    lines: List[CartPurchaseLine]
+    cost_gold: int
+    cost_gems: int
+    gold_remaining: int
+    gems_remaining: int
+
+
 class ShopCatalogResponse(BaseModel):
     """Response containing all shop items"""
     equipment: list[ShopEquipmentItem]
@@ -74,6 +107,7 @@ class PurchaseHistoryItem(BaseModel):
     id: int
     item_type: str
     item_name: str
+    quantity: int = 1
     cost_gold: int
     cost_gems: int
     purchased_at: datetime
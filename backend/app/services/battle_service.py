@@ -3,7 +3,9 @@ Battle Service Layer
 Handles all battle logic including combat, enemies, and rewards
 """
 from typing import Dict, List, Tuple, Optional
+from sqlalchemy import case, select, update
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from datetime import datetime, timezone
 import structlog
 import random
@@ -18,9 +20,11 @@ from app.models.battle import (
     BattleType
 )
 from app.models.player import Player
-from app.models.inventory import InventoryItem, ItemType, ItemRarity, EquipmentSet, SetType
+from app.models.inventory import InventoryItem, ItemType, ItemRarity
+from app.services import currency_service
 from app.services.progression_service import ProgressionService
-from app.services.inventory_service import calculate_equipment_stats
+from app.services.loadout_service import get_combat_profile
+from app.services.inventory_service import bump_inventory_version, should_auto_salvage, salvage_value
 
 logger = structlog.get_logger()
 
@@ -478,93 +482,12 @@ class BattleService:
     @staticmethod
     def calculate_player_attack_power(db: Session, player: Player) -> int:
         """Calculate total attack power including equipment, pets, and buffs"""
-        total_attack = player.base_attack
-
-        # Add equipment bonuses from ATTACK set (players use attack set in battles)
-        attack_set = db.query(EquipmentSet).filter(
-            EquipmentSet.player_id == player.id,
-            EquipmentSet.set_type == SetType.ATTACK
-        ).first()
-
-        if attack_set:
-            equipment_stats = calculate_equipment_stats(attack_set, db)
-            total_attack += equipment_stats["attack"]
-            logger.debug(
-                "calculated_attack_power",
-                player_id=player.id,
-                base_attack=player.base_attack,
-                equipment_attack=equipment_stats["attack"],
-                total_attack=total_attack
-            )
-
-        # TODO: Add pet bonuses from active pet set
-        # Pets will add 20-100+ attack depending on level/focus
-
-        # Apply attack boost buff multiplier
-        from app.models.buff import ActiveBuff, BuffType
-        attack_boost = db.query(ActiveBuff).filter(
-            ActiveBuff.player_id == player.id,
-            ActiveBuff.buff_type == BuffType.ATTACK_BOOST,
-            ActiveBuff.expires_at > datetime.now(timezone.utc)
-        ).first()
-
-        if attack_boost:
-            attack_multiplier = attack_boost.effect_value
-            total_attack = int(total_attack * attack_multiplier)
-            logger.info(
-                "attack_boost_applied",
-                player_id=player.id,
-                base_total=total_attack // attack_multiplier,
-                multiplier=attack_multiplier,
-                boosted_attack=total_attack
-            )
-
-        return total_attack
+        return get_combat_profile(db, player)["attack"]
 
     @staticmethod
     def calculate_player_defense(db: Session, player: Player) -> int:
-        """Calculate total defense including equipment and pets"""
-        total_defense = player.base_defense
-
-        # Add equipment bonuses from DEFENSE set (players can have separate defense set)
-        defense_set = db.query(EquipmentSet).filter(
-            EquipmentSet.player_id == player.id,
-            EquipmentSet.set_type == SetType.DEFENSE
-        ).first()
-
-        if defense_set:
-            equipment_stats = calculate_equipment_stats(defense_set, db)
-            total_defense += equipment_stats["defense"]
-            logger.debug(
-                "calculated_defense",
-                player_id=player.id,
-                base_defense=player.base_defense,
-                equipment_defense=equipment_stats["defense"],
-                total_defense=total_defense
-            )
-
-        # TODO: Add pet bonuses from active pet set
-
-        # Apply defense boost buff multiplier
-        from app.models.buff import ActiveBuff, BuffType
-        defense_boost = db.query(ActiveBuff).filter(
-            ActiveBuff.player_id == player.id,
-            ActiveBuff.buff_type == BuffType.DEFENSE_BOOST,
-            ActiveBuff.expires_at > datetime.now(timezone.utc)
-        ).first()
-
-        if defense_boost:
-            defense_multiplier = defense_boost.effect_value
-            total_defense = int(total_defense * defense_multiplier)
-            logger.info(
-                "defense_boost_applied",
-                player_id=player.id,
-                base_total=total_defense // defense_multiplier,
-                multiplier=defense_multiplier,
-                boosted_defense=total_defense
-            )
-
-        return total_defense
+        """Calculate total defense including equipment, pets, and buffs"""
+        return get_combat_profile(db, player)["defense"]
 
     @staticmethod
     def calculate_damage(
@@ -659,8 +582,6 @@ class BattleService:
         # Get attack type configuration
         attack_config = BattleService.ATTACK_TYPE_CONFIG.get(attack_type.lower(), BattleService.ATTACK_TYPE_CONFIG["normal"])
         stamina_cost = attack_config["stamina_cost"]
-        damage_mult = attack_config["damage_mult"]
-        crit_bonus = attack_config["crit_bonus"]
 
         # Check stamina
         if player.stamina < stamina_cost:
@@ -671,49 +592,31 @@ class BattleService:
                 "stamina_current": player.stamina
             }
 
-        # Deduct stamina
-        player.stamina -= stamina_cost
-
         # Calculate attack
         attacker_power = BattleService.calculate_player_attack_power(db, player)
 
-        # Critical hit chance (10% base + attack type bonus)
-        base_crit_chance = 0.10
-        is_critical = random.random() < (base_crit_chance + crit_bonus)
-
-        damage = BattleService.calculate_damage(
+        hit = BattleService._apply_hit(
+            db=db,
+            participant=participant,
+            enemy=enemy,
             attacker_power=attacker_power,
-            defender_defense=enemy.defense,
-            is_critical=is_critical
+            attack_config=attack_config
         )
 
-        # Apply attack type damage multiplier
-        damage = int(damage * damage_mult)
-
-        # Apply damage
-        enemy.hp_current = max(0, enemy.hp_current - damage)
+        if hit is None:
+            # Another raider landed the killing blow after we loaded the enemy
+            db.rollback()
+            return {"success": False, "error": "Enemy already defeated"}
 
-        # Update participant stats
-        participant.total_damage_dealt += damage
-        participant.attacks_count += 1
+        damage, is_critical, enemy_defeated = hit
 
-        # Check if enemy defeated
-        enemy_defeated = enemy.hp_current <= 0
-        if enemy_defeated:
-            enemy.is_defeated = True
-            enemy.defeated_at = datetime.now(timezone.utc)
-            # Flush to ensure the is_defeated flag is available for the next query
-            db.flush()
+        # Deduct stamina
+        player.stamina -= stamina_cost
 
         # Check if all enemies defeated (battle complete)
-        all_defeated = db.query(BattleEnemy).filter(
-            BattleEnemy.battle_id == battle.id,
-            BattleEnemy.is_defeated == False
-        ).count() == 0
-
-        if all_defeated:
-            battle.status = BattleStatus.COMPLETED
-            battle.completed_at = datetime.now(timezone.utc)
+        all_defeated = False
+        if enemy_defeated:
+            all_defeated = BattleService._complete_battle_if_cleared(db, battle)
 
         # Check for boss phase transition (for boss raids)
         phase_transition = None
@@ -750,6 +653,289 @@ class BattleService:
 
         return result
 
+    @staticmethod
+    def _apply_hit(
+        db: Session,
+        participant: BattleParticipant,
+        enemy: BattleEnemy,
+        attacker_power: int,
+        attack_config: Dict
+    ) -> Optional[Tuple[int, bool, bool]]:
+        """
+        Roll and apply a single hit to an enemy
+        Returns (damage, is_critical, enemy_defeated), or None if the enemy
+        was already at 0 HP when the damage reached the database
+        """
+        # Critical hit chance (10% base + attack type bonus)
+        base_crit_chance = 0.10
+        is_critical = random.random() < (base_crit_chance + attack_config["crit_bonus"])
+
+        damage = BattleService.calculate_damage(
+            attacker_power=attacker_power,
+            defender_defense=enemy.defense,
+            is_critical=is_critical
+        )
+
+        # Apply attack type damage multiplier
+        damage = int(damage * attack_config["damage_mult"])
+
+        # Apply damage
+        hp_remaining = BattleService._apply_enemy_damage(db, enemy, damage)
+        if hp_remaining is None:
+            return None
+
+        # Update participant stats
+        participant.total_damage_dealt += damage
+        participant.attacks_count += 1
+
+        # Check if enemy defeated - only the hit that claims the flag counts
+        enemy_defeated = hp_remaining <= 0 and BattleService._claim_enemy_defeat(db, enemy)
+
+        return damage, is_critical, enemy_defeated
+
+    @staticmethod
+    def _apply_enemy_damage(db: Session, enemy: BattleEnemy, damage: int) -> Optional[int]:
+        """
+        Subtract damage from an enemy's HP in a single UPDATE ... RETURNING
+
+        Boss raids have every raider writing to the same row, so the old
+        read-modify-write on hp_current lost hits between workers. Doing the
+        subtraction in SQL keeps it atomic. It does not shorten contention:
+        the UPDATE's row lock is held until the caller commits, so concurrent
+        raiders still queue on the boss row for the rest of each other's
+        transaction. Returns the new HP, or None if the enemy was already at
+        0 HP.
+        """
+        hp_remaining = db.execute(
+            update(BattleEnemy)
+            .where(BattleEnemy.id == enemy.id, BattleEnemy.hp_current > 0)
+            .values(hp_current=case(
+                (BattleEnemy.hp_current > damage, BattleEnemy.hp_current - damage),
+                else_=0
+            ))
+            .returning(BattleEnemy.hp_current)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+
+        if hp_remaining is None:
+            set_committed_value(enemy, "hp_current", 0)
+            return None
+
+        set_committed_value(enemy, "hp_current", hp_remaining)
+        return hp_remaining
+
+    @staticmethod
+    def _claim_enemy_defeat(db: Session, enemy: BattleEnemy) -> bool:
+        """
+        Flag an enemy at 0 HP as defeated
+        The UPDATE only matches while is_defeated is still false, so exactly
+        one concurrent attacker gets credit for the kill
+        """
+        defeated_at = datetime.now(timezone.utc)
+        claimed = db.execute(
+            update(BattleEnemy)
+            .where(
+                BattleEnemy.id == enemy.id,
+                BattleEnemy.is_defeated == False,
+                BattleEnemy.hp_current <= 0
+            )
+            .values(is_defeated=True, defeated_at=defeated_at)
+            .returning(BattleEnemy.id)
+            .execution_options(synchronize_session=False)
+        ).first() is not None
+
+        set_committed_value(enemy, "is_defeated", True)
+        if claimed:
+            set_committed_value(enemy, "defeated_at", defeated_at)
+
+        return claimed
+
+    @staticmethod
+    def _complete_battle_if_cleared(db: Session, battle: Battle) -> bool:
+        """
+        Mark the battle completed if no enemies are left standing
+        Locks the battle row first so two raiders killing the last two
+        enemies at the same time can't both miss (or both see) the completion.
+        Returns True only for the caller that completed the battle.
+        """
+        status = db.execute(
+            select(Battle.status).where(Battle.id == battle.id).with_for_update()
+        ).scalar_one()
+
+        if status != BattleStatus.IN_PROGRESS:
+            return False
+
+        remaining = db.query(BattleEnemy).filter(
+            BattleEnemy.battle_id == battle.id,
+            BattleEnemy.is_defeated == False
+        ).count()
+
+        if remaining > 0:
+            return False
+
+        battle.status = BattleStatus.COMPLETED
+        battle.completed_at = datetime.now(timezone.utc)
+        return True
+
+    @staticmethod
+    def process_attack_batch(
+        db: Session,
+        battle: Battle,
+        player: Player,
+        attacks: List[Tuple[int, str]]
+    ) -> Dict:
+        """
+        Process an ordered list of attacks in a single transaction
+
+        Enemies, the participant row and the player's attack power are loaded
+        once for the whole batch; damage itself is applied atomically per hit.
+        Each hit runs its own stamina check in order, so a batch that runs out
+        of stamina part-way keeps the hits that landed and reports the rest as
+        failed. Everything is committed once at the end, which also means every
+        enemy row that was hit stays locked until then.
+
+        To keep concurrent batches from deadlocking, the targeted enemy rows are
+        locked up front in id order, whatever order the client sent the hits in,
+        and the battle row (completion check) is only locked after the loop.
+
+        Returns per-hit results plus batch totals
+        """
+        if battle.status != BattleStatus.IN_PROGRESS:
+            return {"success": False, "error": "Battle not in progress"}
+
+        participant = db.query(BattleParticipant).filter(
+            BattleParticipant.battle_id == battle.id,
+            BattleParticipant.player_id == player.id,
+            BattleParticipant.is_active == True
+        ).first()
+
+        if not participant:
+            return {"success": False, "error": "Not in this battle"}
+
+        if battle.is_boss_raid:
+            is_on_cooldown, seconds_remaining = BattleService.check_player_death_cooldown(participant)
+            if is_on_cooldown:
+                minutes = seconds_remaining // 60
+                seconds = seconds_remaining % 60
+                return {
+                    "success": False,
+                    "error": f"You are dead! Wait {minutes}m {seconds}s or use a resurrection potion",
+                    "is_dead": True,
+                    "cooldown_remaining": seconds_remaining
+                }
+
+        target_ids = sorted({enemy_id for enemy_id, _ in attacks})
+        enemies = {
+            e.id: e for e in db.query(BattleEnemy).filter(
+                BattleEnemy.battle_id == battle.id,
+                BattleEnemy.id.in_(target_ids)
+            ).order_by(BattleEnemy.id).with_for_update().all()
+        }
+        attacker_power = BattleService.calculate_player_attack_power(db, player)
+
+        results = []
+        phase_transitions = []
+        total_damage = 0
+        total_stamina_cost = 0
+        all_defeated = False
+        last_kill = None
+
+        for enemy_id, attack_type in attacks:
+            attack_config = BattleService.ATTACK_TYPE_CONFIG.get(attack_type.lower(), BattleService.ATTACK_TYPE_CONFIG["normal"])
+            stamina_cost = attack_config["stamina_cost"]
+            enemy = enemies.get(enemy_id)
+
+            if not enemy:
+                results.append({"success": False, "enemy_id": enemy_id, "attack_type": attack_type, "error": "Enemy not found"})
+                continue
+            if enemy.is_defeated:
+                results.append({"success": False, "enemy_id": enemy_id, "attack_type": attack_type, "error": "Enemy already defeated"})
+                continue
+            if player.stamina < stamina_cost:
+                results.append({
+                    "success": False,
+                    "enemy_id": enemy_id,
+                    "attack_type": attack_type,
+                    "error": f"Not enough stamina! Need {stamina_cost}, have {player.stamina}"
+                })
+                continue
+
+            hit = BattleService._apply_hit(
+                db=db,
+                participant=participant,
+                enemy=enemy,
+                attacker_power=attacker_power,
+                attack_config=attack_config
+            )
+            if hit is None:
+                results.append({"success": False, "enemy_id": enemy_id, "attack_type": attack_type, "error": "Enemy already defeated"})
+                continue
+
+            damage, is_critical, enemy_defeated = hit
+            player.stamina -= stamina_cost
+            total_stamina_cost += stamina_cost
+            total_damage += damage
+
+            phase_transition = None
+            if battle.is_boss_raid and not enemy_defeated:
+                phase_transition = BattleService.check_boss_phase_transition(db, battle, enemy)
+                if phase_transition:
+                    phase_transitions.append(phase_transition)
+
+            results.append({
+                "success": True,
+                "damage": damage,
+                "is_critical": is_critical,
+                "enemy_id": enemy_id,
+                "enemy_hp_remaining": enemy.hp_current,
+                "enemy_defeated": enemy_defeated,
+                "battle_completed": False,
+                "attack_type": attack_type,
+                "stamina_cost": stamina_cost,
+                "stamina_remaining": player.stamina,
+                "phase_transition": phase_transition
+            })
+            if enemy_defeated:
+                last_kill = results[-1]
+
+        # Battle row last, after every enemy lock this batch needs
+        if last_kill is not None:
+            all_defeated = BattleService._complete_battle_if_cleared(db, battle)
+            last_kill["battle_completed"] = all_defeated
+
+        hits = sum(1 for r in results if r["success"])
+        if hits == 0:
+            db.rollback()
+            return {
+                "success": False,
+                "error": results[0]["error"] if results else "No attacks submitted",
+                "results": results
+            }
+
+        db.commit()
+
+        logger.info(
+            "attack_batch_processed",
+            battle_id=battle.id,
+            player_id=player.id,
+            attacks_submitted=len(attacks),
+            hits=hits,
+            total_damage=total_damage,
+            stamina_cost=total_stamina_cost,
+            battle_completed=all_defeated
+        )
+
+        return {
+            "success": True,
+            "results": results,
+            "hits": hits,
+            "total_damage": total_damage,
+            "stamina_cost": total_stamina_cost,
+            "stamina_remaining": player.stamina,
+            "battle_completed": all_defeated,
+            "phase_transitions": phase_transitions
+        }
+
     @staticmethod
     def claim_loot(
         db: Session,
@@ -799,7 +985,7 @@ class BattleService:
             xp_reward = int(xp_reward * 1.2)
 
         # Award gold
-        player.gold += gold_reward
+        currency_service.credit(db, player, gold_reward, "battle_reward", reference=f"battle_{battle.id}")
 
         # Award XP (uses ProgressionService for level-ups)
         level_up_info = ProgressionService.award_xp(
@@ -815,7 +1001,22 @@ class BattleService:
 
         if random.random() < loot_chance:
             item = BattleService._generate_loot_item(db, player, battle)
-            if item:
+            if item and should_auto_salvage(player, item):
+                # Player opted out of this tier; pay it out instead of storing the row
+                salvage_gold = salvage_value(item.rarity, item.level_requirement)
+                currency_service.credit(db, player, salvage_gold, "auto_salvage", reference=f"battle_{battle.id}")
+                items_dropped.append({
+                    "id": None,
+                    "name": item.name,
+                    "type": item.item_type.value,
+                    "rarity": item.rarity.value,
+                    "salvaged": True,
+                    "salvage_gold": salvage_gold
+                })
+            elif item:
+                db.add(item)
+                bump_inventory_version(db, player.id)
+                db.flush()
                 items_dropped.append({
                     "id": item.id,
                     "name": item.name,
@@ -865,7 +1066,7 @@ class BattleService:
         player: Player,
         battle: Battle
     ) -> Optional[InventoryItem]:
-        """Generate a random loot item based on battle difficulty"""
+        """Generate a random loot item based on battle difficulty (not yet added to the session)"""
 
         # Rarity chances based on difficulty
         rarity_weights = {
@@ -923,7 +1124,6 @@ class BattleService:
             quantity=1
         )
 
-        db.add(item)
         return item
 
     @staticmethod
@@ -1047,9 +1247,20 @@ class BattleService:
         # Check each threshold to see if we've crossed it
         for phase_num, threshold in enumerate(thresholds, start=2):
             if phase_num > current_phase and hp_percent <= threshold:
-                # Phase transition!
-                battle.boss_current_phase = phase_num
-                db.flush()
+                # Phase transition! Conditional on the stored phase so that
+                # concurrent raiders crossing the same threshold announce it once
+                advanced = db.execute(
+                    update(Battle)
+                    .where(Battle.id == battle.id, Battle.boss_current_phase < phase_num)
+                    .values(boss_current_phase=phase_num)
+                    .returning(Battle.id)
+                    .execution_options(synchronize_session=False)
+                ).first() is not None
+
+                if not advanced:
+                    continue
+
+                set_committed_value(battle, "boss_current_phase", phase_num)
 
                 phase_descriptions = {
                     2: f"{boss.name} enters Phase 2! The battle intensifies!",
@@ -1118,10 +1329,13 @@ class BattleService:
             # TODO: Check if player has resurrection potion in inventory
             # For now, we'll implement a gem cost
             resurrection_cost = 50  # gems
-            if player.gems < resurrection_cost:
-                return False, f"Not enough gems (need {resurrection_cost}, have {player.gems})"
-
-            player.gems -= resurrection_cost
+            try:
+                currency_service.debit(
+                    db, player, resurrection_cost, "resurrection",
+                    currency_service.GEMS, reference=f"battle_{participant.battle_id}"
+                )
+            except currency_service.InsufficientFunds as e:
+                return False, f"Not enough gems (need {resurrection_cost}, have {e.balance})"
 
         # Check if cooldown has expired (if not using potion)
         if not use_potion:
@@ -0,0 +1,163 @@
+"""
+Batched chat message persistence
+
+Chat handlers queue rows here instead of opening a session and committing
+per message. A background task writes whatever has queued up with one
+multi-row INSERT every CHAT_FLUSH_INTERVAL seconds, or sooner once a full
+batch is waiting. The queue is bounded; under a sustained database outage
+the oldest rows are dropped (and counted) rather than growing without limit.
+
+A batch whose write fails is set aside and retried ahead of newer rows. After
+MAX_ATTEMPTS failures (a row the database will never accept, or an outage that
+outlasts the retries) its rows are dead-lettered: logged in full so they can be
+replayed, counted, and dropped, so one bad batch cannot stall chat persistence.
+"""
+import asyncio
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+
+import structlog
+from sqlalchemy import insert
+
+from app.core.config import settings
+from app.db.database import session_scope
+from app.models.chat_message import ChatMessage
+
+logger = structlog.get_logger()
+
+MAX_BATCH = 500
+MAX_PENDING = 10000
+MAX_ATTEMPTS = 3  # Failed writes of one batch before its rows are dead-lettered
+
+
+class ChatMessageWriter:
+    """Queue of chat rows flushed to the database in batches by one background task"""
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._pending: Deque[Dict] = deque(maxlen=MAX_PENDING)
+        self._retry: List[Dict] = []  # Batch whose last write failed, retried before newer rows
+        self._attempts = 0
+        self._event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # Counters for get_metrics()
+        self.queued = 0
+        self.written = 0
+        self.overflowed = 0
+        self.dead_lettered = 0
+        self.failed_batches = 0
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._writer())
+
+    async def stop(self):
+        """Stop the writer task and flush whatever is still queued"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while (self._retry or self._pending) and await self.flush():
+            pass
+        if self._retry or self._pending:
+            self._dead_letter(self._retry + list(self._pending), "writer stopped")
+            self._retry = []
+            self._pending.clear()
+
+    def queue(
+        self,
+        user_id: int,
+        username: str,
+        text: str,
+        channel: str,
+        message_type: str = "message",
+        created_at: Optional[datetime] = None
+    ):
+        """Queue a message row; created_at should match the timestamp that was broadcast"""
+        if len(self._pending) == self._pending.maxlen:
+            self.overflowed += 1
+        self._pending.append({
+            "user_id": user_id,
+            "username": username,
+            "text": text,
+            "message_type": message_type,
+            "channel": channel,
+            "created_at": created_at or datetime.utcnow()
+        })
+        self.queued += 1
+        self._event.set()
+
+    async def _writer(self):
+        while True:
+            await self._event.wait()
+            if len(self._pending) < MAX_BATCH:
+                # Let more messages coalesce into this write
+                await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> bool:
+        """Write up to one batch of queued rows; False if the write failed"""
+        self._event.clear()
+        if self._retry:
+            batch, self._retry = self._retry, []
+        elif self._pending:
+            batch = [self._pending.popleft() for _ in range(min(MAX_BATCH, len(self._pending)))]
+        else:
+            return True
+
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            self.failed_batches += 1
+            self._attempts += 1
+            logger.error("chat_batch_write_failed", rows=len(batch), attempt=self._attempts, error=str(e))
+            if self._attempts >= MAX_ATTEMPTS:
+                self._dead_letter(batch, str(e))
+            else:
+                # Held outside the bounded queue, so new messages never push it out
+                self._retry = batch
+            await asyncio.sleep(self.flush_interval)
+            self._event.set()
+            return False
+
+        self._attempts = 0
+        self.written += len(batch)
+        if self._pending:
+            self._event.set()
+        return True
+
+    def _dead_letter(self, rows: List[Dict], reason: str):
+        """Give up on rows: log them in full for a manual replay and count them"""
+        self._attempts = 0
+        self.dead_lettered += len(rows)
+        logger.error(
+            "chat_rows_dead_lettered",
+            count=len(rows),
+            reason=reason,
+            rows=[dict(row, created_at=row["created_at"].isoformat()) for row in rows]
+        )
+
+    @staticmethod
+    def _write(batch: List[Dict]):
+        """Insert one batch of rows (runs in a worker thread)"""
+        with session_scope() as db:
+            db.execute(insert(ChatMessage), batch)
+            db.commit()
+
+    def get_metrics(self) -> dict:
+        return {
+            "pending": len(self._pending) + len(self._retry),
+            "queued": self.queued,
+            "written": self.written,
+            "overflowed": self.overflowed,
+            "dead_lettered": self.dead_lettered,
+            "failed_batches": self.failed_batches
+        }
+
+
+chat_writer = ChatMessageWriter(flush_interval=settings.CHAT_FLUSH_INTERVAL)
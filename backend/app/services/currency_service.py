@@ -0,0 +1,148 @@
+"""
+Currency Service
+
+All gold and gem balance changes go through here. Each change is a single
+conditional UPDATE ... RETURNING on the player row, so concurrent requests
+from different workers never lose an update and there is no separate
+SELECT ... FOR UPDATE round trip. Debits only succeed when the balance covers
+them. The UPDATE still locks the player row until the caller's transaction
+ends, so commit promptly after changing a balance.
+
+Every change is also queued as a ledger entry on the session and written in
+one multi-row INSERT right before the session commits, so the audit trail
+lands in the same transaction as the balance change without an extra round
+trip per mutation.
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event, insert, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.models.currency import CurrencyLedgerEntry
+from app.models.player import Player
+
+
+GOLD = "gold"
+GEMS = "gems"
+CURRENCY_COLUMNS = {GOLD: Player.gold, GEMS: Player.gems}
+
+_LEDGER_KEY = "currency_ledger"
+
+
+class InsufficientFunds(ValueError):
+    """Raised when a debit is larger than the player's current balance"""
+
+    def __init__(self, currency: str, amount: int, balance: int):
+        self.currency = currency
+        self.amount = amount
+        self.balance = balance
+        super().__init__(f"Insufficient {currency} (need {amount}, have {balance})")
+
+
+def _apply(
+    db: Session,
+    player: Player,
+    currency: str,
+    delta: int,
+    reason: str,
+    reference: Optional[str],
+    require_funds: bool
+) -> int:
+    """Atomically add delta to a balance and queue the ledger entry. Returns the new balance."""
+    if currency not in CURRENCY_COLUMNS:
+        raise ValueError(f"Unknown currency: {currency}")
+
+    column = CURRENCY_COLUMNS[currency]
+    stmt = update(Player).where(Player.id == player.id)
+    if delta < 0 and require_funds:
+        stmt = stmt.where(column >= -delta)
+    stmt = (
+        stmt.values({column: column + delta})
+        .returning(column)
+        .execution_options(synchronize_session=False)
+    )
+    balance = db.execute(stmt).scalar_one_or_none()
+
+    if balance is None:
+        current = db.query(column).filter(Player.id == player.id).scalar()
+        if current is None:
+            raise ValueError("Player not found")
+        set_committed_value(player, currency, current)
+        raise InsufficientFunds(currency, -delta, current)
+
+    # Keep the loaded player in step without marking it dirty
+    set_committed_value(player, currency, balance)
+
+    db.info.setdefault(_LEDGER_KEY, []).append({
+        "player_id": player.id,
+        "currency": currency,
+        "amount": delta,
+        "balance_after": balance,
+        "reason": reason,
+        "reference": reference,
+        "created_at": datetime.utcnow()
+    })
+    return balance
+
+
+def credit(
+    db: Session,
+    player: Player,
+    amount: int,
+    reason: str,
+    currency: str = GOLD,
+    reference: Optional[str] = None
+) -> int:
+    """Add currency to a player. Returns the new balance."""
+    if amount < 0:
+        raise ValueError("Credit amount must not be negative")
+    return _apply(db, player, currency, amount, reason, reference, require_funds=False)
+
+
+def debit(
+    db: Session,
+    player: Player,
+    amount: int,
+    reason: str,
+    currency: str = GOLD,
+    reference: Optional[str] = None,
+    require_funds: bool = True
+) -> int:
+    """
+    Take currency from a player. Returns the new balance.
+
+    Raises InsufficientFunds (a ValueError) when require_funds is set and the
+    balance does not cover the amount; nothing is changed in that case.
+    """
+    if amount < 0:
+        raise ValueError("Debit amount must not be negative")
+    return _apply(db, player, currency, -amount, reason, reference, require_funds)
+
+
+def adjust(
+    db: Session,
+    player: Player,
+    amount: int,
+    reason: str,
+    currency: str = GOLD,
+    reference: Optional[str] = None
+) -> int:
+    """Apply a signed change without a funds check (admin and dev tooling)."""
+    return _apply(db, player, currency, amount, reason, reference, require_funds=False)
+
+
+@event.listens_for(Session, "before_commit")
+def _write_ledger(session: Session):
+    entries = session.info.pop(_LEDGER_KEY, None)
+    if entries:
+        session.execute(insert(CurrencyLedgerEntry), entries)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_ledger(session: Session, transaction):
+    # Entries still queued when the outer transaction ends were rolled back
+    # together with their balance changes, so drop them too
+    if transaction.parent is None:
+        session.info.pop(_LEDGER_KEY, None)
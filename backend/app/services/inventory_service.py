@@ -1,8 +1,15 @@
 import random
-from typing import Dict, Optional
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 from app.models.inventory import InventoryItem, EquipmentSet, ItemType, ItemRarity, EquipmentSlot, SetType
+from app.models.loadout import LoadoutPreset
+from app.models.pet import Pet
 from app.models.player import Player
+from app.services import currency_service
+from app.services.loadout_service import invalidate_combat_profile
 
 
 # Item generation tables based on rarity
@@ -22,6 +29,45 @@ RARITY_LEVEL_REQ = {
     ItemRarity.LEGENDARY: 30
 }
 
+# Item type each equipment slot accepts, and the EquipmentSet column backing it
+SLOT_ITEM_TYPES = {
+    EquipmentSlot.WEAPON: ItemType.WEAPON,
+    EquipmentSlot.HELMET: ItemType.HELMET,
+    EquipmentSlot.ARMOR: ItemType.ARMOR,
+    EquipmentSlot.BOOTS: ItemType.BOOTS,
+    EquipmentSlot.GLOVES: ItemType.GLOVES,
+    EquipmentSlot.RING: ItemType.RING,
+    EquipmentSlot.RING2: ItemType.RING,
+    EquipmentSlot.AMULET: ItemType.AMULET
+}
+
+SLOT_COLUMNS = {slot: f"{slot.value}_id" for slot in SLOT_ITEM_TYPES}
+
+# Rarities from lowest to highest, for "at or below" filters
+RARITY_ORDER = [
+    ItemRarity.COMMON,
+    ItemRarity.UNCOMMON,
+    ItemRarity.RARE,
+    ItemRarity.EPIC,
+    ItemRarity.LEGENDARY
+]
+
+# Gold paid per salvaged item: rarity base plus a flat amount per required level
+SALVAGE_BASE_VALUE = {
+    ItemRarity.COMMON: 5,
+    ItemRarity.UNCOMMON: 15,
+    ItemRarity.RARE: 40,
+    ItemRarity.EPIC: 100,
+    ItemRarity.LEGENDARY: 250
+}
+SALVAGE_VALUE_PER_LEVEL = 5
+
+# Columns clients may request from the paginated inventory listing
+INVENTORY_ITEM_FIELDS = (
+    "id", "item_type", "name", "rarity", "level_requirement",
+    "attack_bonus", "defense_bonus", "hp_bonus", "quantity", "catalog_id", "properties"
+)
+
 ITEM_NAME_PREFIXES = {
     ItemRarity.COMMON: ["Worn", "Old", "Simple", "Basic", "Rusty"],
     ItemRarity.UNCOMMON: ["Sturdy", "Fine", "Quality", "Enhanced", "Improved"],
@@ -93,6 +139,16 @@ def generate_item(
     }
 
 
+def bump_inventory_version(db: Session, player_id: int):
+    """Mark a player's inventory as changed; call before the commit that applies the change"""
+    db.execute(
+        update(Player)
+        .where(Player.id == player_id)
+        .values(inventory_version=Player.inventory_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
 def create_item_for_player(db: Session, player_id: int, item_type: ItemType, rarity: ItemRarity) -> InventoryItem:
     """Create and add an item to player's inventory"""
     item_data = generate_item(item_type, rarity)
@@ -103,12 +159,35 @@ def create_item_for_player(db: Session, player_id: int, item_type: ItemType, rar
     )
 
     db.add(item)
+    bump_inventory_version(db, player_id)
     db.commit()
     db.refresh(item)
 
     return item
 
 
+def add_to_stack(db: Session, player_id: int, catalog_id: str, quantity: int, **item_fields) -> int:
+    """
+    Add quantity to the player's stack of a catalog consumable and return its item ID
+
+    A single INSERT ... ON CONFLICT DO UPDATE, so concurrent purchases of the
+    same consumable grow one row instead of racing to create two. item_fields
+    (name, rarity, properties, ...) are only used when the stack is new.
+    """
+    stmt = pg_insert(InventoryItem).values(
+        player_id=player_id,
+        catalog_id=catalog_id,
+        quantity=quantity,
+        **item_fields
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[InventoryItem.player_id, InventoryItem.catalog_id],
+        set_={"quantity": InventoryItem.quantity + stmt.excluded.quantity}
+    ).returning(InventoryItem.id)
+
+    return db.execute(stmt).scalar_one()
+
+
 def get_or_create_equipment_set(db: Session, player_id: int, set_type: SetType) -> EquipmentSet:
     """Get or create an equipment set for a player"""
     equipment_set = db.query(EquipmentSet).filter(
@@ -164,6 +243,159 @@ def calculate_equipment_stats(equipment_set: EquipmentSet, db: Session) -> Dict[
     }
 
 
+def get_equipped_item_ids(db: Session, player_id: int) -> set:
+    """IDs of every item currently in one of the player's equipment sets"""
+    equipped = set()
+    for equipment_set in db.query(EquipmentSet).filter(EquipmentSet.player_id == player_id).all():
+        equipped.update(getattr(equipment_set, column) for column in SLOT_COLUMNS.values())
+    equipped.discard(None)
+    return equipped
+
+
+def query_inventory_items(
+    db: Session,
+    player_id: int,
+    fields: List[str],
+    cursor: Optional[int] = None,
+    limit: int = 100,
+    item_types: Optional[List[ItemType]] = None,
+    rarities: Optional[List[ItemRarity]] = None,
+    equipped: Optional[bool] = None
+) -> Tuple[List[str], list, Optional[int]]:
+    """
+    Page through a player's items in ID order, selecting only the requested columns
+
+    Returns (columns, rows, next_cursor). The ID is always the first column
+    since it doubles as the cursor; next_cursor is None on the last page.
+    """
+    unknown = [field for field in fields if field not in INVENTORY_ITEM_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown inventory fields: {', '.join(unknown)}")
+
+    columns = ["id"] + [field for field in dict.fromkeys(fields) if field != "id"]
+    query = db.query(*[getattr(InventoryItem, column) for column in columns]).filter(
+        InventoryItem.player_id == player_id
+    )
+
+    if cursor is not None:
+        query = query.filter(InventoryItem.id > cursor)
+    if item_types:
+        query = query.filter(InventoryItem.item_type.in_(item_types))
+    if rarities:
+        query = query.filter(InventoryItem.rarity.in_(rarities))
+    if equipped is not None:
+        equipped_ids = get_equipped_item_ids(db, player_id)
+        if equipped:
+            if not equipped_ids:
+                return columns, [], None
+            query = query.filter(InventoryItem.id.in_(equipped_ids))
+        elif equipped_ids:
+            query = query.filter(InventoryItem.id.notin_(equipped_ids))
+
+    rows = query.order_by(InventoryItem.id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+
+    return columns, rows, next_cursor
+
+
+def salvage_value(rarity: ItemRarity, level_requirement: int, quantity: int = 1) -> int:
+    """Gold paid for salvaging an item"""
+    return (SALVAGE_BASE_VALUE[rarity] + (level_requirement or 1) * SALVAGE_VALUE_PER_LEVEL) * (quantity or 1)
+
+
+def should_auto_salvage(player: Player, item: InventoryItem) -> bool:
+    """Check a fresh loot drop against the player's auto-salvage rule"""
+    if player.auto_salvage_rarity is None or item.item_type not in SLOT_ITEM_TYPES.values():
+        return False
+    return RARITY_ORDER.index(item.rarity) <= RARITY_ORDER.index(player.auto_salvage_rarity)
+
+
+def get_protected_item_ids(db: Session, player_id: int) -> set:
+    """Items that must survive a bulk salvage: equipped, held by a pet or saved in a preset"""
+    protected = get_equipped_item_ids(db, player_id)
+
+    pet_equipment = db.query(
+        Pet.attack_equip_1, Pet.attack_equip_2, Pet.attack_equip_3,
+        Pet.defense_equip_1, Pet.defense_equip_2, Pet.defense_equip_3
+    ).filter(Pet.player_id == player_id).all()
+    for row in pet_equipment:
+        protected.update(row)
+
+    for (slots,) in db.query(LoadoutPreset.slots).filter(LoadoutPreset.player_id == player_id).all():
+        for columns in slots.get("equipment", {}).values():
+            protected.update(columns.values())
+
+    protected.discard(None)
+    return protected
+
+
+def salvage_items(
+    db: Session,
+    player: Player,
+    max_rarity: ItemRarity,
+    older_than: Optional[datetime] = None,
+    item_types: Optional[List[ItemType]] = None
+) -> Dict:
+    """
+    Salvage every matching piece of equipment for gold
+
+    Matches unprotected equipment at or below max_rarity, optionally only
+    items created before older_than and of the given types. The items are
+    removed with one DELETE ... RETURNING and the gold is credited through
+    the currency service in the same transaction, so a salvage either fully happens or not
+    at all.
+    """
+    equipment_types = list(dict.fromkeys(SLOT_ITEM_TYPES.values()))
+    if item_types:
+        equipment_types = [item_type for item_type in equipment_types if item_type in item_types]
+        if not equipment_types:
+            raise ValueError("Only equipment can be salvaged")
+
+    rarities = RARITY_ORDER[:RARITY_ORDER.index(max_rarity) + 1]
+
+    query = delete(InventoryItem).where(
+        InventoryItem.player_id == player.id,
+        InventoryItem.item_type.in_(equipment_types),
+        InventoryItem.rarity.in_(rarities)
+    )
+
+    protected = get_protected_item_ids(db, player.id)
+    if protected:
+        query = query.where(InventoryItem.id.notin_(protected))
+    if older_than is not None:
+        query = query.where(InventoryItem.created_at < older_than)
+
+    rows = db.execute(
+        query.returning(
+            InventoryItem.id,
+            InventoryItem.rarity,
+            InventoryItem.level_requirement,
+            InventoryItem.quantity
+        ).execution_options(synchronize_session=False)
+    ).all()
+
+    if not rows:
+        db.rollback()
+        return {"salvaged": 0, "item_ids": [], "gold": 0, "gold_total": player.gold}
+
+    gold = sum(salvage_value(row.rarity, row.level_requirement, row.quantity) for row in rows)
+    gold_total = currency_service.credit(db, player, gold, "salvage")
+
+    bump_inventory_version(db, player.id)
+    db.commit()
+
+    return {
+        "salvaged": len(rows),
+        "item_ids": [row.id for row in rows],
+        "gold": gold,
+        "gold_total": gold_total
+    }
+
+
 def equip_item_to_slot(
     db: Session,
     player: Player,
@@ -224,8 +456,10 @@ def equip_item_to_slot(
     slot_field = slot_id_map[slot]
     setattr(equipment_set, slot_field, item.id)
 
+    bump_inventory_version(db, player.id)
     db.commit()
     db.refresh(equipment_set)
+    invalidate_combat_profile(player.id)
 
     return equipment_set
 
@@ -254,12 +488,92 @@ def unequip_item_from_slot(
     slot_field = slot_id_map[slot]
     setattr(equipment_set, slot_field, None)
 
+    bump_inventory_version(db, player.id)
     db.commit()
     db.refresh(equipment_set)
+    invalidate_combat_profile(player.id)
 
     return equipment_set
 
 
+def equip_loadout(
+    db: Session,
+    player: Player,
+    loadout: Dict[SetType, Dict[EquipmentSlot, Optional[int]]]
+) -> Dict[SetType, EquipmentSet]:
+    """
+    Apply a whole loadout (slot -> item ID, None to clear) to one or both sets
+
+    Every item is validated up front with a single query and all slots are
+    written in one commit, so either the full loadout is equipped or nothing
+    changes. Slots not mentioned keep their current item. An item moved in
+    from another slot or set is cleared from where it was.
+    """
+    if not loadout:
+        raise ValueError("Loadout is empty")
+
+    # An item can only occupy one slot across both sets
+    placements: Dict[int, Tuple[SetType, EquipmentSlot]] = {}
+    for set_type, slots in loadout.items():
+        for slot, item_id in slots.items():
+            if item_id is None:
+                continue
+            if item_id in placements:
+                other_set, other_slot = placements[item_id]
+                raise ValueError(
+                    f"Item {item_id} assigned to both {other_set.value} {other_slot.value} "
+                    f"and {set_type.value} {slot.value}"
+                )
+            placements[item_id] = (set_type, slot)
+
+    items = {}
+    if placements:
+        items = {
+            item.id: item for item in db.query(InventoryItem).filter(
+                InventoryItem.id.in_(placements.keys()),
+                InventoryItem.player_id == player.id
+            ).all()
+        }
+
+    for item_id, (set_type, slot) in placements.items():
+        item = items.get(item_id)
+        if not item:
+            raise ValueError(f"Item {item_id} not found in inventory")
+        if item.level_requirement > player.level:
+            raise ValueError(
+                f"Player level {player.level} too low for {item.name}. Required: {item.level_requirement}"
+            )
+        if item.item_type != SLOT_ITEM_TYPES[slot]:
+            raise ValueError(f"Cannot equip {item.item_type.value} in {slot.value} slot")
+
+    equipment_sets = {
+        eq_set.set_type: eq_set
+        for eq_set in db.query(EquipmentSet).filter(EquipmentSet.player_id == player.id).all()
+    }
+    for set_type in loadout:
+        if set_type not in equipment_sets:
+            equipment_sets[set_type] = EquipmentSet(player_id=player.id, set_type=set_type)
+            db.add(equipment_sets[set_type])
+
+    # Pull moved items out of their old slots before placing them
+    for set_type, eq_set in equipment_sets.items():
+        for slot, column in SLOT_COLUMNS.items():
+            current = getattr(eq_set, column)
+            if current in placements and placements[current] != (set_type, slot):
+                setattr(eq_set, column, None)
+
+    for set_type, slots in loadout.items():
+        eq_set = equipment_sets[set_type]
+        for slot, item_id in slots.items():
+            setattr(eq_set, SLOT_COLUMNS[slot], item_id)
+
+    bump_inventory_version(db, player.id)
+    db.commit()
+    invalidate_combat_profile(player.id)
+
+    return equipment_sets
+
+
 def give_starter_items(db: Session, player_id: int):
     """Give new players some starter items"""
     starter_items = [
@@ -0,0 +1,431 @@
+"""
+Loadout Service
+
+Resolves a player's effective combat profile (attack, defense, max HP) from
+base stats, equipped items, equipped pets and active potion buffs. PvE attacks,
+PvP duels and the online player list all read from here.
+
+Profiles are resolved for many players at once with a fixed number of queries
+and cached per player. Anything that changes an input (equipping, pets,
+buffs, stat allocation, level ups) calls invalidate_combat_profile(); the TTL
+bounds staleness across workers and buffs expiring on their own.
+
+Loadout presets snapshot both equipment sets and both pet sets under a name
+together with their bonus totals. Activating one writes each set back with a
+single UPDATE and primes the profile cache from the stored totals.
+"""
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.buff import ActiveBuff, BuffType
+from app.models.inventory import InventoryItem, EquipmentSet, SetType
+from app.models.loadout import LoadoutPreset
+from app.models.pet import Pet, PetSet
+from app.models.player import Player
+
+
+EQUIPMENT_SLOT_COLUMNS = (
+    "weapon_id", "helmet_id", "armor_id", "boots_id",
+    "gloves_id", "ring_id", "ring2_id", "amulet_id"
+)
+PET_SLOT_COLUMNS = ("pet_1_id", "pet_2_id", "pet_3_id")
+MAX_LOADOUT_PRESETS = 10
+
+# Cached profiles: {player_id: (profile, expires_at)} with expires_at on the monotonic clock
+_profile_cache: Dict[int, Tuple[Dict[str, int], float]] = {}
+
+
+def invalidate_combat_profile(player_id: int):
+    """Drop a player's cached profile after their gear, pets, buffs or stats change"""
+    _profile_cache.pop(player_id, None)
+
+
+def clear_combat_profile_cache():
+    """Drop every cached profile"""
+    _profile_cache.clear()
+
+
+def get_combat_profile(db: Session, player: Player) -> Dict[str, int]:
+    """Get the combat profile for a single player"""
+    return get_combat_profiles(db, [player])[player.id]
+
+
+def get_combat_profiles(db: Session, players: Iterable[Player]) -> Dict[int, Dict[str, int]]:
+    """
+    Get combat profiles for many players, keyed by player ID
+
+    Cached profiles are returned as-is; the rest are resolved together with
+    one query each for equipment sets, items, pet sets, pets and buffs no
+    matter how many players are missing. Returned dicts are shared with the
+    cache and must not be modified.
+    """
+    now = time.monotonic()
+    profiles: Dict[int, Dict[str, int]] = {}
+    missing: List[Player] = []
+
+    for player in players:
+        cached = _profile_cache.get(player.id)
+        if cached and cached[1] > now:
+            profiles[player.id] = cached[0]
+        else:
+            missing.append(player)
+
+    if missing:
+        for player_id, (profile, ttl) in _resolve_profiles(db, missing).items():
+            _profile_cache[player_id] = (profile, now + ttl)
+            profiles[player_id] = profile
+
+    return profiles
+
+
+def _resolve_profiles(db: Session, players: List[Player]) -> Dict[int, Tuple[Dict[str, int], float]]:
+    """Compute profiles from the database; returns {player_id: (profile, cache ttl)}"""
+    player_ids = [player.id for player in players]
+
+    # Equipment: attack set feeds attack, defense set feeds defense and HP
+    equipment_sets = db.query(EquipmentSet).filter(EquipmentSet.player_id.in_(player_ids)).all()
+    item_ids = {
+        getattr(equipment_set, column)
+        for equipment_set in equipment_sets
+        for column in EQUIPMENT_SLOT_COLUMNS
+    }
+    item_ids.discard(None)
+    items = {}
+    if item_ids:
+        items = {
+            row.id: row for row in db.query(
+                InventoryItem.id,
+                InventoryItem.attack_bonus,
+                InventoryItem.defense_bonus,
+                InventoryItem.hp_bonus
+            ).filter(InventoryItem.id.in_(item_ids)).all()
+        }
+
+    # Pets follow the same attack/defense split
+    pet_sets = db.query(PetSet).filter(PetSet.player_id.in_(player_ids)).all()
+    pet_ids = {
+        getattr(pet_set, column)
+        for pet_set in pet_sets
+        for column in PET_SLOT_COLUMNS
+    }
+    pet_ids.discard(None)
+    pets = {}
+    if pet_ids:
+        pets = {
+            row.id: row for row in db.query(
+                Pet.id,
+                Pet.attack_bonus,
+                Pet.defense_bonus,
+                Pet.hp_bonus
+            ).filter(Pet.id.in_(pet_ids), Pet.is_egg == False).all()
+        }
+
+    bonuses = {player_id: {"attack": 0, "defense": 0, "hp": 0} for player_id in player_ids}
+
+    for equipment_set in equipment_sets:
+        bonus = bonuses[equipment_set.player_id]
+        for column in EQUIPMENT_SLOT_COLUMNS:
+            item = items.get(getattr(equipment_set, column))
+            if not item:
+                continue
+            if equipment_set.set_type == SetType.ATTACK:
+                bonus["attack"] += item.attack_bonus or 0
+            else:
+                bonus["defense"] += item.defense_bonus or 0
+                bonus["hp"] += item.hp_bonus or 0
+
+    for pet_set in pet_sets:
+        bonus = bonuses[pet_set.player_id]
+        for column in PET_SLOT_COLUMNS:
+            pet = pets.get(getattr(pet_set, column))
+            if not pet:
+                continue
+            if pet_set.set_type == SetType.ATTACK:
+                bonus["attack"] += pet.attack_bonus or 0
+            else:
+                bonus["defense"] += pet.defense_bonus or 0
+                bonus["hp"] += pet.hp_bonus or 0
+
+    now = datetime.now(timezone.utc)
+    multipliers, buff_expiry = _load_buffs(db, player_ids, now)
+
+    return {
+        player.id: _build_profile(player, bonuses[player.id], multipliers[player.id], buff_expiry[player.id], now)
+        for player in players
+    }
+
+
+def _load_buffs(
+    db: Session,
+    player_ids: List[int],
+    now: datetime
+) -> Tuple[Dict[int, Dict[BuffType, int]], Dict[int, Optional[datetime]]]:
+    """Strongest active attack/defense multiplier per player and when the first of them wears off"""
+    buffs = db.query(ActiveBuff).filter(
+        ActiveBuff.player_id.in_(player_ids),
+        ActiveBuff.buff_type.in_([BuffType.ATTACK_BOOST, BuffType.DEFENSE_BOOST]),
+        ActiveBuff.expires_at > now
+    ).all()
+
+    multipliers: Dict[int, Dict[BuffType, int]] = {player_id: {} for player_id in player_ids}
+    buff_expiry: Dict[int, Optional[datetime]] = {player_id: None for player_id in player_ids}
+    for buff in buffs:
+        current = multipliers[buff.player_id].get(buff.buff_type, 0)
+        multipliers[buff.player_id][buff.buff_type] = max(current, buff.effect_value)
+        expires_at = buff.expires_at
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        if buff_expiry[buff.player_id] is None or expires_at < buff_expiry[buff.player_id]:
+            buff_expiry[buff.player_id] = expires_at
+
+    return multipliers, buff_expiry
+
+
+def _build_profile(
+    player: Player,
+    bonus: Dict[str, int],
+    multipliers: Dict[BuffType, int],
+    buff_expiry: Optional[datetime],
+    now: datetime
+) -> Tuple[Dict[str, int], float]:
+    """Combine base stats, gear/pet bonus totals and buffs; returns (profile, cache ttl)"""
+    attack = player.base_attack + bonus["attack"]
+    defense = player.base_defense + bonus["defense"]
+
+    # Active attack/defense potions multiply the totals
+    attack_multiplier = multipliers.get(BuffType.ATTACK_BOOST)
+    if attack_multiplier:
+        attack = int(attack * attack_multiplier)
+    defense_multiplier = multipliers.get(BuffType.DEFENSE_BOOST)
+    if defense_multiplier:
+        defense = int(defense * defense_multiplier)
+
+    profile = {
+        "attack": attack,
+        "defense": defense,
+        "max_hp": player.base_hp + (player.level * 10) + bonus["hp"],
+        "bonus_attack": bonus["attack"],
+        "bonus_defense": bonus["defense"],
+        "bonus_hp": bonus["hp"]
+    }
+
+    # Don't serve a boosted profile past the moment the buff wears off
+    ttl = settings.LOADOUT_CACHE_TTL
+    if buff_expiry is not None:
+        ttl = min(ttl, max(0.0, (buff_expiry - now).total_seconds()))
+
+    return profile, ttl
+
+
+def prime_combat_profile(db: Session, player: Player, bonus: Dict[str, int]) -> Dict[str, int]:
+    """
+    Replace a player's cached profile using already-known gear/pet bonus totals
+
+    Used when the totals are stored (loadout presets) so only buffs are read.
+    The cache entry is swapped in one assignment; readers see either the old
+    profile or the new one.
+    """
+    started = time.monotonic()
+    now = datetime.now(timezone.utc)
+    multipliers, buff_expiry = _load_buffs(db, [player.id], now)
+    profile, ttl = _build_profile(player, bonus, multipliers[player.id], buff_expiry[player.id], now)
+    _profile_cache[player.id] = (profile, started + ttl)
+    return profile
+
+
+def duel_player_data(player: Player, profile: Dict[str, int]) -> Dict:
+    """Player stats in the shape PvPBattleManager expects"""
+    return {
+        'id': player.id,
+        'username': player.username,
+        'level': player.level,
+        'attack': profile["attack"],
+        'defense': profile["defense"],
+        'max_hp': profile["max_hp"]
+    }
+
+
+def get_loadout_presets(db: Session, player_id: int) -> List[LoadoutPreset]:
+    """Get a player's saved presets"""
+    return db.query(LoadoutPreset).filter(
+        LoadoutPreset.player_id == player_id
+    ).order_by(LoadoutPreset.name).all()
+
+
+def save_loadout_preset(db: Session, player: Player, name: str) -> LoadoutPreset:
+    """Save the player's current equipment and pet sets as a preset, overwriting one with the same name"""
+    preset = db.query(LoadoutPreset).filter(
+        LoadoutPreset.player_id == player.id,
+        LoadoutPreset.name == name
+    ).first()
+
+    if not preset:
+        preset_count = db.query(LoadoutPreset).filter(LoadoutPreset.player_id == player.id).count()
+        if preset_count >= MAX_LOADOUT_PRESETS:
+            raise ValueError(f"You can save at most {MAX_LOADOUT_PRESETS} loadout presets")
+        preset = LoadoutPreset(player_id=player.id, name=name)
+        db.add(preset)
+
+    equipment_sets = {
+        equipment_set.set_type: equipment_set
+        for equipment_set in db.query(EquipmentSet).filter(EquipmentSet.player_id == player.id).all()
+    }
+    pet_sets = {
+        pet_set.set_type: pet_set
+        for pet_set in db.query(PetSet).filter(PetSet.player_id == player.id).all()
+    }
+
+    preset.slots = {
+        "equipment": {
+            set_type.value: {
+                column: getattr(equipment_sets.get(set_type), column, None)
+                for column in EQUIPMENT_SLOT_COLUMNS
+            }
+            for set_type in SetType
+        },
+        "pets": {
+            set_type.value: {
+                column: getattr(pet_sets.get(set_type), column, None)
+                for column in PET_SLOT_COLUMNS
+            }
+            for set_type in SetType
+        }
+    }
+
+    # Resolve straight from the database; a cached profile may be from another worker's stale view
+    profile, _ = _resolve_profiles(db, [player])[player.id]
+    preset.bonus_attack = profile["bonus_attack"]
+    preset.bonus_defense = profile["bonus_defense"]
+    preset.bonus_hp = profile["bonus_hp"]
+
+    db.commit()
+    db.refresh(preset)
+
+    return preset
+
+
+def activate_loadout_preset(db: Session, player: Player, preset: LoadoutPreset) -> Dict[str, int]:
+    """
+    Equip a saved preset and return the player's new combat profile
+
+    Ownership of every item and pet is checked with one query each, then each
+    of the four sets is written with a single UPDATE in one commit. The stat
+    cache is primed from the preset's stored totals instead of being rebuilt.
+    """
+    if preset.player_id != player.id:
+        raise ValueError("Preset does not belong to player")
+
+    equipment = preset.slots.get("equipment", {})
+    pets = preset.slots.get("pets", {})
+
+    item_ids = {item_id for columns in equipment.values() for item_id in columns.values() if item_id}
+    if item_ids:
+        owned = db.query(InventoryItem.id).filter(
+            InventoryItem.id.in_(item_ids),
+            InventoryItem.player_id == player.id
+        ).count()
+        if owned != len(item_ids):
+            raise ValueError(f"Preset '{preset.name}' uses items that are no longer in your inventory")
+
+    pet_ids = {pet_id for columns in pets.values() for pet_id in columns.values() if pet_id}
+    if pet_ids:
+        owned = db.query(Pet.id).filter(
+            Pet.id.in_(pet_ids),
+            Pet.player_id == player.id,
+            Pet.is_egg == False
+        ).count()
+        if owned != len(pet_ids):
+            raise ValueError(f"Preset '{preset.name}' uses pets you no longer have")
+
+    for model, set_slots, slot_columns in (
+        (EquipmentSet, equipment, EQUIPMENT_SLOT_COLUMNS),
+        (PetSet, pets, PET_SLOT_COLUMNS)
+    ):
+        for set_type in SetType:
+            columns = {column: set_slots.get(set_type.value, {}).get(column) for column in slot_columns}
+            result = db.execute(
+                update(model)
+                .where(model.player_id == player.id, model.set_type == set_type)
+                .values(**columns)
+            )
+            if result.rowcount == 0:
+                db.add(model(player_id=player.id, set_type=set_type, **columns))
+
+    from app.services.inventory_service import bump_inventory_version
+    bump_inventory_version(db, player.id)
+    db.commit()
+
+    return prime_combat_profile(db, player, {
+        "attack": preset.bonus_attack,
+        "defense": preset.bonus_defense,
+        "hp": preset.bonus_hp
+    })
+
+
+def refresh_loadout_presets(db: Session, player_id: int):
+    """
+    Recompute stored totals of a player's presets
+
+    Item stats never change, but pets grow when they level up; pet_service
+    calls this after a level gain so activation can keep trusting the totals.
+    """
+    presets = db.query(LoadoutPreset).filter(LoadoutPreset.player_id == player_id).all()
+    if not presets:
+        return
+
+    item_ids = {
+        item_id
+        for preset in presets
+        for columns in preset.slots.get("equipment", {}).values()
+        for item_id in columns.values() if item_id
+    }
+    pet_ids = {
+        pet_id
+        for preset in presets
+        for columns in preset.slots.get("pets", {}).values()
+        for pet_id in columns.values() if pet_id
+    }
+
+    sources = {}
+    if item_ids:
+        sources["equipment"] = {
+            row.id: row for row in db.query(
+                InventoryItem.id,
+                InventoryItem.attack_bonus,
+                InventoryItem.defense_bonus,
+                InventoryItem.hp_bonus
+            ).filter(InventoryItem.id.in_(item_ids)).all()
+        }
+    if pet_ids:
+        sources["pets"] = {
+            row.id: row for row in db.query(
+                Pet.id,
+                Pet.attack_bonus,
+                Pet.defense_bonus,
+                Pet.hp_bonus
+            ).filter(Pet.id.in_(pet_ids), Pet.is_egg == False).all()
+        }
+
+    for preset in presets:
+        bonus = {"attack": 0, "defense": 0, "hp": 0}
+        for kind, rows in sources.items():
+            for set_type, columns in preset.slots.get(kind, {}).items():
+                for source_id in columns.values():
+                    row = rows.get(source_id)
+                    if not row:
+                        continue
+                    if set_type == SetType.ATTACK.value:
+                        bonus["attack"] += row.attack_bonus or 0
+                    else:
+                        bonus["defense"] += row.defense_bonus or 0
+                        bonus["hp"] += row.hp_bonus or 0
+        preset.bonus_attack = bonus["attack"]
+        preset.bonus_defense = bonus["defense"]
+        preset.bonus_hp = bonus["hp"]
+
+    db.commit()
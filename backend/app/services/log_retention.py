@@ -0,0 +1,233 @@
+"""
+Partition maintenance for the append-only log tables
+
+chat_messages and battle_logs are partitioned by month on created_at
+(PostgreSQL only). This module keeps partitions created a few months ahead
+and removes old data by detaching and dropping whole partitions once they
+are entirely older than the table's retention period - a catalog change
+instead of a DELETE that scans, locks and bloats the table. Dropped
+partitions can optionally be archived first as gzipped CSV files.
+
+Runs in the background every LOG_RETENTION_INTERVAL seconds, or once via
+`python -m app.maintenance retention`. Every worker runs the task, so a run
+first takes a PostgreSQL advisory lock and is skipped if another worker (or
+the CLI) already holds it.
+"""
+import asyncio
+import gzip
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import structlog
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import session_scope
+
+logger = structlog.get_logger()
+
+# Upper bound of a range partition as printed by pg_get_expr()
+_UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+# pg_advisory_lock key serializing retention runs across workers and hosts
+RETENTION_LOCK_KEY = 0x6C6F6772  # "logr"
+
+
+@dataclass
+class PartitionedTable:
+    name: str
+    retention_days: int
+
+
+TABLES = [
+    PartitionedTable("chat_messages", settings.CHAT_RETENTION_DAYS),
+    PartitionedTable("battle_logs", settings.BATTLE_LOG_RETENTION_DAYS),
+]
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def next_month(month: datetime) -> datetime:
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def list_partitions(db: Session, table: str) -> List[Tuple[str, Optional[datetime]]]:
+    """(name, exclusive upper bound) of each range partition of table, oldest first; the default partition is skipped"""
+    rows = db.execute(text("""
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :table
+    """), {"table": table}).all()
+
+    partitions = []
+    for name, bound in rows:
+        match = _UPPER_BOUND.search(bound or "")
+        if match:
+            partitions.append((name, datetime.fromisoformat(match.group(1))))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def ensure_partitions(db: Session, table: str, months_ahead: int, now: Optional[datetime] = None) -> List[str]:
+    """Create the monthly partitions up to months_ahead months after the current one; returns the new names"""
+    now = now or datetime.utcnow()
+    partitions = list_partitions(db, table)
+    if not partitions:
+        return []  # Not partitioned (yet)
+
+    target = month_start(now)
+    for _ in range(months_ahead + 1):
+        target = next_month(target)
+
+    created = []
+    month = partitions[-1][1]
+    while month < target:
+        end = next_month(month)
+        name = partition_name(table, month)
+        db.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        ))
+        created.append(name)
+        month = end
+    db.commit()
+    return created
+
+
+def archive_partition(db: Session, partition: str, archive_dir: str) -> str:
+    """Write a partition's rows to <archive_dir>/<partition>.csv.gz (psycopg 3 COPY); returns the path"""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{partition}.csv.gz")
+    cursor = db.connection().connection.driver_connection.cursor()
+    with gzip.open(path + ".tmp", "wb") as archive:
+        with cursor.copy(f"COPY {partition} TO STDOUT WITH (FORMAT csv, HEADER)") as copy:
+            for chunk in copy:
+                archive.write(chunk)
+    # Only a complete archive gets the final name
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def drop_expired_partitions(
+    db: Session,
+    table: PartitionedTable,
+    archive_dir: Optional[str] = None,
+    dry_run: bool = False,
+    now: Optional[datetime] = None
+) -> List[str]:
+    """
+    Drop the partitions whose whole range is older than the retention period
+
+    A partition is archived (if archive_dir is set) and detached before it
+    is dropped, so readers of the parent table never see it half-removed.
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(days=table.retention_days)
+    expired = [name for name, upper in list_partitions(db, table.name) if upper <= cutoff]
+    if dry_run:
+        return expired
+
+    for name in expired:
+        if archive_dir:
+            path = archive_partition(db, name, archive_dir)
+            logger.info("log_partition_archived", table=table.name, partition=name, path=path)
+        db.execute(text(f"ALTER TABLE {table.name} DETACH PARTITION {name}"))
+        db.execute(text(f"DROP TABLE {name}"))
+        db.commit()
+        logger.info("log_partition_dropped", table=table.name, partition=name)
+    return expired
+
+
+def run_retention(db: Session, dry_run: bool = False) -> Optional[Dict[str, Dict[str, List[str]]]]:
+    """
+    Create upcoming partitions and drop expired ones for every partitioned table
+
+    Returns None without doing anything if another run holds the retention
+    lock. The lock is session-level on a connection of its own, because each
+    step commits (a transaction-level lock would be gone after the first one).
+    """
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        return {}
+
+    with bind.connect() as lock:
+        if not dry_run and not lock.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": RETENTION_LOCK_KEY}
+        ).scalar():
+            logger.info("log_retention_skipped", reason="another run holds the lock")
+            return None
+        try:
+            result = {}
+            for table in TABLES:
+                created = [] if dry_run else ensure_partitions(db, table.name, settings.LOG_PARTITIONS_AHEAD)
+                dropped = drop_expired_partitions(db, table, settings.LOG_ARCHIVE_DIR or None, dry_run)
+                result[table.name] = {"created": created, "dropped": dropped}
+            return result
+        finally:
+            if not dry_run:
+                lock.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": RETENTION_LOCK_KEY})
+
+
+class LogRetentionManager:
+    """Background task running run_retention() every interval seconds"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Optional[datetime] = None
+        self.last_result: Dict = {}
+        self.failed_runs = 0
+        self.skipped_runs = 0  # Another worker was already running retention
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                result = await asyncio.to_thread(self._run_once)
+                if result is None:
+                    self.skipped_runs += 1
+                else:
+                    self.last_result = result
+                    self.last_run = datetime.utcnow()
+            except Exception as e:
+                self.failed_runs += 1
+                logger.error("log_retention_failed", error=str(e))
+            await asyncio.sleep(self.interval)
+
+    @staticmethod
+    def _run_once() -> Optional[Dict]:
+        with session_scope() as db:
+            return run_retention(db)
+
+    def get_metrics(self) -> dict:
+        return {
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "last_result": self.last_result,
+            "failed_runs": self.failed_runs,
+            "skipped_runs": self.skipped_runs
+        }
+
+
+log_retention = LogRetentionManager(interval=settings.LOG_RETENTION_INTERVAL)
@@ -5,13 +5,17 @@ Handles pet egg generation, hatching, feeding, leveling, and equipment.
 """
 from typing import Dict, Optional, List
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, delete, update
+from bisect import bisect_right
+from itertools import accumulate
 import random
 from datetime import datetime
 
 from app.models.pet import Pet, PetSpecies, PetFocus, PetSet
-from app.models.inventory import SetType
+from app.models.inventory import InventoryItem, ItemType, SetType
 from app.models.player import Player
+from app.services.inventory_service import bump_inventory_version
+from app.services.loadout_service import invalidate_combat_profile, refresh_loadout_presets
 
 
 # Pet species generation weights (rarity)
@@ -52,11 +56,20 @@ FOCUS_STATS = {
     PetFocus.BALANCED: {"attack": 8, "defense": 8, "hp": 15},
 }
 
+MAX_PET_LEVEL = 100
+MAX_FEED_QUANTITY = 999
+
 # XP required per level (exponential growth)
 def calculate_xp_for_level(level: int) -> int:
     """Calculate XP required to reach the next level"""
     return int(100 * (1.5 ** (level - 1)))
 
+# Total XP needed to reach each level from level 1 with 0 XP: PET_XP_TOTALS[level - 1]
+PET_XP_TOTALS = tuple(accumulate(
+    (calculate_xp_for_level(level) for level in range(1, MAX_PET_LEVEL)),
+    initial=0
+))
+
 # Stat growth per level
 STAT_GROWTH = {
     PetFocus.ATTACK: {"attack": 3, "defense": 0.5, "hp": 2},
@@ -157,27 +170,100 @@ def feed_pet(db: Session, pet: Pet, xp_amount: int) -> Dict:
     if xp_amount <= 0:
         raise ValueError("XP amount must be positive")
 
-    pet.exp += xp_amount
-    levels_gained = 0
+    levels_gained = apply_pet_xp(pet, xp_amount)
 
-    # Check for level ups (can level up multiple times)
-    while pet.exp >= pet.exp_max and pet.level < 100:  # Max level 100
-        pet.exp -= pet.exp_max
-        pet.level += 1
-        levels_gained += 1
+    db.commit()
+    db.refresh(pet)
+    if levels_gained:
+        invalidate_combat_profile(pet.player_id)
+        refresh_loadout_presets(db, pet.player_id)
 
-        # Calculate stat increases
+    return _feed_result(pet, levels_gained)
+
+
+def apply_pet_xp(pet: Pet, xp_amount: int) -> int:
+    """
+    Add XP to a pet and apply any level ups. Returns the number of levels gained.
+
+    The new level is found in one lookup against PET_XP_TOTALS instead of
+    stepping through each level, so any amount of XP costs the same.
+    """
+    total = PET_XP_TOTALS[pet.level - 1] + pet.exp + xp_amount
+    new_level = max(pet.level, min(bisect_right(PET_XP_TOTALS, total), MAX_PET_LEVEL))
+    levels_gained = new_level - pet.level
+
+    # XP past the max level keeps accumulating, as before
+    pet.exp = total - PET_XP_TOTALS[new_level - 1]
+
+    if levels_gained:
+        # Stat growth is the same for every level, so it scales linearly
         growth = STAT_GROWTH[pet.focus]
-        pet.attack_bonus += int(growth["attack"])
-        pet.defense_bonus += int(growth["defense"])
-        pet.hp_bonus += int(growth["hp"])
+        pet.attack_bonus += int(growth["attack"]) * levels_gained
+        pet.defense_bonus += int(growth["defense"]) * levels_gained
+        pet.hp_bonus += int(growth["hp"]) * levels_gained
+        pet.level = new_level
+        pet.exp_max = calculate_xp_for_level(new_level)
+
+    return levels_gained
 
-        # Update XP requirement for next level
-        pet.exp_max = calculate_xp_for_level(pet.level)
+
+def feed_pet_food(db: Session, player: Player, pet: Pet, item_id: int, quantity: int) -> Dict:
+    """
+    Feed a pet several units of one pet food stack at once
+
+    The food is taken with a single conditional UPDATE (the emptied stack is
+    then deleted), and the pet and inventory change commit together.
+    """
+    if pet.is_egg:
+        raise ValueError("Cannot feed an unhatched egg")
+
+    if quantity < 1 or quantity > MAX_FEED_QUANTITY:
+        raise ValueError(f"Quantity must be between 1 and {MAX_FEED_QUANTITY}")
+
+    food = db.query(InventoryItem).filter(
+        InventoryItem.id == item_id,
+        InventoryItem.player_id == player.id,
+        InventoryItem.item_type == ItemType.CONSUMABLE
+    ).first()
+    pet_exp = (food.properties or {}).get("pet_exp") if food else None
+    if not pet_exp:
+        raise ValueError("Pet food not found in inventory")
+
+    food_name = food.name
+    remaining = db.execute(
+        update(InventoryItem)
+        .where(InventoryItem.id == food.id, InventoryItem.quantity >= quantity)
+        .values(quantity=InventoryItem.quantity - quantity)
+        .returning(InventoryItem.quantity)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+    if remaining is None:
+        db.rollback()
+        raise ValueError(f"Not enough {food_name} (need {quantity})")
+    if remaining == 0:
+        db.execute(
+            delete(InventoryItem)
+            .where(InventoryItem.id == food.id, InventoryItem.quantity == 0)
+            .execution_options(synchronize_session=False)
+        )
+
+    xp_amount = pet_exp * quantity
+    levels_gained = apply_pet_xp(pet, xp_amount)
+    bump_inventory_version(db, player.id)
 
     db.commit()
     db.refresh(pet)
+    if levels_gained:
+        invalidate_combat_profile(pet.player_id)
+        refresh_loadout_presets(db, pet.player_id)
+
+    result = _feed_result(pet, levels_gained)
+    result["xp_gained"] = xp_amount
+    result["food_remaining"] = remaining
+    return result
+
 
+def _feed_result(pet: Pet, levels_gained: int) -> Dict:
     return {
         "levels_gained": levels_gained,
         "new_level": pet.level,
@@ -243,6 +329,7 @@ def equip_pet(db: Session, player: Player, pet: Pet, set_type: SetType, slot: in
 
     db.commit()
     db.refresh(pet_set)
+    invalidate_combat_profile(player.id)
 
     return pet_set
 
@@ -264,6 +351,7 @@ def unequip_pet(db: Session, player: Player, set_type: SetType, slot: int) -> Pe
 
     db.commit()
     db.refresh(pet_set)
+    invalidate_combat_profile(player.id)
 
     return pet_set
 
@@ -281,6 +369,7 @@ def unequip_pet_from_all_slots(db: Session, player_id: int, pet_id: int):
             pet_set.pet_3_id = None
 
     db.commit()
+    invalidate_combat_profile(player_id)
 
 
 def calculate_pet_set_stats(pet_set: PetSet, db: Session) -> Dict[str, int]:
@@ -0,0 +1,139 @@
+"""
+Debounced presence updates
+
+Connect and disconnect handlers record joins and leaves here instead of
+broadcasting them. A background task collects the changes and, at most once
+per interval (PRESENCE_INTERVAL), sends one "presence_delta" event to each
+channel that changed:
+
+    {"type": "presence_delta", "channel": "tavern:1",
+     "joined": [{"user_id": 7, "username": "alice"}],
+     "left": [{"user_id": 9, "username": "bob"}],
+     "count": 42}
+
+A leave and a join of the same user within one interval cancel out, so a
+reconnect (or a deploy's wave of reconnects) produces no events at all.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+
+class ChannelChanges:
+    __slots__ = ("joined", "left")
+
+    def __init__(self):
+        self.joined: Dict[int, str] = {}
+        self.left: Dict[int, str] = {}
+
+
+class PresenceAggregator:
+    """
+    Per-channel join/leave buffer flushed as presence_delta events
+
+    deliver(channel, event) sends an event to a channel's members and
+    count(channel) returns its current size. after_flush, if given, runs
+    after every flush that had changes (e.g. to update a global count).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        deliver: Callable[[str, Dict], Awaitable],
+        count: Callable[[str], int],
+        interval: float,
+        after_flush: Optional[Callable[[], Awaitable]] = None
+    ):
+        self.name = name
+        self.deliver = deliver
+        self.count = count
+        self.interval = interval
+        self.after_flush = after_flush
+        self._pending: Dict[str, ChannelChanges] = {}
+        self._event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # Counters for get_metrics()
+        self.changes = 0
+        self.cancelled = 0
+        self.events_sent = 0
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def joined(self, channel: str, user_id: int, username: str):
+        changes = self._pending.setdefault(channel, ChannelChanges())
+        self.changes += 1
+        if changes.left.pop(user_id, None) is not None:
+            self.cancelled += 1
+        else:
+            changes.joined[user_id] = username
+        self._event.set()
+
+    def left(self, channel: str, user_id: int, username: str):
+        changes = self._pending.setdefault(channel, ChannelChanges())
+        self.changes += 1
+        if changes.joined.pop(user_id, None) is not None:
+            self.cancelled += 1
+        else:
+            changes.left[user_id] = username
+        self._event.set()
+
+    async def _run(self):
+        while True:
+            await self._event.wait()
+            # Changes arriving during the interval go out with this flush
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("presence_flush_failed", aggregator=self.name, error=str(e))
+
+    async def flush(self) -> int:
+        """Send one presence_delta per changed channel; returns the number of events sent"""
+        self._event.clear()
+        pending, self._pending = self._pending, {}
+
+        sent = 0
+        for channel, changes in pending.items():
+            if not changes.joined and not changes.left:
+                continue
+            await self.deliver(channel, {
+                "type": "presence_delta",
+                "channel": channel,
+                "joined": _users(changes.joined),
+                "left": _users(changes.left),
+                "count": self.count(channel)
+            })
+            sent += 1
+
+        self.events_sent += sent
+        if self.after_flush and pending:
+            await self.after_flush()
+        return sent
+
+    def get_metrics(self) -> dict:
+        return {
+            "pending_channels": len(self._pending),
+            "changes": self.changes,
+            "cancelled": self.cancelled,
+            "events_sent": self.events_sent
+        }
+
+
+def _users(users: Dict[int, str]) -> List[Dict]:
+    return [{"user_id": user_id, "username": username} for user_id, username in users.items()]
+
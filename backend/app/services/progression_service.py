@@ -8,6 +8,7 @@ import structlog
 import math
 
 from app.models.player import Player
+from app.services.loadout_service import invalidate_combat_profile
 
 logger = structlog.get_logger()
 
@@ -156,6 +157,9 @@ class ProgressionService:
             # Refill stamina on level up
             player.stamina = player.stamina_max
 
+            # Max HP scales with level
+            invalidate_combat_profile(player.id)
+
             logger.info(
                 "player_leveled_up",
                 player_id=player.id,
@@ -3,13 +3,25 @@ PVP Battle Manager - Real-Time Combat System
 Manages live PVP battles with turn-based combat and WebSocket updates
 """
 import asyncio
+import heapq
+import itertools
+import os
 import random
+import socket
+from array import array
 from typing import Dict, Optional, List, Tuple
 from datetime import datetime
 from enum import Enum
 import logging
 
+from sqlalchemy import exists, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.pvp import Duel, DuelStatus, PvPBattleSnapshot
 from app.services.websocket_manager import manager
+from app.websocket.registry import Connection, registry
 
 logger = logging.getLogger(__name__)
 
@@ -29,8 +41,54 @@ class ActionType(str, Enum):
     SPECIAL = "special"
 
 
+# Compact integer codes for actions stored in BattleState and its turn log
+ACTION_CODES = {ActionType.ATTACK: 1, ActionType.DEFEND: 2, ActionType.SPECIAL: 3}
+ACTIONS_BY_CODE = (None, ActionType.ATTACK, ActionType.DEFEND, ActionType.SPECIAL)
+
+# Turn log layout: one row of ints per turn in a flat array
+# (turn, p1_action, p2_action, p1_damage_dealt, p2_damage_dealt, p1_hp, p2_hp)
+LOG_FIELDS = 7
+MAX_LOG_TURNS = 50  # Older turns are overwritten once a battle runs longer than this
+
+# Turn timeouts
+DEFAULT_ACTION = ActionType.DEFEND  # Played for a player who misses the turn deadline
+MAX_MISSED_TURNS = 3  # Consecutive missed turns before a player forfeits
+BATTLE_CLEANUP_DELAY = 10  # Seconds a finished battle stays in memory for late reconnects
+
+# Registry topic prefix of live battles
+PVP_BATTLE = "pvp_battle"
+
+
+def battle_topic(battle_id: str) -> str:
+    return f"{PVP_BATTLE}:{battle_id}"
+
+
 class BattleState:
-    """Represents the state of an active PVP battle"""
+    """
+    Represents the state of an active PVP battle
+
+    Uses __slots__ and flat integer storage so thousands of concurrent duels
+    stay small: player stats are unpacked into attributes, actions are stored
+    as small int codes, and the turn log is a fixed-size ring buffer in an
+    array that is only turned into dicts when a client asks for history.
+    """
+
+    __slots__ = (
+        "duel_id", "battle_id",
+        "player1_id", "player2_id",
+        "player1_name", "player2_name",
+        "player1_level", "player2_level",
+        "player1_attack", "player2_attack",
+        "player1_defense", "player2_defense",
+        "player1_hp", "player2_hp",
+        "player1_max_hp", "player2_max_hp",
+        "phase", "current_turn",
+        "p1_action", "p2_action",
+        "p1_missed_turns", "p2_missed_turns",
+        "gold_stake", "winner_id",
+        "created_at", "started_at", "finished_at",
+        "_ready_mask", "_log", "_log_count",
+    )
 
     def __init__(self, duel_id: int, player1_id: int, player2_id: int,
                  player1_data: dict, player2_data: dict, gold_stake: int):
@@ -40,8 +98,14 @@ class BattleState:
         # Player data
         self.player1_id = player1_id
         self.player2_id = player2_id
-        self.player1_data = player1_data
-        self.player2_data = player2_data
+        self.player1_name = player1_data['username']
+        self.player2_name = player2_data['username']
+        self.player1_level = player1_data.get('level', 1)
+        self.player2_level = player2_data.get('level', 1)
+        self.player1_attack = player1_data['attack']
+        self.player2_attack = player2_data['attack']
+        self.player1_defense = player1_data['defense']
+        self.player2_defense = player2_data['defense']
 
         # Battle stats
         self.player1_hp = player1_data['max_hp']
@@ -49,19 +113,16 @@ class BattleState:
         self.player1_max_hp = player1_data['max_hp']
         self.player2_max_hp = player2_data['max_hp']
 
-        # Combat state
+        # Combat state (actions are ACTION_CODES values, 0 = not submitted)
         self.phase = BattlePhase.WAITING
         self.current_turn = 1
-        self.turn_actions: Dict[int, Optional[ActionType]] = {
-            player1_id: None,
-            player2_id: None
-        }
+        self.p1_action = 0
+        self.p2_action = 0
+        self.p1_missed_turns = 0
+        self.p2_missed_turns = 0
 
         # Stakes
         self.gold_stake = gold_stake
-
-        # Battle log
-        self.battle_log: List[dict] = []
         self.winner_id: Optional[int] = None
 
         # Timing
@@ -69,12 +130,40 @@ class BattleState:
         self.started_at: Optional[datetime] = None
         self.finished_at: Optional[datetime] = None
 
-        # Readiness
-        self.players_ready = set()
+        # Readiness (bit 1 = player 1, bit 2 = player 2)
+        self._ready_mask = 0
+
+        # Turn log ring buffer, allocated on the first resolved turn
+        self._log: Optional[array] = None
+        self._log_count = 0
+
+    @property
+    def player1_data(self) -> dict:
+        """Player 1 stats in the dict shape used by the API"""
+        return {
+            'id': self.player1_id,
+            'username': self.player1_name,
+            'level': self.player1_level,
+            'attack': self.player1_attack,
+            'defense': self.player1_defense,
+            'max_hp': self.player1_max_hp
+        }
+
+    @property
+    def player2_data(self) -> dict:
+        """Player 2 stats in the dict shape used by the API"""
+        return {
+            'id': self.player2_id,
+            'username': self.player2_name,
+            'level': self.player2_level,
+            'attack': self.player2_attack,
+            'defense': self.player2_defense,
+            'max_hp': self.player2_max_hp
+        }
 
     def is_player_in_battle(self, player_id: int) -> bool:
         """Check if player is in this battle"""
-        return player_id in [self.player1_id, self.player2_id]
+        return player_id == self.player1_id or player_id == self.player2_id
 
     def get_opponent_id(self, player_id: int) -> Optional[int]:
         """Get opponent's player ID"""
@@ -92,24 +181,171 @@ class BattleState:
             return (self.player2_hp, self.player2_max_hp)
         return (0, 0)
 
+    @property
+    def ready_count(self) -> int:
+        """Number of players marked ready"""
+        return bin(self._ready_mask).count("1")
+
     def mark_ready(self, player_id: int):
         """Mark player as ready"""
-        self.players_ready.add(player_id)
-        if len(self.players_ready) == 2:
+        if player_id == self.player1_id:
+            self._ready_mask |= 1
+        elif player_id == self.player2_id:
+            self._ready_mask |= 2
+        if self._ready_mask == 3:
             self.phase = BattlePhase.READY
 
     def set_action(self, player_id: int, action: ActionType):
         """Set player's action for current turn"""
-        self.turn_actions[player_id] = action
+        if player_id == self.player1_id:
+            self.p1_action = ACTION_CODES[action]
+        elif player_id == self.player2_id:
+            self.p2_action = ACTION_CODES[action]
+
+    def get_actions(self) -> Tuple[Optional[ActionType], Optional[ActionType]]:
+        """Get (player 1, player 2) actions for the current turn"""
+        return ACTIONS_BY_CODE[self.p1_action], ACTIONS_BY_CODE[self.p2_action]
 
     def are_actions_submitted(self) -> bool:
         """Check if both players submitted actions"""
-        return all(action is not None for action in self.turn_actions.values())
+        return bool(self.p1_action and self.p2_action)
 
     def clear_turn_actions(self):
         """Clear actions for next turn"""
-        for player_id in self.turn_actions:
-            self.turn_actions[player_id] = None
+        self.p1_action = 0
+        self.p2_action = 0
+
+    def record_turn(self, p1_damage_dealt: int, p2_damage_dealt: int):
+        """Append the current turn to the log, overwriting the oldest turn when full"""
+        if self._log is None:
+            self._log = array('i', bytes(4 * LOG_FIELDS * MAX_LOG_TURNS))
+
+        offset = (self._log_count % MAX_LOG_TURNS) * LOG_FIELDS
+        self._log[offset:offset + LOG_FIELDS] = array('i', (
+            self.current_turn, self.p1_action, self.p2_action,
+            p1_damage_dealt, p2_damage_dealt, self.player1_hp, self.player2_hp
+        ))
+        self._log_count += 1
+
+    def _log_rows(self) -> List[List[int]]:
+        """Logged turns as raw int rows, oldest first"""
+        if self._log is None:
+            return []
+
+        stored = min(self._log_count, MAX_LOG_TURNS)
+        first = self._log_count - stored
+        rows = []
+        for i in range(first, self._log_count):
+            offset = (i % MAX_LOG_TURNS) * LOG_FIELDS
+            rows.append(self._log[offset:offset + LOG_FIELDS].tolist())
+        return rows
+
+    @property
+    def battle_log(self) -> List[dict]:
+        """Turn log serialized for clients (built on demand)"""
+        return [
+            {
+                "turn": turn,
+                "p1_action": ACTIONS_BY_CODE[p1_action].value,
+                "p2_action": ACTIONS_BY_CODE[p2_action].value,
+                "p1_damage_dealt": p1_damage_dealt,
+                "p2_damage_dealt": p2_damage_dealt,
+                "p1_hp": p1_hp,
+                "p2_hp": p2_hp
+            }
+            for turn, p1_action, p2_action, p1_damage_dealt, p2_damage_dealt, p1_hp, p2_hp in self._log_rows()
+        ]
+
+    def to_snapshot(self) -> dict:
+        """Serialize battle state to a JSON-safe dict for persistence"""
+        return {
+            "battle_id": self.battle_id,
+            "duel_id": self.duel_id,
+            "player1_id": self.player1_id,
+            "player2_id": self.player2_id,
+            "player1_data": self.player1_data,
+            "player2_data": self.player2_data,
+            "player1_hp": self.player1_hp,
+            "player2_hp": self.player2_hp,
+            "phase": self.phase.value,
+            "turn": self.current_turn,
+            "actions": [self.p1_action, self.p2_action],
+            "missed_turns": [self.p1_missed_turns, self.p2_missed_turns],
+            "gold_stake": self.gold_stake,
+            "log": self._log_rows(),
+            "winner_id": self.winner_id,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "ready_mask": self._ready_mask
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict) -> "BattleState":
+        """
+        Rebuild battle state from a dict produced by to_snapshot()
+        Also reads snapshots written before the slotted layout (battle_log,
+        turn_actions and players_ready instead of log, actions and ready_mask)
+        """
+        if "log" not in snapshot:
+            snapshot = cls._upgrade_snapshot(snapshot)
+
+        battle = cls(
+            duel_id=snapshot["duel_id"],
+            player1_id=snapshot["player1_id"],
+            player2_id=snapshot["player2_id"],
+            player1_data=snapshot["player1_data"],
+            player2_data=snapshot["player2_data"],
+            gold_stake=snapshot["gold_stake"]
+        )
+        battle.battle_id = snapshot["battle_id"]
+        battle.phase = BattlePhase(snapshot["phase"])
+        battle.winner_id = snapshot["winner_id"]
+        battle.created_at = datetime.fromisoformat(snapshot["created_at"])
+        if snapshot["started_at"]:
+            battle.started_at = datetime.fromisoformat(snapshot["started_at"])
+        if snapshot["finished_at"]:
+            battle.finished_at = datetime.fromisoformat(snapshot["finished_at"])
+        battle._ready_mask = snapshot["ready_mask"]
+
+        # Replay the log through record_turn so the ring buffer is rebuilt as-is
+        for turn, p1_action, p2_action, p1_damage_dealt, p2_damage_dealt, p1_hp, p2_hp in snapshot["log"]:
+            battle.current_turn = turn
+            battle.p1_action, battle.p2_action = p1_action, p2_action
+            battle.player1_hp, battle.player2_hp = p1_hp, p2_hp
+            battle.record_turn(p1_damage_dealt, p2_damage_dealt)
+
+        battle.player1_hp = snapshot["player1_hp"]
+        battle.player2_hp = snapshot["player2_hp"]
+        battle.current_turn = snapshot["turn"]
+        battle.p1_action, battle.p2_action = snapshot["actions"]
+        battle.p1_missed_turns, battle.p2_missed_turns = snapshot.get("missed_turns", (0, 0))
+        return battle
+
+    @staticmethod
+    def _upgrade_snapshot(snapshot: dict) -> dict:
+        """Convert a snapshot in the old dict-based layout to the current one"""
+        def code(action: Optional[str]) -> int:
+            return ACTION_CODES[ActionType(action)] if action else 0
+
+        player1_id, player2_id = snapshot["player1_id"], snapshot["player2_id"]
+        turn_actions = snapshot.get("turn_actions") or {}
+        players_ready = snapshot.get("players_ready") or []
+
+        upgraded = dict(snapshot)
+        upgraded["actions"] = [
+            code(turn_actions.get(str(player1_id))),
+            code(turn_actions.get(str(player2_id)))
+        ]
+        upgraded["ready_mask"] = (1 if player1_id in players_ready else 0) | (2 if player2_id in players_ready else 0)
+        upgraded["log"] = [
+            [
+                entry["turn"], code(entry["p1_action"]), code(entry["p2_action"]),
+                entry["p1_damage_dealt"], entry["p2_damage_dealt"], entry["p1_hp"], entry["p2_hp"]
+            ]
+            for entry in snapshot.get("battle_log") or []
+        ]
+        return upgraded
 
 
 class PvPBattleManager:
@@ -122,16 +358,449 @@ class PvPBattleManager:
         # Player to battle mapping: {player_id: battle_id}
         self.player_battles: Dict[int, str] = {}
 
-        # WebSocket connections for battle players: {battle_id: {player_id: websocket}}
-        self.battle_connections: Dict[str, Dict[int, any]] = {}
+        # Name stamped on the snapshots this worker writes (reset in start(), after any fork)
+        # A battle belongs to the worker that wrote its snapshot last
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        # Players' connections are subscribed to the registry topic battle_topic(battle_id)
+        registry.watch(PVP_BATTLE, left=self._connection_left)
 
         # Lock for thread safety
         self._lock = asyncio.Lock()
 
+        # Timers: heap of (deadline, seq, kind, battle_id, token) served by one task
+        # Stale entries (battle gone, turn already resolved) are skipped when popped
+        self._timers: List[Tuple[float, int, str, Optional[str], int]] = []
+        self._timer_seq = itertools.count()
+        self._timer_wakeup = asyncio.Event()
+        self._timer_task: Optional[asyncio.Task] = None
+
+        # Counters for get_metrics()
+        self.turns_timed_out = 0
+        self.battles_reaped = 0
+        self.duels_expired = 0
+
+        # Snapshots waiting to be written: {battle_id: snapshot dict, or None to delete}
+        # Only the latest state per battle is kept, so a busy battle costs one row write per flush
+        self._pending_snapshots: Dict[str, Optional[dict]] = {}
+        self._snapshot_event = asyncio.Event()
+        self._snapshot_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """
+        Start the background snapshot writer and the timer task
+        Battles are not restored here: every worker would adopt every live
+        battle and run its timers with nobody connected. A battle is restored
+        by the worker its players reconnect to (restore_battle).
+        """
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        if self._snapshot_task is None:
+            self._snapshot_task = asyncio.create_task(self._snapshot_writer())
+        if self._timer_task is None:
+            self._schedule(settings.PVP_DUEL_EXPIRY_SWEEP_INTERVAL, "expire_duels")
+            self._timer_task = asyncio.create_task(self._timer_loop())
+
+    async def stop(self):
+        """Stop background tasks and flush whatever snapshots are still pending"""
+        if self._timer_task:
+            self._timer_task.cancel()
+            try:
+                await self._timer_task
+            except asyncio.CancelledError:
+                pass
+            self._timer_task = None
+
+        if self._snapshot_task:
+            self._snapshot_task.cancel()
+            try:
+                await self._snapshot_task
+            except asyncio.CancelledError:
+                pass
+            self._snapshot_task = None
+        await self.flush_snapshots()
+
+    def _register_battle(self, battle: BattleState):
+        """Add battle to the in-memory indexes"""
+        self.active_battles[battle.battle_id] = battle
+        self.player_battles[battle.player1_id] = battle.battle_id
+        self.player_battles[battle.player2_id] = battle.battle_id
+
+    def _schedule(self, delay: float, kind: str, battle_id: Optional[str] = None, token: int = 0):
+        """Arm a timer; the timer task is only woken if this is the new earliest deadline"""
+        deadline = asyncio.get_running_loop().time() + delay
+        heapq.heappush(self._timers, (deadline, next(self._timer_seq), kind, battle_id, token))
+        if self._timers[0][0] == deadline:
+            self._timer_wakeup.set()
+
+    async def _timer_loop(self):
+        """Single task that fires turn deadlines, reaps idle battles and expires challenges"""
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = self._timers[0][0] - loop.time() if self._timers else None
+            if delay is None or delay > 0:
+                self._timer_wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._timer_wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, kind, battle_id, token = heapq.heappop(self._timers)
+            try:
+                await self._fire_timer(kind, battle_id, token)
+            except Exception as e:
+                logger.error(f"PVP timer {kind} failed for battle {battle_id}: {e}")
+
+    async def _fire_timer(self, kind: str, battle_id: Optional[str], token: int):
+        """Handle an expired timer, ignoring it if the battle has moved on"""
+        if kind == "expire_duels":
+            self._schedule(settings.PVP_DUEL_EXPIRY_SWEEP_INTERVAL, "expire_duels")
+            await self.expire_pending_duels()
+            await self.prune_snapshots()
+            return
+
+        battle = self.active_battles.get(battle_id)
+        if not battle:
+            return
+
+        if kind == "cleanup":
+            await self.cleanup_battle(battle_id)
+        elif battle.phase == BattlePhase.FINISHED:
+            return
+        elif kind == "turn":
+            # Without local players the battle is either played elsewhere or up to the abandon timer
+            if (battle.phase == BattlePhase.COMBAT and battle.current_turn == token
+                    and registry.count(battle_topic(battle_id))):
+                await self.timeout_turn(battle_id)
+        elif kind == "ready":
+            if battle.phase == BattlePhase.WAITING:
+                await self.reap_battle(battle_id, "Opponent never got ready")
+        elif kind == "abandon":
+            if not registry.count(battle_topic(battle_id)):
+                await self.reap_battle(battle_id, "Battle abandoned")
+
+    async def timeout_turn(self, battle_id: str):
+        """
+        Resolve a turn whose deadline passed
+        Missing actions default to DEFEND; a player who misses MAX_MISSED_TURNS
+        turns in a row forfeits, and if both do the battle is cancelled
+        """
+        battle = await self.get_battle(battle_id)
+        if not battle:
+            return
+
+        turn = battle.current_turn
+        p1_action, p2_action = battle.get_actions()
+        battle.p1_missed_turns = 0 if p1_action else battle.p1_missed_turns + 1
+        battle.p2_missed_turns = 0 if p2_action else battle.p2_missed_turns + 1
+        self.turns_timed_out += 1
+
+        p1_gone = battle.p1_missed_turns >= MAX_MISSED_TURNS
+        p2_gone = battle.p2_missed_turns >= MAX_MISSED_TURNS
+        if p1_gone and p2_gone:
+            await self.reap_battle(battle_id, "Both players stopped responding")
+            return
+        if p1_gone or p2_gone:
+            await self.forfeit_battle(battle_id, battle.player1_id if p1_gone else battle.player2_id)
+            return
+
+        missing = []
+        if not p1_action:
+            battle.set_action(battle.player1_id, DEFAULT_ACTION)
+            missing.append(battle.player1_id)
+        if not p2_action:
+            battle.set_action(battle.player2_id, DEFAULT_ACTION)
+            missing.append(battle.player2_id)
+
+        await self.broadcast_to_battle(battle_id, {
+            "type": "turn_timeout",
+            "turn": turn,
+            "defaulted_player_ids": missing,
+            "default_action": DEFAULT_ACTION.value
+        })
+
+        # A late submit_action during the broadcast may already have resolved this turn
+        await self.resolve_turn(battle_id, turn)
+
+    async def reap_battle(self, battle_id: str, reason: str):
+        """
+        Cancel a battle nobody is playing: no winner, no gold moves, duel marked cancelled
+        The duel is only cancelled if this worker owns the battle. Otherwise the
+        battle is being played on another worker and only the local copy is dropped.
+        """
+        battle = await self.get_battle(battle_id)
+        if not battle or battle.phase == BattlePhase.FINISHED:
+            return
+
+        # Make sure our own claim on the battle is on disk before checking ownership
+        await self.flush_snapshots()
+        try:
+            cancelled = await asyncio.to_thread(self._cancel_duel, battle.duel_id, battle_id, self.worker_id)
+        except Exception as e:
+            logger.error(f"Failed to cancel duel {battle.duel_id} for reaped battle {battle_id}: {e}")
+            cancelled = False
+
+        if not cancelled:
+            logger.info(f"Dropping local copy of PVP battle {battle_id}: not owned by this worker")
+            await self.cleanup_battle(battle_id, remove_snapshot=False)
+            return
+
+        battle.phase = BattlePhase.FINISHED
+        battle.finished_at = datetime.utcnow()
+        battle.winner_id = None
+        self.battles_reaped += 1
+
+        logger.info(f"Reaping PVP battle {battle_id}: {reason}")
+
+        await self.broadcast_to_battle(battle_id, {
+            "type": "battle_cancelled",
+            "reason": reason
+        })
+
+        await self.cleanup_battle(battle_id)
+
+    @staticmethod
+    def _cancel_duel(duel_id: int, battle_id: str, owner: str) -> bool:
+        """
+        Mark a duel whose battle was reaped as cancelled (runs in a worker thread)
+        Skipped if another worker has written the battle's snapshot since this one did
+        """
+        db = SessionLocal()
+        try:
+            owned_elsewhere = exists().where(
+                PvPBattleSnapshot.battle_id == battle_id,
+                PvPBattleSnapshot.owner != owner
+            )
+            cancelled = db.query(Duel).filter(
+                Duel.id == duel_id,
+                Duel.status.in_([DuelStatus.ACCEPTED, DuelStatus.IN_PROGRESS]),
+                ~owned_elsewhere
+            ).update({
+                Duel.status: DuelStatus.CANCELLED,
+                Duel.completed_at: datetime.utcnow()
+            }, synchronize_session=False)
+            db.commit()
+            return bool(cancelled)
+        finally:
+            db.close()
+
+    async def expire_pending_duels(self) -> int:
+        """Expire all pending challenges past expires_at in one statement and notify both sides"""
+        try:
+            expired = await asyncio.to_thread(self._expire_pending_duels)
+        except Exception as e:
+            logger.error(f"Failed to expire pending duels: {e}")
+            return 0
+
+        for duel_id, challenger_id, defender_id in expired:
+            await manager.notify_challenge_expired(challenger_id, duel_id)
+            await manager.notify_challenge_expired(defender_id, duel_id)
+
+        if expired:
+            self.duels_expired += len(expired)
+            logger.info(f"Expired {len(expired)} pending duel challenges")
+        return len(expired)
+
+    @staticmethod
+    def _expire_pending_duels() -> List[Tuple[int, int, int]]:
+        """UPDATE ... RETURNING for every overdue pending duel (runs in a worker thread)"""
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                update(Duel)
+                .where(
+                    Duel.status == DuelStatus.PENDING,
+                    Duel.expires_at < datetime.utcnow()
+                )
+                .values(status=DuelStatus.EXPIRED)
+                .returning(Duel.id, Duel.challenger_id, Duel.defender_id)
+                .execution_options(synchronize_session=False)
+            ).all()
+            db.commit()
+            return [tuple(row) for row in rows]
+        finally:
+            db.close()
+
+    def get_metrics(self) -> dict:
+        """Live battle counts and timer/reaper counters"""
+        phases = {phase.value: 0 for phase in BattlePhase}
+        for battle in self.active_battles.values():
+            phases[battle.phase.value] += 1
+
+        return {
+            "live_battles": len(self.active_battles),
+            "battles_by_phase": phases,
+            "connected_players": sum(registry.topics_under(PVP_BATTLE).values()),
+            "scheduled_timers": len(self._timers),
+            "pending_snapshots": len(self._pending_snapshots),
+            "turns_timed_out": self.turns_timed_out,
+            "battles_reaped": self.battles_reaped,
+            "duels_expired": self.duels_expired
+        }
+
+    def _queue_snapshot(self, battle: BattleState):
+        """Schedule the battle's current state to be persisted"""
+        self._pending_snapshots[battle.battle_id] = battle.to_snapshot()
+        self._snapshot_event.set()
+
+    def _queue_snapshot_removal(self, battle_id: str):
+        """Schedule the battle's snapshot to be deleted"""
+        self._pending_snapshots[battle_id] = None
+        self._snapshot_event.set()
+
+    async def _snapshot_writer(self):
+        """Background task that batches snapshot writes off the request path"""
+        while True:
+            await self._snapshot_event.wait()
+            # Give a few more turns a chance to coalesce into this write
+            await asyncio.sleep(settings.PVP_SNAPSHOT_FLUSH_INTERVAL)
+            await self.flush_snapshots()
+
+    async def flush_snapshots(self):
+        """Write all pending snapshots in one transaction"""
+        self._snapshot_event.clear()
+        if not self._pending_snapshots:
+            return
+
+        batch, self._pending_snapshots = self._pending_snapshots, {}
+        try:
+            await asyncio.to_thread(self._write_snapshots, batch, self.worker_id)
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} PVP battle snapshots: {e}")
+            # Retry on the next flush unless a newer state was queued meanwhile
+            for battle_id, snapshot in batch.items():
+                self._pending_snapshots.setdefault(battle_id, snapshot)
+            self._snapshot_event.set()
+
+    @staticmethod
+    def _write_snapshots(batch: Dict[str, Optional[dict]], owner: str):
+        """Upsert/delete snapshot rows, stamped with the writing worker (runs in a worker thread)"""
+        now = datetime.utcnow()
+        rows = [
+            {
+                "battle_id": battle_id,
+                "duel_id": snapshot["duel_id"],
+                "turn": snapshot["turn"],
+                "state": snapshot,
+                "owner": owner,
+                "updated_at": now
+            }
+            for battle_id, snapshot in batch.items() if snapshot is not None
+        ]
+        removed = [battle_id for battle_id, snapshot in batch.items() if snapshot is None]
+
+        db = SessionLocal()
+        try:
+            if rows:
+                stmt = pg_insert(PvPBattleSnapshot).values(rows)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[PvPBattleSnapshot.battle_id],
+                    set_={
+                        "turn": stmt.excluded.turn,
+                        "state": stmt.excluded.state,
+                        "owner": stmt.excluded.owner,
+                        "updated_at": stmt.excluded.updated_at
+                    }
+                )
+                db.execute(stmt)
+            if removed:
+                db.query(PvPBattleSnapshot).filter(
+                    PvPBattleSnapshot.battle_id.in_(removed)
+                ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _load_snapshot(battle_id: str) -> Optional[dict]:
+        """Load a battle's snapshot if its duel is still in progress (runs in a worker thread)"""
+        db = SessionLocal()
+        try:
+            row = db.query(PvPBattleSnapshot.state).join(
+                Duel, Duel.id == PvPBattleSnapshot.duel_id
+            ).filter(
+                PvPBattleSnapshot.battle_id == battle_id,
+                Duel.status == DuelStatus.IN_PROGRESS,
+                Duel.battle_id == PvPBattleSnapshot.battle_id
+            ).first()
+            return row.state if row else None
+        finally:
+            db.close()
+
+    async def prune_snapshots(self):
+        """Delete snapshots whose duel has been settled (left behind by a worker that stopped)"""
+        try:
+            pruned = await asyncio.to_thread(self._prune_snapshots)
+        except Exception as e:
+            logger.error(f"Failed to prune PVP battle snapshots: {e}")
+            return
+        if pruned:
+            logger.info(f"Pruned {pruned} stale PVP battle snapshots")
+
+    @staticmethod
+    def _prune_snapshots() -> int:
+        """DELETE snapshots of duels that are no longer in progress (runs in a worker thread)"""
+        db = SessionLocal()
+        try:
+            live = exists().where(
+                Duel.id == PvPBattleSnapshot.duel_id,
+                Duel.status == DuelStatus.IN_PROGRESS,
+                Duel.battle_id == PvPBattleSnapshot.battle_id
+            )
+            pruned = db.query(PvPBattleSnapshot).filter(~live).delete(synchronize_session=False)
+            db.commit()
+            return pruned
+        finally:
+            db.close()
+
+    def _adopt_restored(self, battle: BattleState):
+        """Register a battle rebuilt from a snapshot and arm its timers"""
+        self._register_battle(battle)
+
+        if battle.phase == BattlePhase.FINISHED:
+            # The worker that ended it never got to clean up
+            self._schedule(BATTLE_CLEANUP_DELAY, "cleanup", battle.battle_id)
+        else:
+            # Cancelled unless the reconnecting player actually subscribes
+            self._schedule(settings.PVP_ABANDON_TIMEOUT, "abandon", battle.battle_id)
+            if battle.phase == BattlePhase.COMBAT:
+                self._schedule(settings.PVP_TURN_TIMEOUT, "turn", battle.battle_id, battle.current_turn)
+            else:
+                self._schedule(settings.PVP_READY_TIMEOUT, "ready", battle.battle_id)
+
+    async def restore_battle(self, battle_id: str) -> Optional[BattleState]:
+        """Rehydrate a single battle from its snapshot, if one exists"""
+        try:
+            snapshot = await asyncio.to_thread(self._load_snapshot, battle_id)
+        except Exception as e:
+            logger.error(f"Failed to load snapshot for battle {battle_id}: {e}")
+            return None
+
+        if not snapshot:
+            return None
+
+        try:
+            restored = BattleState.from_snapshot(snapshot)
+        except Exception as e:
+            logger.error(f"Unreadable snapshot for battle {battle_id}: {e}")
+            return None
+
+        async with self._lock:
+            battle = self.active_battles.get(battle_id)
+            if not battle:
+                battle = restored
+                self._adopt_restored(battle)
+                logger.info(f"Restored battle {battle_id} from snapshot at turn {battle.current_turn}")
+            return battle
+
     async def create_battle(self, duel_id: int, player1_id: int, player2_id: int,
-                           player1_data: dict, player2_data: dict, gold_stake: int) -> BattleState:
-        """Create a new PVP battle"""
+                           player1_data: dict, player2_data: dict, gold_stake: int,
+                           battle_id: Optional[str] = None) -> BattleState:
+        """Create a new PVP battle (battle_id reuses the ID already stored on the duel)"""
         async with self._lock:
+            if battle_id and battle_id in self.active_battles:
+                return self.active_battles[battle_id]
+
             battle = BattleState(
                 duel_id=duel_id,
                 player1_id=player1_id,
@@ -140,10 +809,12 @@ class PvPBattleManager:
                 player2_data=player2_data,
                 gold_stake=gold_stake
             )
+            if battle_id:
+                battle.battle_id = battle_id
 
-            self.active_battles[battle.battle_id] = battle
-            self.player_battles[player1_id] = battle.battle_id
-            self.player_battles[player2_id] = battle.battle_id
+            self._register_battle(battle)
+            self._queue_snapshot(battle)
+            self._schedule(settings.PVP_READY_TIMEOUT, "ready", battle.battle_id)
 
             logger.info(f"Created PVP battle {battle.battle_id} for duel {duel_id}")
 
@@ -160,20 +831,30 @@ class PvPBattleManager:
             return self.active_battles.get(battle_id)
         return None
 
-    async def register_connection(self, battle_id: str, player_id: int, websocket):
-        """Register WebSocket connection for a player in battle"""
-        if battle_id not in self.battle_connections:
-            self.battle_connections[battle_id] = {}
-        self.battle_connections[battle_id][player_id] = websocket
-        logger.info(f"Registered connection for player {player_id} in battle {battle_id}")
-
-    async def unregister_connection(self, battle_id: str, player_id: int):
-        """Unregister WebSocket connection for a player"""
-        if battle_id in self.battle_connections:
-            self.battle_connections[battle_id].pop(player_id, None)
-            if not self.battle_connections[battle_id]:
-                del self.battle_connections[battle_id]
-        logger.info(f"Unregistered connection for player {player_id} from battle {battle_id}")
+    async def register_connection(self, battle_id: str, connection: Connection):
+        """Subscribe a player's connection to the battle, replacing any earlier one of theirs"""
+        topic = battle_topic(battle_id)
+        for previous in registry.player_connections(connection.player_id, topic):
+            if previous is not connection:
+                registry.unsubscribe(previous, topic)
+        registry.subscribe(connection, topic)
+        logger.info(f"Registered connection for player {connection.player_id} in battle {battle_id}")
+
+        # The battle is played here now: claim it so other workers' copies cannot cancel it
+        battle = self.active_battles.get(battle_id)
+        if battle:
+            self._queue_snapshot(battle)
+
+    async def unregister_connection(self, battle_id: str, connection: Connection):
+        """Unsubscribe a player's connection from the battle"""
+        if registry.unsubscribe(connection, battle_topic(battle_id)):
+            logger.info(f"Unregistered connection for player {connection.player_id} from battle {battle_id}")
+
+    def _connection_left(self, connection: Connection, topic: str):
+        """Registry hook: the last player left - cancel the battle unless someone comes back"""
+        battle_id = topic.split(":", 1)[1]
+        if not registry.count(topic) and battle_id in self.active_battles:
+            self._schedule(settings.PVP_ABANDON_TIMEOUT, "abandon", battle_id)
 
     async def mark_player_ready(self, battle_id: str, player_id: int):
         """Mark player as ready to fight"""
@@ -182,12 +863,13 @@ class PvPBattleManager:
             return False
 
         battle.mark_ready(player_id)
+        self._queue_snapshot(battle)
 
         # Notify both players
         await self.broadcast_to_battle(battle_id, {
             "type": "player_ready",
             "player_id": player_id,
-            "ready_count": len(battle.players_ready),
+            "ready_count": battle.ready_count,
             "total_players": 2
         })
 
@@ -205,6 +887,8 @@ class PvPBattleManager:
 
         battle.phase = BattlePhase.COMBAT
         battle.started_at = datetime.utcnow()
+        self._queue_snapshot(battle)
+        self._schedule(settings.PVP_TURN_TIMEOUT, "turn", battle_id, battle.current_turn)
 
         logger.info(f"Starting PVP battle {battle_id}")
 
@@ -214,19 +898,19 @@ class PvPBattleManager:
             "turn": battle.current_turn,
             "player1": {
                 "id": battle.player1_id,
-                "name": battle.player1_data['username'],
+                "name": battle.player1_name,
                 "hp": battle.player1_hp,
                 "max_hp": battle.player1_max_hp,
-                "attack": battle.player1_data['attack'],
-                "defense": battle.player1_data['defense']
+                "attack": battle.player1_attack,
+                "defense": battle.player1_defense
             },
             "player2": {
                 "id": battle.player2_id,
-                "name": battle.player2_data['username'],
+                "name": battle.player2_name,
                 "hp": battle.player2_hp,
                 "max_hp": battle.player2_max_hp,
-                "attack": battle.player2_data['attack'],
-                "defense": battle.player2_data['defense']
+                "attack": battle.player2_attack,
+                "defense": battle.player2_defense
             },
             "gold_stake": battle.gold_stake
         })
@@ -241,37 +925,43 @@ class PvPBattleManager:
             return False
 
         # Set action
+        turn = battle.current_turn
         battle.set_action(player_id, action)
+        if player_id == battle.player1_id:
+            battle.p1_missed_turns = 0
+        else:
+            battle.p2_missed_turns = 0
+        self._queue_snapshot(battle)
 
         # Notify that player submitted action
         opponent_id = battle.get_opponent_id(player_id)
         if opponent_id:
-            connections = self.battle_connections.get(battle_id, {})
-            opponent_ws = connections.get(opponent_id)
-            if opponent_ws:
-                try:
-                    await opponent_ws.send_json({
-                        "type": "opponent_action_submitted",
-                        "turn": battle.current_turn
-                    })
-                except Exception as e:
-                    logger.error(f"Failed to notify opponent {opponent_id}: {e}")
-
-        # If both submitted, resolve turn
+            await registry.send_to_player(opponent_id, {
+                "type": "opponent_action_submitted",
+                "battle_id": battle_id,
+                "turn": turn
+            }, battle_topic(battle_id))
+
+        # If both submitted, resolve turn (unless the turn timer got there during the send)
         if battle.are_actions_submitted():
-            await self.resolve_turn(battle_id)
+            await self.resolve_turn(battle_id, turn)
 
         return True
 
-    async def resolve_turn(self, battle_id: str):
-        """Resolve combat turn"""
+    async def resolve_turn(self, battle_id: str, turn: int):
+        """
+        Resolve combat turn
+        Does nothing unless turn is still the battle's current turn. The turn is
+        advanced (or the battle finished) before the first await, so a timeout
+        and a late action racing each other cannot resolve the same turn twice.
+        """
         battle = await self.get_battle(battle_id)
-        if not battle:
+        if (not battle or battle.phase != BattlePhase.COMBAT
+                or battle.current_turn != turn or not battle.are_actions_submitted()):
             return
 
         # Get actions
-        p1_action = battle.turn_actions[battle.player1_id]
-        p2_action = battle.turn_actions[battle.player2_id]
+        p1_action, p2_action = battle.get_actions()
 
         # Calculate damage
         turn_result = self.calculate_turn_result(battle, p1_action, p2_action)
@@ -281,20 +971,22 @@ class PvPBattleManager:
         battle.player2_hp = max(0, battle.player2_hp - turn_result['p2_damage_taken'])
 
         # Add to battle log
-        battle.battle_log.append({
-            "turn": battle.current_turn,
-            "p1_action": p1_action.value,
-            "p2_action": p2_action.value,
-            "p1_damage_dealt": turn_result['p1_damage_dealt'],
-            "p2_damage_dealt": turn_result['p2_damage_dealt'],
-            "p1_hp": battle.player1_hp,
-            "p2_hp": battle.player2_hp
-        })
+        battle.record_turn(turn_result['p1_damage_dealt'], turn_result['p2_damage_dealt'])
+
+        # Close the turn before anything awaits
+        battle.clear_turn_actions()
+        battle_over = battle.player1_hp <= 0 or battle.player2_hp <= 0
+        if battle_over:
+            battle.phase = BattlePhase.FINISHED
+        else:
+            battle.current_turn += 1
+            self._queue_snapshot(battle)
+            self._schedule(settings.PVP_TURN_TIMEOUT, "turn", battle_id, battle.current_turn)
 
         # Broadcast turn result
         await self.broadcast_to_battle(battle_id, {
             "type": "turn_result",
-            "turn": battle.current_turn,
+            "turn": turn,
             "actions": {
                 battle.player1_id: p1_action.value,
                 battle.player2_id: p2_action.value
@@ -311,26 +1003,22 @@ class PvPBattleManager:
         })
 
         # Check for winner
-        if battle.player1_hp <= 0 or battle.player2_hp <= 0:
+        if battle_over:
             await self.end_battle(battle_id)
         else:
-            # Next turn
-            battle.current_turn += 1
-            battle.clear_turn_actions()
-
             # Request next actions
             await self.broadcast_to_battle(battle_id, {
                 "type": "request_action",
-                "turn": battle.current_turn
+                "turn": turn + 1
             })
 
     def calculate_turn_result(self, battle: BattleState, p1_action: ActionType,
                              p2_action: ActionType) -> dict:
         """Calculate turn combat result"""
-        p1_attack = battle.player1_data['attack']
-        p1_defense = battle.player1_data['defense']
-        p2_attack = battle.player2_data['attack']
-        p2_defense = battle.player2_data['defense']
+        p1_attack = battle.player1_attack
+        p1_defense = battle.player1_defense
+        p2_attack = battle.player2_attack
+        p2_defense = battle.player2_defense
 
         # Base damage calculation
         p1_base_damage = max(1, p1_attack - (p2_defense // 2))
@@ -350,15 +1038,15 @@ class PvPBattleManager:
         elif p1_action == ActionType.DEFEND:
             p1_defense_mult = 2.0
             p1_damage_mult = 0.5
-            effects.append(f"{battle.player1_data['username']} is defending!")
+            effects.append(f"{battle.player1_name} is defending!")
         elif p1_action == ActionType.SPECIAL:
             # 30% chance for critical hit (2x damage)
             if random.random() < 0.3:
                 p1_damage_mult = 2.0
-                effects.append(f"{battle.player1_data['username']} lands a CRITICAL hit!")
+                effects.append(f"{battle.player1_name} lands a CRITICAL hit!")
             else:
                 p1_damage_mult = 0.8
-                effects.append(f"{battle.player1_data['username']}'s special attack missed!")
+                effects.append(f"{battle.player1_name}'s special attack missed!")
 
         # Player 2 action effects
         if p2_action == ActionType.ATTACK:
@@ -366,15 +1054,15 @@ class PvPBattleManager:
         elif p2_action == ActionType.DEFEND:
             p2_defense_mult = 2.0
             p2_damage_mult = 0.5
-            effects.append(f"{battle.player2_data['username']} is defending!")
+            effects.append(f"{battle.player2_name} is defending!")
         elif p2_action == ActionType.SPECIAL:
             # 30% chance for critical hit
             if random.random() < 0.3:
                 p2_damage_mult = 2.0
-                effects.append(f"{battle.player2_data['username']} lands a CRITICAL hit!")
+                effects.append(f"{battle.player2_name} lands a CRITICAL hit!")
             else:
                 p2_damage_mult = 0.8
-                effects.append(f"{battle.player2_data['username']}'s special attack missed!")
+                effects.append(f"{battle.player2_name}'s special attack missed!")
 
         # Calculate final damage with defense
         p1_damage_dealt = int(p1_base_damage * p1_damage_mult / p2_defense_mult)
@@ -401,8 +1089,10 @@ class PvPBattleManager:
         battle.phase = BattlePhase.FINISHED
         battle.finished_at = datetime.utcnow()
 
-        # Determine winner
-        if battle.player1_hp <= 0 and battle.player2_hp <= 0:
+        # Determine winner (a forfeit has already set it)
+        if battle.winner_id is not None:
+            pass
+        elif battle.player1_hp <= 0 and battle.player2_hp <= 0:
             # Draw (very unlikely)
             battle.winner_id = None
         elif battle.player1_hp <= 0:
@@ -410,6 +1100,8 @@ class PvPBattleManager:
         else:
             battle.winner_id = battle.player1_id
 
+        self._queue_snapshot(battle)
+
         # Calculate gold reward
         gold_reward = battle.gold_stake * 2 if battle.winner_id else 0
 
@@ -420,8 +1112,8 @@ class PvPBattleManager:
             "type": "battle_end",
             "winner_id": battle.winner_id,
             "winner_name": (
-                battle.player1_data['username'] if battle.winner_id == battle.player1_id
-                else battle.player2_data['username'] if battle.winner_id == battle.player2_id
+                battle.player1_name if battle.winner_id == battle.player1_id
+                else battle.player2_name if battle.winner_id == battle.player2_id
                 else None
             ),
             "gold_reward": gold_reward,
@@ -433,10 +1125,10 @@ class PvPBattleManager:
         })
 
         # Cleanup after delay
-        asyncio.create_task(self.cleanup_battle(battle_id, delay=10))
+        self._schedule(BATTLE_CLEANUP_DELAY, "cleanup", battle_id)
 
-    async def cleanup_battle(self, battle_id: str, delay: int = 0):
-        """Cleanup battle after completion"""
+    async def cleanup_battle(self, battle_id: str, delay: int = 0, remove_snapshot: bool = True):
+        """Cleanup battle after completion (remove_snapshot=False only drops the local copy)"""
         if delay > 0:
             await asyncio.sleep(delay)
 
@@ -449,6 +1141,10 @@ class PvPBattleManager:
 
                 # Remove battle
                 del self.active_battles[battle_id]
+                if remove_snapshot:
+                    self._queue_snapshot_removal(battle_id)
+                else:
+                    self._pending_snapshots.pop(battle_id, None)
 
                 logger.info(f"Cleaned up battle {battle_id}")
 
@@ -461,13 +1157,8 @@ class PvPBattleManager:
         message['battle_id'] = battle_id
         message['timestamp'] = datetime.utcnow().isoformat()
 
-        # Send through battle WebSocket connections
-        connections = self.battle_connections.get(battle_id, {})
-        for player_id, websocket in connections.items():
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                logger.error(f"Failed to send message to player {player_id}: {e}")
+        # Send to the players' connections, encoding once
+        await registry.publish(battle_topic(battle_id), message)
 
     async def forfeit_battle(self, battle_id: str, player_id: int):
         """Player forfeits the battle"""
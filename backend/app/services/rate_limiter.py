@@ -0,0 +1,111 @@
+"""
+Token-bucket rate limiting for WebSocket messages
+
+Each key (usually a user or player ID) gets a bucket holding up to `burst`
+tokens that refills at `rate` tokens per second; a message costs one token
+and is dropped when the bucket is empty. Checks are a few float operations
+and happen before a message is parsed, logged, persisted or broadcast.
+
+Drops are counted per key and in total so floods show up in /api/ws/status.
+Buckets are kept after a disconnect (reconnecting does not refill them) and
+pruned once they have refilled, since a full bucket is the same as none.
+"""
+import time
+from typing import Dict, Hashable
+
+from app.core.config import settings
+
+# Allowed/dropped checks between sweeps for refilled buckets
+PRUNE_EVERY = 1000
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """Per-key token buckets with drop counters"""
+
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.buckets: Dict[Hashable, TokenBucket] = {}
+        self.dropped: Dict[Hashable, int] = {}
+        self.allowed_total = 0
+        self.dropped_total = 0
+        self._checks_until_prune = PRUNE_EVERY
+
+    def allow(self, key: Hashable, cost: float = 1.0) -> bool:
+        """Take cost tokens from key's bucket; False (and a counted drop) if there are not enough"""
+        now = time.monotonic()
+        self._checks_until_prune -= 1
+        if self._checks_until_prune <= 0:
+            self.prune(now)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+
+        if bucket.tokens >= cost:
+            bucket.tokens -= cost
+            self.allowed_total += 1
+            return True
+
+        self.record_drop(key)
+        return False
+
+    def record_drop(self, key: Hashable):
+        """Count a message dropped for key (rate limited, oversized, ...)"""
+        self.dropped[key] = self.dropped.get(key, 0) + 1
+        self.dropped_total += 1
+
+    def prune(self, now: float = None):
+        """Forget buckets (and their drop counts) that have refilled completely"""
+        now = now or time.monotonic()
+        self._checks_until_prune = PRUNE_EVERY
+        refilled = [
+            key for key, bucket in self.buckets.items()
+            if bucket.tokens + (now - bucket.updated) * self.rate >= self.burst
+        ]
+        for key in refilled:
+            del self.buckets[key]
+        self.dropped = {key: count for key, count in self.dropped.items() if key in self.buckets}
+
+    def get_metrics(self, top: int = 10) -> dict:
+        """Totals plus the recently active keys with the most drops"""
+        worst = sorted(self.dropped.items(), key=lambda item: item[1], reverse=True)[:top]
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "tracked_keys": len(self.buckets),
+            "allowed": self.allowed_total,
+            "dropped": self.dropped_total,
+            "top_dropped": [{"key": key, "dropped": count} for key, count in worst]
+        }
+
+
+# Shared limiters, one per kind of socket so their quotas (and key spaces) are independent
+chat_limiter = RateLimiter("chat", settings.CHAT_RATE_LIMIT, settings.CHAT_RATE_BURST)  # user IDs
+battle_limiter = RateLimiter("battle", settings.WS_RATE_LIMIT, settings.WS_RATE_BURST)  # user IDs
+pvp_limiter = RateLimiter("pvp", settings.WS_RATE_LIMIT, settings.WS_RATE_BURST)  # user IDs
+pvp_battle_limiter = RateLimiter("pvp_battle", settings.WS_RATE_LIMIT, settings.WS_RATE_BURST)  # player IDs
+
+LIMITERS = (chat_limiter, battle_limiter, pvp_limiter, pvp_battle_limiter)
+
+
+def message_too_large(data: str, max_bytes: int = None) -> bool:
+    """Whether a raw text frame exceeds the size cap (checked before json.loads)"""
+    max_bytes = max_bytes or settings.WS_MAX_FRAME_BYTES
+    # Characters are at most 4 bytes, so only measure the encoding near the limit
+    return len(data) > max_bytes or (len(data) * 4 > max_bytes and len(data.encode()) > max_bytes)
+
+
+def get_metrics() -> dict:
+    return {limiter.name: limiter.get_metrics() for limiter in LIMITERS}
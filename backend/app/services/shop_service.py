@@ -6,12 +6,13 @@ from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
 import structlog
-import uuid
 
 from app.models.player import Player
 from app.models.inventory import InventoryItem
 from app.models.pet import Pet
 from app.models.shop import ShopPurchase
+from app.services import currency_service
+from app.services.inventory_service import bump_inventory_version, add_to_stack
 from app.schemas.shop import (
     ShopEquipmentItem,
     ShopEggItem,
@@ -24,6 +25,13 @@ from app.schemas.shop import (
 
 logger = structlog.get_logger()
 
+# Cart limits per checkout
+MAX_CART_LINES = 20
+MAX_LINE_QUANTITY = 99
+
+# Catalog item dicts by ID, built on first lookup
+_catalog_index: Optional[Dict[str, Dict]] = None
+
 
 class ShopService:
     """Service for shop operations"""
@@ -641,30 +649,18 @@ class ShopService:
 
     @staticmethod
     def find_shop_item(item_id: str) -> Optional[Dict]:
-        """Find a shop item by ID and return as dict"""
-        catalog = ShopService.get_shop_catalog()
-
-        # Search in equipment
-        for item in catalog.equipment:
-            if item.id == item_id:
-                return item.model_dump()
-
-        # Search in eggs
-        for item in catalog.eggs:
-            if item.id == item_id:
-                return item.model_dump()
-
-        # Search in food
-        for item in catalog.food:
-            if item.id == item_id:
-                return item.model_dump()
-
-        # Search in potions
-        for item in catalog.potions:
-            if item.id == item_id:
-                return item.model_dump()
-
-        return None
+        """Find a shop item by ID and return as dict (shared with the catalog index, don't modify)"""
+        global _catalog_index
+        if _catalog_index is None:
+            # The catalog is static, so it is only built and dumped once per process
+            catalog = ShopService.get_shop_catalog()
+            _catalog_index = {
+                item.id: item.model_dump()
+                for items in (catalog.equipment, catalog.eggs, catalog.food, catalog.potions)
+                for item in items
+            }
+
+        return _catalog_index.get(item_id)
 
     @staticmethod
     def validate_purchase(
@@ -706,178 +702,215 @@ class ShopService:
         Purchase an item and add it to inventory/pets
         Returns: (success: bool, message: str, new_item_id: Optional[str])
         """
-        # Validate purchase
-        can_purchase, reason, item = ShopService.validate_purchase(player, item_id, use_gems)
-        if not can_purchase:
-            logger.warning(
-                "purchase_validation_failed",
-                player_id=player.id,
-                item_id=item_id,
-                reason=reason
-            )
-            return False, reason, None
+        success, message, result = ShopService.purchase_cart(db, player, {item_id: 1}, use_gems)
+        if not success:
+            return False, message, None
 
-        # Deduct currency
-        cost_gold = 0
-        cost_gems = 0
-        if use_gems and item.get("gem_price"):
-            cost_gems = item["gem_price"]
-            player.gems -= cost_gems
-        else:
-            cost_gold = item["price"]
-            player.gold -= cost_gold
+        line = result["lines"][0]
+        return True, f"Purchased {line['name']}!", line["item_ids"][0]
 
-        # Generate unique item ID
-        unique_item_id = f"{item_id}_{uuid.uuid4().hex[:8]}"
+    @staticmethod
+    def purchase_cart(
+        db: Session,
+        player: Player,
+        cart: Dict[str, int],
+        use_gems: bool = False
+    ) -> Tuple[bool, str, Optional[Dict]]:
+        """
+        Purchase several shop items (catalog ID -> quantity) in one transaction
+
+        Every line is validated up front, then the total is debited with one
+        conditional UPDATE per currency (currency_service), which fails unless
+        the balance covers it, so two concurrent checkouts cannot both spend
+        the same gold. Consumables are added to their stacks, gear and eggs are
+        inserted together, and one ShopPurchase row is written per line.
+        Returns: (success: bool, message: str, result: Optional[Dict])
+        """
+        if not cart:
+            return False, "Cart is empty", None
+        if len(cart) > MAX_CART_LINES:
+            return False, f"Cart can hold at most {MAX_CART_LINES} different items", None
+
+        # Validate every line before touching the database
+        lines = []
+        total_gold = 0
+        total_gems = 0
+        for item_id, quantity in cart.items():
+            item = ShopService.find_shop_item(item_id)
+            if not item:
+                return False, "Item not found in shop", None
+            if quantity < 1 or quantity > MAX_LINE_QUANTITY:
+                return False, f"Quantity for {item['name']} must be between 1 and {MAX_LINE_QUANTITY}", None
+            if player.level < item.get("level", 1):
+                return False, f"Requires level {item['level']}", None
+
+            cost_gold = 0
+            cost_gems = 0
+            if use_gems and item.get("gem_price"):
+                cost_gems = item["gem_price"] * quantity
+            else:
+                cost_gold = item["price"] * quantity
+            total_gold += cost_gold
+            total_gems += cost_gems
+            lines.append((item, quantity, cost_gold, cost_gems))
 
         try:
-            # Handle different item types
-            item_type = item["type"]
-
-            if item_type == "EGG":
-                # Create pet egg (unhatched pet)
-                # Convert pet_type to PetSpecies enum if it exists
-                pet_species = None
-                if item.get("pet_type"):
-                    from app.models.pet import PetSpecies
-                    try:
-                        pet_species = PetSpecies(item["pet_type"])
-                    except ValueError:
-                        pet_species = PetSpecies.MYSTERY
-
-                pet = Pet(
-                    player_id=player.id,
-                    species=pet_species,  # None for mystery eggs
-                    name=None,  # Not named until hatched
-                    level=1,
-                    exp=0,
-                    is_egg=True,  # This is an egg
-                    hatched_at=None,
-                    # Focus will be determined on hatch
-                    focus=None,
-                    base_attack=item["pet_stats"]["attack"],
-                    base_defense=item["pet_stats"]["defense"],
-                    base_hp=item["pet_stats"]["hp"]
-                )
-                db.add(pet)
-                db.flush()  # Get the pet ID
-                unique_item_id = str(pet.id)
-
-            elif item_type == "FOOD":
-                # Add food to inventory (FOOD maps to CONSUMABLE)
-                from app.models.inventory import ItemType, ItemRarity
-                inv_item = InventoryItem(
+            # Deduct currency with conditional updates (the player row stays locked until the commit below)
+            reference = ",".join(item["id"] for item, _, _, _ in lines)
+            try:
+                if total_gems:
+                    currency_service.debit(db, player, total_gems, "shop_purchase", currency_service.GEMS, reference)
+                if total_gold:
+                    currency_service.debit(db, player, total_gold, "shop_purchase", currency_service.GOLD, reference)
+            except currency_service.InsufficientFunds as e:
+                db.rollback()
+                return False, str(e), None
+
+            created = [ShopService._create_purchased_items(db, player, item, quantity) for item, quantity, _, _ in lines]
+            db.flush()
+
+            result_lines = []
+            for (item, quantity, cost_gold, cost_gems), new_items in zip(lines, created):
+                # Record purchase in shop_purchases table, one row per cart line
+                db.add(ShopPurchase(
                     player_id=player.id,
-                    name=item["name"],
-                    item_type=ItemType.CONSUMABLE,
-                    rarity=ItemRarity(item["rarity"].lower()),
-                    level_requirement=1,
-                    attack_bonus=0,
-                    defense_bonus=0,
-                    hp_bonus=0,
-                    # Store pet_exp in properties JSON
-                    properties={"pet_exp": item["pet_exp"], "description": item["description"]},
-                    quantity=1
-                )
-                db.add(inv_item)
-                db.flush()
-                unique_item_id = str(inv_item.id)
-
-            elif item_type == "CONSUMABLE":
-                # Add potion to inventory
-                from app.models.inventory import ItemType, ItemRarity
-
-                # Check if player already has this potion type (for stacking)
-                existing_potion = db.query(InventoryItem).filter(
-                    InventoryItem.player_id == player.id,
-                    InventoryItem.name == item["name"],
-                    InventoryItem.item_type == ItemType.CONSUMABLE
-                ).first()
-
-                if existing_potion:
-                    # Stack with existing potion
-                    existing_potion.quantity += 1
-                    unique_item_id = str(existing_potion.id)
-                else:
-                    # Create new potion stack
-                    inv_item = InventoryItem(
-                        player_id=player.id,
-                        name=item["name"],
-                        item_type=ItemType.CONSUMABLE,
-                        rarity=ItemRarity(item["rarity"].lower()),
-                        level_requirement=item.get("level", 1),
-                        attack_bonus=0,
-                        defense_bonus=0,
-                        hp_bonus=0,
-                        # Store potion properties in JSON
-                        properties={
-                            "potion_type": item["potion_type"],
-                            "effect_value": item["effect_value"],
-                            "duration": item.get("duration"),
-                            "description": item["description"],
-                            "icon": item.get("icon")
-                        },
-                        quantity=1
-                    )
-                    db.add(inv_item)
-                    db.flush()
-                    unique_item_id = str(inv_item.id)
-
-            else:
-                # Add equipment to inventory
-                from app.models.inventory import ItemType, ItemRarity
-                inv_item = InventoryItem(
-                    player_id=player.id,
-                    name=item["name"],
-                    item_type=ItemType(item_type.lower()),
-                    rarity=ItemRarity(item["rarity"].lower()),
-                    level_requirement=item["level"],
-                    attack_bonus=item["stats"]["attack"],
-                    defense_bonus=item["stats"]["defense"],
-                    hp_bonus=item["stats"]["hp"],
-                    properties={"description": item.get("description", "")},
-                    quantity=1
-                )
-                db.add(inv_item)
-                db.flush()
-                unique_item_id = str(inv_item.id)
-
-            # Record purchase in shop_purchases table
-            purchase = ShopPurchase(
-                player_id=player.id,
-                item_type=item_type,
-                item_name=item["name"],
-                cost_gold=cost_gold,
-                cost_gems=cost_gems
-            )
-            db.add(purchase)
+                    item_type=item["type"],
+                    item_name=item["name"],
+                    quantity=quantity,
+                    cost_gold=cost_gold,
+                    cost_gems=cost_gems
+                ))
+                result_lines.append({
+                    "item_id": item["id"],
+                    "name": item["name"],
+                    "quantity": quantity,
+                    "cost_gold": cost_gold,
+                    "cost_gems": cost_gems,
+                    "item_ids": [str(new_item if isinstance(new_item, int) else new_item.id) for new_item in new_items]
+                })
+
+            if any(item["type"] != "EGG" for item, _, _, _ in lines):
+                bump_inventory_version(db, player.id)
 
             # Commit all changes
             db.commit()
             db.refresh(player)
 
             logger.info(
-                "item_purchased",
+                "cart_purchased",
                 player_id=player.id,
-                item_id=item_id,
-                item_name=item["name"],
-                cost_gold=cost_gold,
-                cost_gems=cost_gems,
-                new_item_id=unique_item_id
+                lines=len(lines),
+                items=sum(quantity for _, quantity, _, _ in lines),
+                cost_gold=total_gold,
+                cost_gems=total_gems
             )
 
-            return True, f"Purchased {item['name']}!", unique_item_id
+            return True, "Purchase complete", {
+                "lines": result_lines,
+                "cost_gold": total_gold,
+                "cost_gems": total_gems
+            }
 
         except Exception as e:
             db.rollback()
             logger.error(
                 "purchase_failed",
                 player_id=player.id,
-                item_id=item_id,
+                cart=cart,
                 error=str(e)
             )
             return False, "Purchase failed due to an error", None
 
+    @staticmethod
+    def _create_purchased_items(db: Session, player: Player, item: Dict, quantity: int) -> List:
+        """
+        Add quantity of a catalog item to the player's inventory or pets
+
+        Returns the stack ID for consumables, otherwise the new (unflushed) rows.
+        """
+        from app.models.inventory import ItemType, ItemRarity
+        item_type = item["type"]
+
+        if item_type == "EGG":
+            # Create pet eggs (unhatched pets)
+            # Convert pet_type to PetSpecies enum if it exists
+            pet_species = None
+            if item.get("pet_type"):
+                from app.models.pet import PetSpecies
+                try:
+                    pet_species = PetSpecies(item["pet_type"])
+                except ValueError:
+                    pet_species = PetSpecies.MYSTERY
+
+            pets = [
+                Pet(
+                    player_id=player.id,
+                    species=pet_species,  # None for mystery eggs
+                    name=None,  # Not named until hatched
+                    level=1,
+                    exp=0,
+                    is_egg=True,  # This is an egg
+                    hatched_at=None,
+                    # Focus will be determined on hatch
+                    focus=None,
+                    base_attack=item["pet_stats"]["attack"],
+                    base_defense=item["pet_stats"]["defense"],
+                    base_hp=item["pet_stats"]["hp"]
+                )
+                for _ in range(quantity)
+            ]
+            db.add_all(pets)
+            return pets
+
+        if item_type in ("FOOD", "CONSUMABLE"):
+            # Food and potions stack per catalog entry (FOOD maps to CONSUMABLE)
+            if item_type == "FOOD":
+                # Store pet_exp in properties JSON
+                properties = {"pet_exp": item["pet_exp"], "description": item["description"]}
+            else:
+                properties = {
+                    "potion_type": item["potion_type"],
+                    "effect_value": item["effect_value"],
+                    "duration": item.get("duration"),
+                    "description": item["description"],
+                    "icon": item.get("icon")
+                }
+
+            stack_id = add_to_stack(
+                db,
+                player.id,
+                item["id"],
+                quantity,
+                name=item["name"],
+                item_type=ItemType.CONSUMABLE,
+                rarity=ItemRarity(item["rarity"].lower()),
+                level_requirement=item.get("level", 1),
+                attack_bonus=0,
+                defense_bonus=0,
+                hp_bonus=0,
+                properties=properties
+            )
+            return [stack_id]
+
+        # Add equipment to inventory
+        inv_items = [
+            InventoryItem(
+                player_id=player.id,
+                name=item["name"],
+                item_type=ItemType(item_type.lower()),
+                rarity=ItemRarity(item["rarity"].lower()),
+                level_requirement=item["level"],
+                attack_bonus=item["stats"]["attack"],
+                defense_bonus=item["stats"]["defense"],
+                hp_bonus=item["stats"]["hp"],
+                properties={"description": item.get("description", "")},
+                quantity=1
+            )
+            for _ in range(quantity)
+        ]
+        db.add_all(inv_items)
+        return inv_items
+
     @staticmethod
     def get_purchase_history(
         db: Session,
@@ -1,129 +1,83 @@
 """
-WebSocket Connection Manager for Real-Time PVP Events
-Manages WebSocket connections, broadcasts, and user presence
+PVP lobby on top of the WebSocket connection registry
+Challenge notifications, lobby broadcasts and online presence
 """
-from fastapi import WebSocket
 from typing import Dict, Set, Optional, Any
-import asyncio
-import json
 from datetime import datetime
 import logging
 
+from app.core.config import settings
+from app.services.presence import PresenceAggregator
+from app.websocket.registry import Connection, registry
+
+# Registry topic of the lobby; also the single presence channel everyone on it shares
+LOBBY = "pvp"
+PRESENCE_CHANNEL = LOBBY
+
 logger = logging.getLogger(__name__)
 
 
 class ConnectionManager:
-    """Manages WebSocket connections for real-time PVP features"""
+    """The PVP lobby: connections subscribed to the "pvp" topic, one per user"""
 
     def __init__(self):
-        # Active connections: {user_id: {websocket, player_id, username}}
-        self.active_connections: Dict[int, Dict[str, Any]] = {}
-
-        # Player to user mapping for quick lookups
-        self.player_to_user: Dict[int, int] = {}
-
-        # Lock for thread-safe operations
-        self._lock = asyncio.Lock()
-
-    async def connect(self, websocket: WebSocket, user_id: int, player_id: int, username: str):
-        """Accept new WebSocket connection and track user"""
-        await websocket.accept()
-
-        async with self._lock:
-            # Disconnect previous connection if exists
-            if user_id in self.active_connections:
-                old_ws = self.active_connections[user_id]["websocket"]
+        # Online/offline changes are batched into one presence_delta per interval
+        self.presence = PresenceAggregator(
+            "pvp",
+            deliver=lambda channel, event: self.broadcast(event),
+            count=lambda channel: registry.count(LOBBY),
+            interval=settings.PRESENCE_INTERVAL
+        )
+        registry.watch(
+            LOBBY,
+            joined=lambda connection, topic: self.presence.joined(PRESENCE_CHANNEL, connection.user_id, connection.username),
+            left=lambda connection, topic: self.presence.left(PRESENCE_CHANNEL, connection.user_id, connection.username)
+        )
+
+    async def join(self, connection: Connection):
+        """Subscribe a connection to the lobby, replacing the user's previous lobby connection"""
+        for previous in registry.user_connections(connection.user_id, LOBBY):
+            if previous is connection:
+                continue
+            registry.unsubscribe(previous, LOBBY)
+            if not previous.topics:
+                # A lobby-only socket has nothing left to do
+                registry.remove(previous)
                 try:
-                    await old_ws.close()
-                except:
+                    await previous.websocket.close()
+                except Exception:
                     pass
 
-            # Store connection
-            self.active_connections[user_id] = {
-                "websocket": websocket,
-                "player_id": player_id,
-                "username": username,
-                "connected_at": datetime.utcnow()
-            }
-            self.player_to_user[player_id] = user_id
-
-        logger.info(f"User {username} (ID: {user_id}) connected via WebSocket")
+        registry.subscribe(connection, LOBBY)
+        logger.info(f"User {connection.username} (ID: {connection.user_id}) connected via WebSocket")
 
-        # Broadcast online status update
-        await self.broadcast_online_status_change(user_id, username, True)
-
-    async def disconnect(self, user_id: int):
-        """Remove WebSocket connection and notify others"""
-        async with self._lock:
-            if user_id in self.active_connections:
-                connection_info = self.active_connections[user_id]
-                username = connection_info["username"]
-                player_id = connection_info["player_id"]
-
-                # Remove from tracking
-                del self.active_connections[user_id]
-                if player_id in self.player_to_user:
-                    del self.player_to_user[player_id]
-
-                logger.info(f"User {username} (ID: {user_id}) disconnected")
-
-                # Broadcast offline status
-                await self.broadcast_online_status_change(user_id, username, False)
+    def leave(self, connection: Connection):
+        """Unsubscribe a connection from the lobby; others hear about it in the next presence_delta"""
+        if registry.unsubscribe(connection, LOBBY):
+            logger.info(f"User {connection.username} (ID: {connection.user_id}) disconnected")
 
     async def send_personal_message(self, user_id: int, message: Dict[str, Any]) -> bool:
         """Send message to specific user"""
-        if user_id not in self.active_connections:
+        if not await registry.send_to_user(user_id, message, LOBBY):
             logger.warning(f"Cannot send message to user {user_id} - not connected")
             return False
-
-        websocket = self.active_connections[user_id]["websocket"]
-        try:
-            await websocket.send_json(message)
-            return True
-        except Exception as e:
-            logger.error(f"Error sending message to user {user_id}: {e}")
-            await self.disconnect(user_id)
-            return False
+        return True
 
     async def send_to_player(self, player_id: int, message: Dict[str, Any]) -> bool:
         """Send message to specific player by player_id"""
-        user_id = self.player_to_user.get(player_id)
-        if not user_id:
+        if not await registry.send_to_player(player_id, message, LOBBY):
             logger.warning(f"Cannot send message to player {player_id} - not connected (message type: {message.get('type', 'unknown')})")
             return False
 
-        logger.info(f"Sending message to player {player_id} (user {user_id}): {message.get('type', 'unknown')}")
-        return await self.send_personal_message(user_id, message)
+        logger.info(f"Sent message to player {player_id}: {message.get('type', 'unknown')}")
+        return True
 
     async def broadcast(self, message: Dict[str, Any], exclude_user_id: Optional[int] = None):
         """Broadcast message to all connected users"""
-        disconnected = []
-
-        for user_id, connection_info in self.active_connections.items():
-            if user_id == exclude_user_id:
-                continue
-
-            websocket = connection_info["websocket"]
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to user {user_id}: {e}")
-                disconnected.append(user_id)
-
-        # Clean up disconnected users
-        for user_id in disconnected:
-            await self.disconnect(user_id)
-
-    async def broadcast_online_status_change(self, user_id: int, username: str, is_online: bool):
-        """Notify all users about online status change"""
-        message = {
-            "type": "online_status",
-            "user_id": user_id,
-            "username": username,
-            "is_online": is_online,
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        await self.broadcast(message, exclude_user_id=user_id)
+        await registry.deliver(
+            (c for c in list(registry.members(LOBBY)) if c.user_id != exclude_user_id),
+            message
+        )
 
     async def notify_challenge_received(self, defender_player_id: int, challenger_name: str, duel_id: int, gold_stake: int):
         """Notify defender about new challenge"""
@@ -167,6 +121,18 @@ class ConnectionManager:
             logger.info(f"Notified player {defender_player_id} that {challenger_name} cancelled challenge")
         return success
 
+    async def notify_challenge_expired(self, player_id: int, duel_id: int):
+        """Notify a duel participant that a pending challenge expired"""
+        message = {
+            "type": "challenge_expired",
+            "duel_id": duel_id,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        success = await self.send_to_player(player_id, message)
+        if success:
+            logger.info(f"Notified player {player_id} that challenge {duel_id} expired")
+        return success
+
     async def notify_duel_ready(self, player_id: int, duel_id: int, opponent_name: str):
         """Notify player that duel is ready to start"""
         message = {
@@ -182,19 +148,19 @@ class ConnectionManager:
 
     def get_online_count(self) -> int:
         """Get number of currently connected users"""
-        return len(self.active_connections)
+        return registry.count(LOBBY)
 
     def get_online_users(self) -> Set[int]:
         """Get set of online user IDs"""
-        return set(self.active_connections.keys())
+        return {connection.user_id for connection in registry.members(LOBBY)}
 
     def is_user_online(self, user_id: int) -> bool:
         """Check if user is currently connected"""
-        return user_id in self.active_connections
+        return bool(registry.user_connections(user_id, LOBBY))
 
     def is_player_online(self, player_id: int) -> bool:
         """Check if player is currently connected"""
-        return player_id in self.player_to_user
+        return bool(registry.player_connections(player_id, LOBBY))
 
 
 # Global connection manager instance
@@ -0,0 +1,182 @@
+"""
+WebSocket message encoding
+
+JSON text frames are the default on every socket. A client may instead offer
+the "wg.msgpack.v1" subprotocol (new WebSocket(url, ["wg.msgpack.v1"]));
+when the server has msgpack installed it accepts it, and from then on the
+high-frequency events in COMPACT_TYPES are sent as binary MessagePack frames.
+Everything else stays JSON text, so clients tell the two apart by frame type.
+
+A compact frame is a map whose keys are the integer tags in FIELDS (unknown
+keys stay strings), with the "type" value replaced by its tag in TYPES and
+"timestamp" sent as integer milliseconds since the epoch. Keys are tagged at
+the top level and in lists of objects ("hits", "joined", "left"). Maps keyed
+by player ID (turn_result "actions"/"damage"/"hp") keep their keys, sent as
+strings just like JSON sends them, so both encodings decode to the same object.
+The tag tables only ever grow; a breaking change gets a new subprotocol name.
+The browser decoder is src/services/wsCodec.js, and backend/README.md lists the
+tables for other client authors.
+
+Broadcasts wrap the message in a Frame so each encoding is done once, not
+once per recipient.
+"""
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional, Union
+
+from fastapi import WebSocket
+
+try:
+    import msgpack
+except ImportError:  # Optional: without it every connection stays on JSON
+    msgpack = None
+
+SUBPROTOCOL = "wg.msgpack.v1"
+
+# Set in the connection scope when the subprotocol was negotiated
+_SCOPE_KEY = "wg.compact"
+
+TYPES = {
+    "attack": 1,
+    "attack_batch": 2,
+    "enemy_defeated": 3,
+    "turn_result": 4,
+    "request_action": 5,
+    "opponent_action_submitted": 6,
+    "presence_delta": 7,
+}
+COMPACT_TYPES = frozenset(TYPES)
+
+FIELDS = {
+    "type": 0,
+    "timestamp": 1,
+    "battle_id": 2,
+    "player_name": 3,
+    "player_level": 4,
+    "username": 5,
+    "user_id": 6,
+    "enemy_id": 7,
+    "enemy_name": 8,
+    "damage": 9,
+    "is_critical": 10,
+    "enemy_hp_remaining": 11,
+    "enemy_defeated": 12,
+    "battle_completed": 13,
+    "hits": 14,
+    "total_damage": 15,
+    "defeated_enemy_ids": 16,
+    "phase_transitions": 17,
+    "turn": 18,
+    "actions": 19,
+    "hp": 20,
+    "effects": 21,
+    "channel": 22,
+    "joined": 23,
+    "left": 24,
+    "count": 25,
+    "defeated_by": 26,
+}
+
+# Counters for get_metrics(): frames and bytes actually sent per encoding
+_sent = {"json_frames": 0, "json_bytes": 0, "msgpack_frames": 0, "msgpack_bytes": 0}
+
+
+def negotiate(websocket: WebSocket) -> Optional[str]:
+    """
+    Subprotocol to pass to websocket.accept(): SUBPROTOCOL if the client
+    offered it and msgpack is available, otherwise None (plain JSON)
+    """
+    if msgpack is None or SUBPROTOCOL not in websocket.scope.get("subprotocols", ()):
+        return None
+    websocket.scope[_SCOPE_KEY] = True
+    return SUBPROTOCOL
+
+
+def is_compact(websocket: WebSocket) -> bool:
+    return websocket.scope.get(_SCOPE_KEY, False)
+
+
+def _tag_keys(obj: Dict) -> Dict:
+    return {FIELDS.get(key, key): value for key, value in obj.items()}
+
+
+def _epoch_ms(timestamp: Any) -> Any:
+    if isinstance(timestamp, str):
+        try:
+            timestamp = datetime.fromisoformat(timestamp)
+        except ValueError:
+            return timestamp
+    if isinstance(timestamp, datetime):
+        # Server timestamps are naive UTC (datetime.utcnow())
+        return int((timestamp - datetime(1970, 1, 1)).total_seconds() * 1000)
+    return timestamp
+
+
+def compact(message: Dict) -> Dict:
+    """The integer-tagged form of a message (see the module docstring)"""
+    result = {}
+    for key, value in message.items():
+        if key == "type":
+            value = TYPES.get(value, value)
+        elif key == "timestamp":
+            value = _epoch_ms(value)
+        elif isinstance(value, list) and value and isinstance(value[0], dict):
+            value = [_tag_keys(item) for item in value]
+        elif isinstance(value, dict):
+            value = {str(map_key): item for map_key, item in value.items()}
+        result[FIELDS.get(key, key)] = value
+    return result
+
+
+def encode_json(message: Dict) -> str:
+    # Same output as WebSocket.send_json()
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def encode_msgpack(message: Dict) -> bytes:
+    return msgpack.packb(compact(message), use_bin_type=True)
+
+
+class Frame:
+    """A message with its encodings computed at most once, for sending to many sockets"""
+    __slots__ = ("message", "_text", "_binary")
+
+    def __init__(self, message: Dict):
+        self.message = message
+        self._text: Optional[str] = None
+        self._binary: Optional[bytes] = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = encode_json(self.message)
+        return self._text
+
+    @property
+    def binary(self) -> Optional[bytes]:
+        """MessagePack encoding, or None if this message type always goes as JSON"""
+        if self.message.get("type") not in COMPACT_TYPES or msgpack is None:
+            return None
+        if self._binary is None:
+            self._binary = encode_msgpack(self.message)
+        return self._binary
+
+
+async def send(websocket: WebSocket, message: Union[Frame, Dict]):
+    """Send a message in the connection's negotiated encoding"""
+    frame = message if isinstance(message, Frame) else Frame(message)
+    if is_compact(websocket):
+        binary = frame.binary
+        if binary is not None:
+            await websocket.send_bytes(binary)
+            _sent["msgpack_frames"] += 1
+            _sent["msgpack_bytes"] += len(binary)
+            return
+    text = frame.text
+    await websocket.send_text(text)
+    _sent["json_frames"] += 1
+    _sent["json_bytes"] += len(text)  # Characters; the same as bytes for ASCII payloads
+
+
+def get_metrics() -> dict:
+    return {"msgpack_available": msgpack is not None, **_sent}
@@ -1,100 +1,141 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-from typing import Dict, List
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from typing import List
 import json
 import structlog
 from app.core.security import decode_access_token
 from app.models.battle_log import BattleLog
+from app.db.pagination import keyset_page
+from app.services.rate_limiter import battle_limiter, message_too_large
+from app.websocket.registry import Connection, registry
 
 logger = structlog.get_logger()
 
 router = APIRouter()
 
-# Store active WebSocket connections per battle
-battle_connections: Dict[int, List[WebSocket]] = {}
+RAID = "raid"
 
 
-class BattleConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, List[Dict]] = {}
+def raid_topic(battle_id: int) -> str:
+    """Registry topic of a raid battle's events"""
+    return f"{RAID}:{battle_id}"
 
-    async def connect(self, websocket: WebSocket, battle_id: int, user_id: int, username: str):
-        """Connect a player to a battle room"""
-        await websocket.accept()
 
-        if battle_id not in self.active_connections:
-            self.active_connections[battle_id] = []
+async def broadcast_to_battle(battle_id: int, message: dict):
+    """Broadcast a message to all players in a battle"""
+    # Lets a client multiplexing several topics over one socket tell battles apart
+    message.setdefault("battle_id", battle_id)
+    await registry.publish(raid_topic(battle_id), message)
 
-        self.active_connections[battle_id].append({
-            "websocket": websocket,
-            "user_id": user_id,
-            "username": username
-        })
 
-        logger.info("player_connected_to_battle",
-                   battle_id=battle_id,
-                   user_id=user_id,
-                   username=username,
-                   total_players=len(self.active_connections[battle_id]))
-
-    def disconnect(self, websocket: WebSocket, battle_id: int):
-        """Disconnect a player from a battle room"""
-        if battle_id in self.active_connections:
-            self.active_connections[battle_id] = [
-                conn for conn in self.active_connections[battle_id]
-                if conn["websocket"] != websocket
-            ]
-
-            if len(self.active_connections[battle_id]) == 0:
-                del self.active_connections[battle_id]
-
-            logger.info("player_disconnected_from_battle",
-                       battle_id=battle_id,
-                       remaining_players=len(self.active_connections.get(battle_id, [])))
-
-    async def broadcast_to_battle(self, battle_id: int, message: dict):
-        """Broadcast a message to all players in a battle"""
-        if battle_id not in self.active_connections:
-            return
+def get_player_count(battle_id: int) -> int:
+    """Get the number of players in a battle"""
+    return registry.count(raid_topic(battle_id))
 
-        disconnected = []
-        for connection in self.active_connections[battle_id]:
-            try:
-                await connection["websocket"].send_json(message)
-            except Exception as e:
-                logger.error("broadcast_error",
-                           battle_id=battle_id,
-                           error=str(e))
-                disconnected.append(connection["websocket"])
 
-        # Clean up disconnected clients
-        for ws in disconnected:
-            self.disconnect(ws, battle_id)
+def get_player_list(battle_id: int) -> List[str]:
+    """Get list of usernames in a battle"""
+    return [connection.username for connection in registry.members(raid_topic(battle_id))]
 
-    async def send_personal_message(self, websocket: WebSocket, message: dict):
-        """Send a message to a specific player"""
-        try:
-            await websocket.send_json(message)
-        except Exception as e:
-            logger.error("personal_message_error", error=str(e))
 
-    def get_player_count(self, battle_id: int) -> int:
-        """Get the number of players in a battle"""
-        return len(self.active_connections.get(battle_id, []))
+async def enter_battle(connection: Connection, battle_id: int):
+    """Subscribe a connection to a battle: history, welcome message and a player_joined broadcast"""
+    from app.db.database import session_scope
 
-    def get_player_list(self, battle_id: int) -> List[str]:
-        """Get list of usernames in a battle"""
-        if battle_id not in self.active_connections:
-            return []
-        return [conn["username"] for conn in self.active_connections[battle_id]]
+    if not registry.subscribe(connection, raid_topic(battle_id)):
+        return
 
+    logger.info("player_connected_to_battle",
+               battle_id=battle_id,
+               user_id=connection.user_id,
+               username=connection.username,
+               total_players=get_player_count(battle_id))
 
-manager = BattleConnectionManager()
+    # Send persisted battle log history from database as a single
+    # history_batch frame (compressed as a whole by permessage-deflate)
+    try:
+        # Fetch last 100 battle logs from database for this battle
+        with session_scope() as db:
+            rows, history_cursor = keyset_page(
+                db.query(BattleLog).filter(BattleLog.battle_id == battle_id),
+                BattleLog, 100
+            )
+            battle_logs = [log.to_dict() for log in rows]
+
+        await registry.send(connection, {
+            "type": "history_batch",
+            "battle_id": battle_id,
+            "messages": battle_logs[::-1],  # Chronological order (oldest first)
+            # Older logs: GET /api/battles/{battle_id}/logs?cursor=<next_cursor>
+            "next_cursor": history_cursor
+        })
+    except Exception as e:
+        logger.error("failed_to_send_battle_log_history", error=str(e))
+
+    # Send welcome message
+    await registry.send(connection, {
+        "type": "connected",
+        "message": f"Connected to battle {battle_id}",
+        "battle_id": battle_id,
+        "player_count": get_player_count(battle_id)
+    })
+
+    # Broadcast player joined to all players in battle
+    await broadcast_to_battle(battle_id, {
+        "type": "player_joined",
+        "username": connection.username,
+        "player_count": get_player_count(battle_id),
+        "players": get_player_list(battle_id)
+    })
+
+
+async def leave_battle(connection: Connection, battle_id: int):
+    """Unsubscribe a connection from a battle and tell the remaining players"""
+    registry.unsubscribe(connection, raid_topic(battle_id))
+
+    logger.info("player_disconnected_from_battle",
+               battle_id=battle_id,
+               remaining_players=get_player_count(battle_id))
+
+    await broadcast_to_battle(battle_id, {
+        "type": "player_left",
+        "username": connection.username,
+        "player_count": get_player_count(battle_id),
+        "players": get_player_list(battle_id)
+    })
+
+
+async def handle_message(connection: Connection, battle_id: int, message: dict):
+    """Handle one (already rate limited) message from a player in a battle"""
+    message_type = message.get("type")
+    username = connection.username
+
+    if message_type == "pong":
+        return  # Answer to the registry's ping; touch() already recorded it
+
+    if message_type == "attack":
+        # TODO: Process attack and calculate damage
+        # For now, just broadcast the attack
+        await broadcast_to_battle(battle_id, {
+            "type": "attack",
+            "username": username,
+            "damage": message.get("damage", 0),
+            "enemy_id": message.get("enemy_id"),
+            "timestamp": message.get("timestamp")
+        })
 
+    elif message_type == "enemy_defeated":
+        await broadcast_to_battle(battle_id, {
+            "type": "enemy_defeated",
+            "enemy_id": message.get("enemy_id"),
+            "defeated_by": username
+        })
 
-def get_battle_manager() -> BattleConnectionManager:
-    """Get the global battle connection manager instance"""
-    return manager
+    elif message_type == "chat":
+        await broadcast_to_battle(battle_id, {
+            "type": "chat",
+            "username": username,
+            "message": message.get("message", "")
+        })
 
 
 @router.websocket("/ws/battle/{battle_id}")
@@ -104,9 +145,10 @@ async def battle_websocket_endpoint(websocket: WebSocket, battle_id: int, token:
 
     Usage: ws://localhost:8000/ws/battle/{battle_id}?token=<jwt_token>
     """
-    from app.db.database import get_db
+    from app.db.database import session_scope
     from app.models.player import Player
 
+    connection = None
     try:
         # Authenticate user via token
         payload = decode_access_token(token)
@@ -117,91 +159,39 @@ async def battle_websocket_endpoint(websocket: WebSocket, battle_id: int, token:
             return
 
         # Get player username from database
-        db = next(get_db())
-        player = db.query(Player).filter(Player.user_id == int(user_id)).first()
-        username = player.username if player else payload.get("email", "Unknown")
-        db.close()
+        with session_scope() as db:
+            username = db.query(Player.username).filter(Player.user_id == int(user_id)).scalar()
+        username = username or payload.get("email", "Unknown")
 
         # Connect player to battle
-        await manager.connect(websocket, battle_id, user_id, username)
-
-        # Send persisted battle log history from database
-        try:
-            # Fetch last 100 battle logs from database for this battle
-            battle_logs = db.query(BattleLog).filter(
-                BattleLog.battle_id == battle_id
-            ).order_by(
-                BattleLog.created_at.desc()
-            ).limit(100).all()
-
-            # Send in chronological order (oldest first)
-            for log in reversed(battle_logs):
-                try:
-                    await websocket.send_json(log.to_dict())
-                except Exception as e:
-                    logger.error("failed_to_send_battle_log_history", error=str(e))
-        except Exception as e:
-            logger.error("failed_to_load_battle_log_history", error=str(e))
-
-        # Send welcome message
-        await manager.send_personal_message(websocket, {
-            "type": "connected",
-            "message": f"Connected to battle {battle_id}",
-            "battle_id": battle_id,
-            "player_count": manager.get_player_count(battle_id)
-        })
-
-        # Broadcast player joined to all players in battle
-        await manager.broadcast_to_battle(battle_id, {
-            "type": "player_joined",
-            "username": username,
-            "player_count": manager.get_player_count(battle_id),
-            "players": manager.get_player_list(battle_id)
-        })
+        user_id = int(user_id)
+        connection = await registry.accept(websocket, user_id, username)
+        await enter_battle(connection, battle_id)
 
         # Listen for messages from client
         while True:
             data = await websocket.receive_text()
-            message = json.loads(data)
-
-            # Handle different message types
-            message_type = message.get("type")
-
-            if message_type == "attack":
-                # TODO: Process attack and calculate damage
-                # For now, just broadcast the attack
-                await manager.broadcast_to_battle(battle_id, {
-                    "type": "attack",
-                    "username": username,
-                    "damage": message.get("damage", 0),
-                    "enemy_id": message.get("enemy_id"),
-                    "timestamp": message.get("timestamp")
-                })
-
-            elif message_type == "enemy_defeated":
-                await manager.broadcast_to_battle(battle_id, {
-                    "type": "enemy_defeated",
-                    "enemy_id": message.get("enemy_id"),
-                    "defeated_by": username
-                })
-
-            elif message_type == "chat":
-                await manager.broadcast_to_battle(battle_id, {
-                    "type": "chat",
-                    "username": username,
-                    "message": message.get("message", "")
-                })
+            registry.touch(connection)
+
+            # Drop floods and oversized frames before they are parsed or broadcast
+            if message_too_large(data):
+                battle_limiter.record_drop(user_id)
+                continue
+            if not battle_limiter.allow(user_id):
+                continue
+
+            await handle_message(connection, battle_id, json.loads(data))
 
     except WebSocketDisconnect:
-        manager.disconnect(websocket, battle_id)
-        await manager.broadcast_to_battle(battle_id, {
-            "type": "player_left",
-            "username": username,
-            "player_count": manager.get_player_count(battle_id),
-            "players": manager.get_player_list(battle_id)
-        })
+        if connection is not None:
+            await leave_battle(connection, battle_id)
     except Exception as e:
         logger.error("websocket_error",
                     battle_id=battle_id,
                     error=str(e))
+        if connection is not None:
+            await leave_battle(connection, battle_id)
         await websocket.close(code=1011, reason="Internal server error")
+    finally:
+        if connection is not None:
+            registry.remove(connection)
@@ -1,157 +1,385 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query
-from typing import Dict, List
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
+from typing import Dict, Optional, Union
 import json
 import structlog
 from datetime import datetime
+from app.core.config import settings
 from app.core.security import decode_access_token
-from app.db.database import get_db
+from app.db.database import session_scope
+from app.db.pagination import keyset_page
 from app.models.user import User
 from app.models.player import Player
+from app.models.battle import BattleParticipant
 from app.models.chat_message import ChatMessage
+from app.services.chat_writer import chat_writer
+from app.services.presence import PresenceAggregator
+from app.services.rate_limiter import chat_limiter, message_too_large
+from app.services import ws_codec
+from app.websocket.registry import Connection, registry, topic_matches
 
 logger = structlog.get_logger()
 
 router = APIRouter()
 
+CHAT = "chat"
+TAVERN = "tavern"
+BATTLE = "battle"
+WHISPER = "whisper"
+
+
+def tavern_room(room: int) -> str:
+    return f"{TAVERN}:{room}"
+
+
+def normalize_channel(channel: str) -> Optional[str]:
+    """Canonical "<kind>:<number>" form of a channel name, or None if it is malformed"""
+    kind, _, key = channel.partition(":")
+    if kind not in (TAVERN, BATTLE) or not key.isdigit() or int(key) < 1:
+        return None
+    return f"{kind}:{int(key)}"
+
+
+def chat_topic(channel: str) -> str:
+    """Registry topic of a chat channel"""
+    return f"{CHAT}:{channel}"
+
+
+def room_of(connection: Connection) -> Optional[str]:
+    """The tavern room a chat connection is in"""
+    for topic in connection.topics:
+        if topic.startswith(f"{CHAT}:{TAVERN}:"):
+            return topic[len(CHAT) + 1:]
+    return None
+
 
 class ChatConnectionManager:
-    def __init__(self):
-        self.active_connections: List[Dict] = []
-        self.max_history = 100  # Keep last 100 messages in memory (deprecated - now using DB)
-
-    async def connect(self, websocket: WebSocket, user_id: int, username: str, db: Session):
-        """Connect a player to the global chat"""
-        await websocket.accept()
-
-        # Remove any existing connections for this user_id (prevents duplicates on reconnect)
-        self.active_connections = [
-            conn for conn in self.active_connections
-            if conn["user_id"] != user_id
-        ]
-
-        self.active_connections.append({
-            "websocket": websocket,
-            "user_id": user_id,
-            "username": username
-        })
+    """
+    Chat on top of the connection registry
+
+    Channels are "tavern:<room>" (the global tavern, sharded into rooms of
+    about room_soft_cap players) and "battle:<id>" (battle participants),
+    each the registry topic "chat:<channel>". Every chat connection is also
+    subscribed to the "chat" topic, which carries global events and whose
+    size is the online count. A user has one chat connection at a time.
+    Whispers go straight to the recipient's connections through the
+    registry's user index.
+
+    Channel membership changes are not announced one by one: they go to the
+    presence aggregator, which sends each channel one debounced
+    presence_delta, and the global online count follows at the same pace.
+    """
 
-        logger.info("player_connected_to_chat",
-                   user_id=user_id,
-                   username=username,
-                   total_users=len(self.active_connections))
+    def __init__(self, room_soft_cap: int = 200, presence_interval: float = 1.0):
+        self.room_soft_cap = room_soft_cap
+        self.max_history = 100  # Messages sent when joining a channel
+        self.presence = PresenceAggregator(
+            "chat",
+            deliver=lambda channel, event: self.broadcast(event, channel),
+            count=lambda channel: registry.count(chat_topic(channel)),
+            interval=presence_interval,
+            after_flush=self.broadcast_online_count
+        )
+        self._last_online_count = None
+        registry.watch(CHAT, joined=self._channel_joined, left=self._channel_left)
+
+    def _channel_joined(self, connection: Connection, topic: str):
+        if topic != CHAT:
+            self.presence.joined(topic[len(CHAT) + 1:], connection.user_id, connection.username)
+
+    def _channel_left(self, connection: Connection, topic: str):
+        if topic != CHAT:
+            self.presence.left(topic[len(CHAT) + 1:], connection.user_id, connection.username)
+
+    def online_count(self) -> int:
+        return registry.count(CHAT)
+
+    def room_sizes(self) -> Dict[str, int]:
+        prefix = len(CHAT) + 1
+        return {topic[prefix:]: size for topic, size in registry.topics_under(f"{CHAT}:{TAVERN}").items()}
+
+    def assign_room(self, requested: Optional[int] = None) -> str:
+        """
+        Pick a tavern room: the requested one if given (the cap is soft, so
+        friends can still meet in a full room), otherwise the lowest-numbered
+        room under the soft cap, opening a new room when all are full.
+        """
+        if requested is not None and requested >= 1:
+            return tavern_room(requested)
+
+        sizes = self.room_sizes()
+        room = 1
+        while sizes.get(tavern_room(room), 0) >= self.room_soft_cap:
+            room += 1
+        return tavern_room(room)
+
+    async def enter(self, connection: Connection, room: Optional[int] = None):
+        """Put a connection in chat: the global chat topic and a tavern room"""
+        if CHAT in connection.topics:
+            return
 
-        # Send persisted message history from database to the newly connected user
-        try:
-            # Fetch last 100 messages from database
-            messages = db.query(ChatMessage).order_by(
-                ChatMessage.created_at.desc()
-            ).limit(100).all()
-
-            # Send in chronological order (oldest first)
-            for message in reversed(messages):
-                try:
-                    await websocket.send_json(message.to_dict())
-                except Exception as e:
-                    logger.error("failed_to_send_history", error=str(e))
-        except Exception as e:
-            logger.error("failed_to_load_chat_history", error=str(e))
+        # Drop the user's other chat connection (prevents duplicates on reconnect)
+        for stale in registry.user_connections(connection.user_id, CHAT):
+            self.exit(stale)
 
-        # Broadcast online count to all users
-        await self.broadcast_online_count()
+        channel = self.assign_room(room)
+        registry.subscribe(connection, CHAT)
+        registry.subscribe(connection, chat_topic(channel))
 
-        # Send join notification
-        join_message = {
-            "type": "system",
-            "message": f"{username} has entered the tavern",
+        logger.info("player_connected_to_chat",
+                   user_id=connection.user_id,
+                   username=connection.username,
+                   room=channel,
+                   room_size=registry.count(chat_topic(channel)),
+                   total_users=self.online_count())
+
+        await self.send_to(connection, {
+            "type": "joined",
+            "channel": channel,
             "timestamp": datetime.utcnow().isoformat()
-        }
-        await self.broadcast(join_message)
-
-        # Persist join message to database
-        self._persist_system_message(db, user_id, username, join_message["message"])
+        })
+        await self.send_history(connection, channel)
 
-    def disconnect(self, websocket: WebSocket, username: str = None):
-        """Disconnect a player from the chat"""
-        self.active_connections = [
-            conn for conn in self.active_connections
-            if conn["websocket"] != websocket
-        ]
+    def exit(self, connection: Connection):
+        """Take a connection out of chat (every chat topic); others hear about it in the next presence_delta"""
+        for topic in [t for t in connection.topics if topic_matches(t, CHAT)]:
+            registry.unsubscribe(connection, topic)
 
         logger.info("player_disconnected_from_chat",
-                   username=username,
-                   total_users=len(self.active_connections))
+                   username=connection.username,
+                   total_users=self.online_count())
+
+    def can_join(self, connection: Connection, channel: str) -> bool:
+        """Whether a connection may subscribe to a (normalized) channel"""
+        kind, _, key = channel.partition(":")
+        if kind == TAVERN:
+            return True
+        if kind == BATTLE:
+            with session_scope() as db:
+                return db.query(BattleParticipant.id).join(
+                    Player, Player.id == BattleParticipant.player_id
+                ).filter(
+                    BattleParticipant.battle_id == int(key),
+                    Player.user_id == connection.user_id
+                ).first() is not None
+        return False
+
+    async def join(self, connection: Connection, channel: str) -> bool:
+        """Subscribe to a channel; joining another tavern room moves the connection there"""
+        channel = normalize_channel(channel)
+        if channel is None or not self.can_join(connection, channel):
+            return False
+
+        room = room_of(connection)
+        if channel.startswith(f"{TAVERN}:") and channel != room:
+            registry.unsubscribe(connection, chat_topic(room))
+        registry.subscribe(connection, chat_topic(channel))
+
+        await self.send_to(connection, {
+            "type": "joined",
+            "channel": channel,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+        await self.send_history(connection, channel)
+        return True
 
-    def _persist_system_message(self, db: Session, user_id: int, username: str, message: str):
-        """Persist a system message to the database"""
-        try:
-            chat_message = ChatMessage(
-                user_id=user_id,
-                username=username,
-                text=message,
-                message_type="system"
-            )
-            db.add(chat_message)
-            db.commit()
-        except Exception as e:
-            logger.error("failed_to_persist_system_message", error=str(e))
-            db.rollback()
+    async def leave(self, connection: Connection, channel: str):
+        """Unsubscribe from a channel (the current tavern room cannot be left, only switched)"""
+        if channel == room_of(connection):
+            return
+        registry.unsubscribe(connection, chat_topic(channel))
+        await self.send_to(connection, {
+            "type": "left",
+            "channel": channel,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+
+    async def send_history(self, connection: Connection, channel: str, cursor: Optional[str] = None):
+        """
+        Send a page of a channel's persisted message history (the latest
+        messages, or those before cursor) as one history_batch frame, oldest
+        first, carrying the cursor of the next older page
 
-    def _persist_user_message(self, db: Session, user_id: int, username: str, text: str):
-        """Persist a user message to the database"""
+        A single large frame instead of one per message, so permessage-deflate
+        (see app/websocket/compression.py) can compress the whole page.
+        """
         try:
-            chat_message = ChatMessage(
-                user_id=user_id,
-                username=username,
-                text=text,
-                message_type="message"
-            )
-            db.add(chat_message)
-            db.commit()
-            return chat_message
+            # Fetch the page, releasing the connection before sending
+            with session_scope() as db:
+                rows, next_cursor = keyset_page(
+                    db.query(ChatMessage).filter(ChatMessage.channel == channel),
+                    ChatMessage, self.max_history, cursor
+                )
+                messages = [message.to_dict() for message in rows]
+        except ValueError as e:
+            await self.send_to(connection, {"type": "error", "message": str(e)})
+            return
         except Exception as e:
-            logger.error("failed_to_persist_user_message", error=str(e))
-            db.rollback()
-            return None
-
-    async def broadcast(self, message: dict):
-        """Broadcast a message to all connected users"""
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection["websocket"].send_json(message)
-            except Exception as e:
-                logger.error("failed_to_send_message",
-                            username=connection.get("username"),
-                            error=str(e))
-                disconnected.append(connection)
-
-        # Remove disconnected clients
-        for conn in disconnected:
-            if conn in self.active_connections:
-                self.active_connections.remove(conn)
+            logger.error("failed_to_load_chat_history", channel=channel, error=str(e))
+            return
+
+        await self.send_to(connection, {
+            "type": "history_batch",
+            "channel": channel,
+            "messages": messages[::-1],  # Chronological order (oldest first)
+            "next_cursor": next_cursor
+        })
+
+    async def send_to(self, connection: Connection, message: Union[dict, ws_codec.Frame]) -> bool:
+        return await registry.send(connection, message)
+
+    async def broadcast(self, message: dict, channel: Optional[str] = None):
+        """Send a message to a channel's subscribers, or to everyone in chat if no channel is given"""
+        await registry.publish(CHAT if channel is None else chat_topic(channel), message)
+
+    async def whisper(self, sender: Connection, recipient_id: int, message: dict) -> bool:
+        """Deliver a private message to the recipient's chat connections, echoing it to the sender"""
+        recipients = registry.user_connections(recipient_id, CHAT)
+        if not recipients:
+            return False
+        await registry.deliver(recipients, message)
+        if recipient_id != sender.user_id:
+            await registry.deliver(registry.user_connections(sender.user_id, CHAT), message)
+        return True
 
     async def broadcast_online_count(self):
-        """Broadcast the current online user count"""
+        """Broadcast the current online user count if it changed since the last broadcast"""
+        if self.online_count() == self._last_online_count:
+            return
+        self._last_online_count = self.online_count()
         await self.broadcast({
             "type": "online_count",
-            "count": len(self.active_connections),
+            "count": self.online_count(),
             "timestamp": datetime.utcnow().isoformat()
         })
 
 
 # Global chat manager instance
-chat_manager = ChatConnectionManager()
+chat_manager = ChatConnectionManager(
+    room_soft_cap=settings.CHAT_ROOM_SOFT_CAP,
+    presence_interval=settings.PRESENCE_INTERVAL
+)
+
+
+async def reject(connection: Connection, code: str, message: str):
+    """Tell the sender a message was dropped, once per run of drops"""
+    if connection.throttled:
+        return
+    connection.throttled = True
+    await chat_manager.send_to(connection, {"type": "error", "code": code, "message": message})
+
+
+def _find_user_id(recipient) -> Optional[int]:
+    """Resolve a whisper recipient given as a user ID or a player username"""
+    if isinstance(recipient, int):
+        return recipient
+    if isinstance(recipient, str) and recipient:
+        with session_scope() as db:
+            return db.query(User.id).join(Player, Player.user_id == User.id).filter(
+                Player.username == recipient
+            ).scalar()
+    return None
+
+
+async def handle_message(connection: Connection, message_data: dict):
+    """Handle one (already rate limited) chat message from a client; see chat_websocket for the formats"""
+    user_id, username = connection.user_id, connection.username
+    message_type = message_data.get("type", "message")
+
+    if message_type == "pong":
+        return  # Answer to the registry's ping; touch() already recorded it
+
+    if message_type == "join":
+        channel = str(message_data.get("channel", ""))
+        if not await chat_manager.join(connection, channel):
+            await chat_manager.send_to(connection, {
+                "type": "error",
+                "message": f"Cannot join channel {channel}"
+            })
+        return
+
+    if message_type == "leave":
+        await chat_manager.leave(connection, str(message_data.get("channel", "")))
+        return
+
+    if message_type == "history":
+        # Older pages of a joined channel, using history_batch's next_cursor
+        channel = message_data.get("channel") or room_of(connection)
+        cursor = message_data.get("cursor")
+        if isinstance(channel, str) and chat_topic(channel) in connection.topics and (cursor is None or isinstance(cursor, str)):
+            await chat_manager.send_history(connection, channel, cursor)
+        return
+
+    # Extract text from message
+    text = message_data.get("text", "")
+    if not text or not isinstance(text, str):
+        return
+    if len(text) > settings.CHAT_MAX_MESSAGE_LENGTH:
+        chat_limiter.record_drop(user_id)
+        await reject(connection, "too_long", f"Messages are limited to {settings.CHAT_MAX_MESSAGE_LENGTH} characters")
+        return
+
+    if message_type == "whisper":
+        recipient_id = _find_user_id(message_data.get("to"))
+        whisper = {
+            "type": WHISPER,
+            "username": username,
+            "userId": user_id,
+            "to": recipient_id,
+            "text": text,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        if recipient_id is None or not await chat_manager.whisper(connection, recipient_id, whisper):
+            await chat_manager.send_to(connection, {
+                "type": "error",
+                "message": "That player is not online"
+            })
+        return
+
+    channel = message_data.get("channel") or room_of(connection)
+    if not isinstance(channel, str) or chat_topic(channel) not in connection.topics:
+        await chat_manager.send_to(connection, {
+            "type": "error",
+            "message": f"Not in channel {channel}"
+        })
+        return
+
+    # Add server-side metadata
+    now = datetime.utcnow()
+    message_data = {
+        "type": "message",
+        "channel": channel,
+        "username": username,
+        "userId": user_id,
+        "text": text,
+        "timestamp": now.isoformat()
+    }
+
+    # Persist in the next batch; the row gets the same timestamp as the broadcast
+    chat_writer.queue(user_id, username, text, channel, created_at=now)
+
+    # Deliver to the channel's subscribers
+    await chat_manager.broadcast(message_data, channel)
 
 
 @router.websocket("/ws/chat")
 async def chat_websocket(
     websocket: WebSocket,
     token: str = Query(...),
-    db: Session = Depends(get_db)
+    room: Optional[int] = Query(None)
 ):
     """
-    WebSocket endpoint for global chat
+    WebSocket endpoint for chat
+
+    Holds no DB session of its own; each DB access opens a short session_scope().
+
+    Client messages:
+    - {"text": "..."} or {"text": "...", "channel": "battle:12"}: post to the
+      current tavern room or a joined channel
+    - {"type": "join" | "leave", "channel": "tavern:3" | "battle:12"}
+    - {"type": "history", "channel": "tavern:3", "cursor": "<next_cursor>"}:
+      the page of messages before the cursor
+    - {"type": "whisper", "to": "<username or user id>", "text": "..."}
+    - {"type": "pong"}: answer to the server's {"type": "ping"}
     """
     # Validate token
     try:
@@ -161,12 +389,12 @@ async def chat_websocket(
         if not user_id:
             await websocket.close(code=1008, reason="Invalid token")
             return
+        user_id = int(user_id)
 
         # Get player username from database
-        player = db.query(Player).filter(Player.user_id == int(user_id)).first()
-        if player and player.username:
-            username = player.username
-        else:
+        with session_scope() as db:
+            username = db.query(Player.username).filter(Player.user_id == user_id).scalar()
+        if not username:
             username = f"Player{user_id}"
 
     except Exception as e:
@@ -175,52 +403,32 @@ async def chat_websocket(
         return
 
     # Connect the user
-    await chat_manager.connect(websocket, user_id, username, db)
+    connection = await registry.accept(websocket, user_id, username)
+    await chat_manager.enter(connection, room)
 
     try:
         while True:
             # Receive message from client
             data = await websocket.receive_text()
-            message_data = json.loads(data)
-
-            # Extract text from message
-            text = message_data.get("text", "")
-
-            # Add server-side metadata
-            message_data["username"] = username
-            message_data["userId"] = user_id
-            message_data["timestamp"] = datetime.utcnow().isoformat()
-            message_data["type"] = "message"
-
-            logger.info("chat_message_received",
-                       user_id=user_id,
-                       username=username,
-                       message=text[:50])
+            registry.touch(connection)
 
-            # Persist message to database
-            persisted_message = chat_manager._persist_user_message(db, user_id, username, text)
+            # Flood control happens before the frame is parsed, logged, stored or fanned out
+            if message_too_large(data):
+                chat_limiter.record_drop(user_id)
+                await reject(connection, "too_large", "Message too large")
+                continue
+            if not chat_limiter.allow(user_id):
+                await reject(connection, "rate_limited", "You are sending messages too fast")
+                continue
+            connection.throttled = False
 
-            # If persistence succeeded, use the persisted message data with ID
-            if persisted_message:
-                message_data = persisted_message.to_dict()
-
-            # Broadcast to all connected users
-            await chat_manager.broadcast(message_data)
+            await handle_message(connection, json.loads(data))
 
     except WebSocketDisconnect:
         logger.info("chat_websocket_disconnect", user_id=user_id, username=username)
     except Exception as e:
         logger.error("chat_websocket_error", user_id=user_id, error=str(e))
     finally:
-        # Disconnect and notify others
-        chat_manager.disconnect(websocket, username)
-        await chat_manager.broadcast_online_count()
-        leave_message = {
-            "type": "system",
-            "message": f"{username} has left the tavern",
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        await chat_manager.broadcast(leave_message)
-
-        # Persist leave message to database
-        chat_manager._persist_system_message(db, user_id, username, leave_message["message"])
+        # Others hear about it in the next presence_delta
+        chat_manager.exit(connection)
+        registry.remove(connection)
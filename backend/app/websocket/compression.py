@@ -0,0 +1,101 @@
+"""
+permessage-deflate with a size threshold
+
+Uvicorn's stock WebSocket protocol compresses every outgoing message once
+permessage-deflate is negotiated. Most of our traffic is small (attacks,
+presence, pongs) where deflate saves a few bytes for a disproportionate CPU
+cost. This protocol negotiates the same extension but sends messages under
+WS_COMPRESS_THRESHOLD bytes uncompressed (RSV1 unset, which RFC 7692
+allows), so only large frames such as history batches are deflated.
+
+Compression counters are exposed through get_metrics() in /api/ws/status.
+Enabled by running the app with the app.workers.GameUvicornWorker worker,
+which passes this class to uvicorn as its WebSocket protocol.
+"""
+import time
+from typing import Any, Sequence, Tuple
+
+from uvicorn.protocols.websockets.websockets_sansio_impl import WebSocketsSansIOProtocol
+from websockets.extensions.permessage_deflate import PerMessageDeflate, ServerPerMessageDeflateFactory
+from websockets.frames import CTRL_OPCODES, Frame, Opcode
+
+from app.core.config import settings
+
+# Counters for get_metrics()
+_stats = {
+    "frames_compressed": 0,
+    "frames_skipped": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+    "compress_seconds": 0.0,
+}
+
+
+class ThresholdPerMessageDeflate(PerMessageDeflate):
+    """PerMessageDeflate that leaves messages smaller than threshold bytes uncompressed"""
+
+    def __init__(self, *args, threshold: int = 0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threshold = threshold
+
+    def encode(self, frame: Frame) -> Frame:
+        if frame.opcode in CTRL_OPCODES:
+            return frame
+        if frame.opcode is not Opcode.CONT and frame.fin and len(frame.data) < self.threshold:
+            _stats["frames_skipped"] += 1
+            return frame
+
+        started = time.perf_counter()
+        encoded = super().encode(frame)
+        _stats["compress_seconds"] += time.perf_counter() - started
+        _stats["frames_compressed"] += 1
+        _stats["bytes_in"] += len(frame.data)
+        _stats["bytes_out"] += len(encoded.data)
+        return encoded
+
+
+class ThresholdPerMessageDeflateFactory(ServerPerMessageDeflateFactory):
+    """Server-side negotiation as usual, producing ThresholdPerMessageDeflate extensions"""
+
+    def __init__(self, threshold: int, **kwargs):
+        super().__init__(**kwargs)
+        self.threshold = threshold
+
+    def process_request_params(self, params: Sequence[Tuple[str, Any]], accepted_extensions: Sequence[Any]):
+        response_params, extension = super().process_request_params(params, accepted_extensions)
+        return response_params, ThresholdPerMessageDeflate(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings,
+            threshold=self.threshold
+        )
+
+
+class CompressingWebSocketProtocol(WebSocketsSansIOProtocol):
+    """Uvicorn's websockets-sansio protocol with the thresholded permessage-deflate extension"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.config.ws_per_message_deflate:
+            self.conn.available_extensions = [
+                # Same window and memory settings as uvicorn's own factory
+                ThresholdPerMessageDeflateFactory(
+                    threshold=settings.WS_COMPRESS_THRESHOLD,
+                    server_max_window_bits=12,
+                    client_max_window_bits=12,
+                    compress_settings={"memLevel": 5, "level": settings.WS_COMPRESS_LEVEL}
+                )
+            ]
+
+
+def get_metrics() -> dict:
+    bytes_in = _stats["bytes_in"]
+    return {
+        "enabled": settings.WS_PER_MESSAGE_DEFLATE,
+        "threshold": settings.WS_COMPRESS_THRESHOLD,
+        **_stats,
+        "compress_seconds": round(_stats["compress_seconds"], 6),
+        "ratio": round(_stats["bytes_out"] / bytes_in, 3) if bytes_in else None
+    }
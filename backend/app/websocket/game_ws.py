@@ -0,0 +1,206 @@
+"""
+Multiplexed WebSocket endpoint
+
+One socket for every real-time feature instead of a chat, a battle and a
+PVP socket per player. The client subscribes to registry topics and tags
+each message with the topic it is meant for:
+
+    ws://localhost:8000/ws?token=<jwt_token>
+
+Client messages:
+- {"type": "subscribe", "topic": "chat", "room": 3}: chat (room is optional)
+- {"type": "subscribe", "topic": "raid:<battle_id>"}: raid battle events
+- {"type": "subscribe", "topic": "pvp"}: the PVP lobby
+- {"type": "subscribe", "topic": "pvp_battle:<battle_id>"}: a PVP duel
+- {"type": "unsubscribe", "topic": "..."}
+- {"topic": "chat", ...}: what /ws/chat accepts (text, join, leave, history, whisper)
+- {"topic": "raid:<battle_id>", ...}: what /ws/battle/{battle_id} accepts
+- {"topic": "pvp_battle:<battle_id>", ...}: what /api/ws/pvp-battle/{battle_id} accepts
+- {"type": "pong"}: answer to the server's {"type": "ping"}
+
+The server sends the same events as the per-feature endpoints, plus
+{"type": "subscribed" | "unsubscribed", "topic": "..."}. Events identify
+their topic by "channel" (chat) or "battle_id" (raid and PVP battles).
+"""
+import json
+from typing import Optional
+
+import structlog
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
+
+from app.api.websocket import enter_pvp_battle, handle_pvp_battle_message, load_battle
+from app.core.security import decode_access_token
+from app.db.database import session_scope
+from app.models.player import Player
+from app.services.pvp_battle_manager import PVP_BATTLE, pvp_battle_manager
+from app.services.rate_limiter import (
+    battle_limiter, chat_limiter, message_too_large, pvp_battle_limiter, pvp_limiter
+)
+from app.services.websocket_manager import LOBBY, manager as lobby
+from app.websocket import battle_ws, chat_ws
+from app.websocket.battle_ws import RAID
+from app.websocket.chat_ws import CHAT, chat_manager
+from app.websocket.registry import Connection, registry
+
+logger = structlog.get_logger()
+
+router = APIRouter()
+
+
+def _battle_key(topic: str, prefix: str) -> Optional[str]:
+    """The battle ID part of "<prefix>:<battle_id>", or None"""
+    kind, _, key = topic.partition(":")
+    return key if kind == prefix and key else None
+
+
+async def subscribe(connection: Connection, message: dict) -> Optional[str]:
+    """Subscribe to a topic; returns an error message if that is not possible"""
+    topic = message.get("topic")
+    if not isinstance(topic, str):
+        return "Missing topic"
+
+    if topic == CHAT:
+        room = message.get("room")
+        await chat_manager.enter(connection, room if isinstance(room, int) else None)
+        return None
+
+    if topic == LOBBY:
+        if connection.player_id is None:
+            return "No player for this account"
+        await lobby.join(connection)
+        return None
+
+    raid_key = _battle_key(topic, RAID)
+    if raid_key is not None and raid_key.isdigit():
+        await battle_ws.enter_battle(connection, int(raid_key))
+        return None
+
+    battle_key = _battle_key(topic, PVP_BATTLE)
+    if battle_key is not None:
+        battle = await load_battle(battle_key)
+        if not battle:
+            return "Battle not found"
+        if connection.player_id is None or not battle.is_player_in_battle(connection.player_id):
+            return "Not a participant"
+        await enter_pvp_battle(connection, battle)
+        return None
+
+    return f"Unknown topic {topic}"
+
+
+async def unsubscribe(connection: Connection, topic: str):
+    if topic == CHAT:
+        chat_manager.exit(connection)
+    elif topic == LOBBY:
+        lobby.leave(connection)
+    elif topic in connection.topics:
+        raid_key = _battle_key(topic, RAID)
+        if raid_key is not None:
+            await battle_ws.leave_battle(connection, int(raid_key))
+        else:
+            await pvp_battle_manager.unregister_connection(_battle_key(topic, PVP_BATTLE), connection)
+
+
+def _allow(connection: Connection, topic: str) -> bool:
+    """Per-feature flood control, the same limits as on the feature's own endpoint"""
+    if topic == CHAT:
+        return chat_limiter.allow(connection.user_id)
+    if topic.startswith(f"{RAID}:"):
+        return battle_limiter.allow(connection.user_id)
+    if topic.startswith(f"{PVP_BATTLE}:"):
+        return pvp_battle_limiter.allow(connection.player_id)
+    return pvp_limiter.allow(connection.user_id)
+
+
+async def route(connection: Connection, message: dict):
+    """Hand a topic-tagged message to the feature it belongs to"""
+    topic = message.get("topic")
+    if not isinstance(topic, str) or topic not in connection.topics:
+        await registry.send(connection, {"type": "error", "message": f"Not subscribed to {topic}"})
+        return
+
+    if not _allow(connection, topic):
+        if not connection.throttled:
+            connection.throttled = True
+            await registry.send(connection, {
+                "type": "error",
+                "code": "rate_limited",
+                "message": "Too many messages, slow down"
+            })
+        return
+    connection.throttled = False
+
+    if topic == CHAT:
+        await chat_ws.handle_message(connection, message)
+    elif topic.startswith(f"{RAID}:"):
+        await battle_ws.handle_message(connection, int(_battle_key(topic, RAID)), message)
+    elif topic.startswith(f"{PVP_BATTLE}:"):
+        battle_id = _battle_key(topic, PVP_BATTLE)
+        if not await handle_pvp_battle_message(connection, battle_id, message):
+            # Forfeited: the battle is over for this player
+            await pvp_battle_manager.unregister_connection(battle_id, connection)
+
+
+@router.websocket("/ws")
+async def game_websocket(websocket: WebSocket, token: str = Query(...)):
+    """Multiplexed WebSocket endpoint (see the module docstring for the protocol)"""
+    try:
+        payload = decode_access_token(token)
+        user_id = int(payload.get("sub"))
+
+        with session_scope() as db:
+            row = db.query(Player.id, Player.username).filter(Player.user_id == user_id).first()
+        player_id, username = row if row else (None, f"Player{user_id}")
+    except Exception as e:
+        logger.error("game_ws_auth_failed", error=str(e))
+        await websocket.close(code=1008, reason="Authentication failed")
+        return
+
+    connection = await registry.accept(websocket, user_id, username, player_id)
+    try:
+        while True:
+            data = await websocket.receive_text()
+            registry.touch(connection)
+
+            if message_too_large(data):
+                pvp_limiter.record_drop(user_id)
+                continue
+
+            message = json.loads(data)
+            if not isinstance(message, dict):
+                continue
+            message_type = message.get("type")
+
+            if message_type == "pong":
+                continue  # Answer to the registry's ping; touch() already recorded it
+
+            if message_type in ("subscribe", "unsubscribe"):
+                # Subscription changes share the lobby's (per user) limit
+                if not pvp_limiter.allow(user_id):
+                    continue
+                topic = message.get("topic")
+                if message_type == "subscribe":
+                    error = await subscribe(connection, message)
+                else:
+                    error = None if isinstance(topic, str) else "Missing topic"
+                    if error is None:
+                        await unsubscribe(connection, topic)
+                await registry.send(connection, {"type": "error", "message": error} if error else {
+                    "type": f"{message_type}d",
+                    "topic": topic
+                })
+                continue
+
+            await route(connection, message)
+
+    except WebSocketDisconnect:
+        logger.info("game_websocket_disconnect", user_id=user_id)
+    except Exception as e:
+        logger.error("game_websocket_error", user_id=user_id, error=str(e))
+    finally:
+        # Raid battles announce departures; every other feature hears about it through registry hooks
+        for topic in list(connection.topics):
+            raid_key = _battle_key(topic, RAID)
+            if raid_key is not None:
+                await battle_ws.leave_battle(connection, int(raid_key))
+        registry.remove(connection)
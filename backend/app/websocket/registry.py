@@ -0,0 +1,294 @@
+"""
+One registry for every WebSocket connection
+
+Each socket is a Connection, indexed by websocket, user, player and topic.
+Topics name the streams of events a connection receives:
+
+    chat                  global chat events (online_count); every chat user
+    chat:tavern:<room>    a tavern room
+    chat:battle:<id>      a battle's chat channel
+    raid:<battle_id>      raid battle events
+    pvp                   the PVP lobby (challenges, online presence)
+    pvp_battle:<id>       a live PVP duel
+
+The per-feature endpoints (/ws/chat, /ws/battle/{id}, /api/ws/pvp,
+/api/ws/pvp-battle/{id}) each hold one socket subscribed to that feature's
+topics; /ws multiplexes any combination of them over a single socket.
+Every outgoing message goes through send(), which drops the connection from
+every index if the socket is gone, and publish() encodes a message once for
+all of a topic's subscribers.
+
+Features react to subscription changes with watch() hooks (presence,
+abandoned PVP battles), so they see the same events whether a connection
+leaves a topic explicitly, disconnects, fails a send or is reaped.
+
+Liveness: connections are touched whenever the client sends something, and
+one background reaper walks the ones that have gone quiet:
+
+- silent for WS_PING_INTERVAL seconds: sent {"type": "ping"}, which clients
+  answer with {"type": "pong"} (any message counts as a sign of life)
+- silent for WS_IDLE_TIMEOUT seconds: removed from the registry, then
+  closed with code 4408
+
+Removing the connection before closing it means a zombie socket stops
+counting towards broadcasts and online counts straight away, even if the
+close handshake never completes. Connections are kept in an OrderedDict
+keyed by websocket, least recently seen first: touch and removal are O(1)
+and a sweep stops at the first connection that is still fresh.
+"""
+import asyncio
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import structlog
+from fastapi import WebSocket
+
+from app.core.config import settings
+from app.services import ws_codec
+
+logger = structlog.get_logger()
+
+# Close code for connections reaped after WS_IDLE_TIMEOUT (4000-4999 is application-defined)
+IDLE_CLOSE_CODE = 4408
+
+PING = {"type": "ping"}
+
+
+@dataclass(eq=False)
+class Connection:
+    """One socket, who it belongs to and the topics it is subscribed to"""
+    websocket: WebSocket
+    user_id: int
+    username: str
+    player_id: Optional[int] = None
+    topics: Set[str] = field(default_factory=set)
+    throttled: bool = False  # Already told about the current run of dropped messages
+    connected_at: float = field(default_factory=time.monotonic)
+    last_seen: float = field(default_factory=time.monotonic)
+    pinged_at: Optional[float] = None
+
+
+TopicHook = Callable[[Connection, str], None]
+
+
+def topic_matches(topic: str, prefix: str) -> bool:
+    """Whether topic is prefix itself or one of its sub-topics ("chat" matches "chat:tavern:1")"""
+    return topic == prefix or topic.startswith(prefix + ":")
+
+
+class ConnectionRegistry:
+    """All open sockets, their subscriptions and the single send path and reaper"""
+
+    def __init__(self, ping_interval: float, idle_timeout: float):
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.connections: "OrderedDict[WebSocket, Connection]" = OrderedDict()
+        self.users: Dict[int, Set[Connection]] = defaultdict(set)
+        self.players: Dict[int, Set[Connection]] = defaultdict(set)
+        self.topics: Dict[str, Set[Connection]] = defaultdict(set)
+        self._hooks: List[Tuple[str, Optional[TopicHook], Optional[TopicHook]]] = []
+        self._task: Optional[asyncio.Task] = None
+
+        # Counters for get_metrics()
+        self.send_failures = 0
+        self.pings_sent = 0
+        self.reaped = 0
+
+    # Connections
+
+    async def accept(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        username: str,
+        player_id: Optional[int] = None
+    ) -> Connection:
+        """Accept a socket (negotiating its encoding) and register it"""
+        await websocket.accept(subprotocol=ws_codec.negotiate(websocket))
+        connection = Connection(websocket, user_id, username, player_id)
+        self.connections[websocket] = connection
+        self.users[user_id].add(connection)
+        if player_id is not None:
+            self.players[player_id].add(connection)
+        return connection
+
+    def get(self, websocket: WebSocket) -> Optional[Connection]:
+        return self.connections.get(websocket)
+
+    def remove(self, connection: Connection):
+        """Unsubscribe a connection from everything and forget it; safe to call more than once"""
+        if self.connections.get(connection.websocket) is connection:
+            del self.connections[connection.websocket]
+        for topic in list(connection.topics):
+            self.unsubscribe(connection, topic)
+        self._discard(self.users, connection.user_id, connection)
+        if connection.player_id is not None:
+            self._discard(self.players, connection.player_id, connection)
+
+    @staticmethod
+    def _discard(index: Dict, key, connection: Connection):
+        members = index.get(key)
+        if members is not None:
+            members.discard(connection)
+            if not members:
+                del index[key]
+
+    def user_connections(self, user_id: int, topic: Optional[str] = None) -> List[Connection]:
+        """A user's connections, optionally only those subscribed to topic"""
+        return [c for c in self.users.get(user_id, ()) if topic is None or topic in c.topics]
+
+    def player_connections(self, player_id: int, topic: Optional[str] = None) -> List[Connection]:
+        return [c for c in self.players.get(player_id, ()) if topic is None or topic in c.topics]
+
+    # Topics
+
+    def watch(self, prefix: str, joined: Optional[TopicHook] = None, left: Optional[TopicHook] = None):
+        """Call joined/left(connection, topic) whenever a topic matching prefix gains or loses a subscriber"""
+        self._hooks.append((prefix, joined, left))
+
+    def _notify(self, connection: Connection, topic: str, joined: bool):
+        for prefix, on_joined, on_left in self._hooks:
+            hook = on_joined if joined else on_left
+            if hook is not None and topic_matches(topic, prefix):
+                try:
+                    hook(connection, topic)
+                except Exception as e:
+                    logger.error("topic_hook_failed", topic=topic, error=str(e))
+
+    def subscribe(self, connection: Connection, topic: str) -> bool:
+        """Subscribe to a topic; False if already subscribed"""
+        if topic in connection.topics:
+            return False
+        connection.topics.add(topic)
+        self.topics[topic].add(connection)
+        self._notify(connection, topic, joined=True)
+        return True
+
+    def unsubscribe(self, connection: Connection, topic: str) -> bool:
+        """Unsubscribe from a topic; False if not subscribed"""
+        if topic not in connection.topics:
+            return False
+        connection.topics.discard(topic)
+        self._discard(self.topics, topic, connection)
+        self._notify(connection, topic, joined=False)
+        return True
+
+    def members(self, topic: str) -> Set[Connection]:
+        return self.topics.get(topic, set())
+
+    def count(self, topic: str) -> int:
+        return len(self.topics.get(topic, ()))
+
+    def topics_under(self, prefix: str) -> Dict[str, int]:
+        """Subscriber count of each existing topic matching prefix"""
+        return {topic: len(members) for topic, members in self.topics.items() if topic_matches(topic, prefix)}
+
+    # Sending
+
+    async def send(self, connection: Connection, message: Union[Dict, ws_codec.Frame]) -> bool:
+        """Send in the connection's negotiated encoding; a failed send removes the connection"""
+        try:
+            await ws_codec.send(connection.websocket, message)
+            return True
+        except Exception as e:
+            self.send_failures += 1
+            logger.error("websocket_send_failed", user_id=connection.user_id, error=str(e))
+            self.remove(connection)
+            return False
+
+    async def deliver(self, connections: Iterable[Connection], message: Union[Dict, ws_codec.Frame]) -> int:
+        """Send one message to many connections, encoding it once; returns how many got it"""
+        frame = message if isinstance(message, ws_codec.Frame) else ws_codec.Frame(message)
+        # Snapshot first: failed sends remove connections from the live sets
+        delivered = 0
+        for connection in list(connections):
+            delivered += await self.send(connection, frame)
+        return delivered
+
+    async def publish(self, topic: str, message: Union[Dict, ws_codec.Frame], exclude: Optional[Connection] = None) -> int:
+        """Send a message to every subscriber of a topic"""
+        members = self.topics.get(topic, ())
+        return await self.deliver((c for c in list(members) if c is not exclude), message)
+
+    async def send_to_user(self, user_id: int, message: Dict, topic: Optional[str] = None) -> int:
+        return await self.deliver(self.user_connections(user_id, topic), message)
+
+    async def send_to_player(self, player_id: int, message: Dict, topic: Optional[str] = None) -> int:
+        return await self.deliver(self.player_connections(player_id, topic), message)
+
+    # Liveness
+
+    def touch(self, connection: Connection):
+        """Record that the client was heard from"""
+        connection.last_seen = time.monotonic()
+        if self.connections.get(connection.websocket) is connection:
+            self.connections.move_to_end(connection.websocket)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.ping_interval / 2)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error("connection_sweep_failed", error=str(e))
+
+    async def sweep(self, now: Optional[float] = None):
+        """Ping quiet connections and reap silent ones, oldest first"""
+        now = now or time.monotonic()
+        for connection in list(self.connections.values()):
+            idle = now - connection.last_seen
+            if idle < self.ping_interval:
+                break  # Everything after this was seen more recently
+            if idle >= self.idle_timeout:
+                await self._reap(connection)
+            elif connection.pinged_at is None or connection.pinged_at < connection.last_seen:
+                connection.pinged_at = now
+                if await self.send(connection, PING):
+                    self.pings_sent += 1
+                else:
+                    await self._reap(connection)
+
+    async def _reap(self, connection: Connection):
+        self.remove(connection)
+        self.reaped += 1
+        logger.info("websocket_reaped",
+                   user_id=connection.user_id,
+                   idle_seconds=round(time.monotonic() - connection.last_seen))
+        try:
+            await connection.websocket.close(code=IDLE_CLOSE_CODE, reason="Idle timeout")
+        except Exception:
+            pass  # Already closed or the transport is gone
+
+    def get_metrics(self) -> Dict:
+        return {
+            "open": len(self.connections),
+            "users": len(self.users),
+            "topics": len(self.topics),
+            "subscriptions": sum(len(members) for members in self.topics.values()),
+            "send_failures": self.send_failures,
+            "pings_sent": self.pings_sent,
+            "reaped": self.reaped,
+            "ping_interval": self.ping_interval,
+            "idle_timeout": self.idle_timeout
+        }
+
+
+registry = ConnectionRegistry(
+    ping_interval=settings.WS_PING_INTERVAL,
+    idle_timeout=settings.WS_IDLE_TIMEOUT
+)
@@ -0,0 +1,20 @@
+"""
+Gunicorn worker class
+
+    gunicorn app.main:app --worker-class app.workers.GameUvicornWorker ...
+
+A UvicornWorker that serves WebSockets with the thresholded
+permessage-deflate protocol (app.websocket.compression) and turns
+compression on or off from WS_PER_MESSAGE_DEFLATE.
+"""
+from uvicorn.workers import UvicornWorker
+
+from app.core.config import settings
+
+
+class GameUvicornWorker(UvicornWorker):
+    CONFIG_KWARGS = {
+        **UvicornWorker.CONFIG_KWARGS,
+        "ws": "app.websocket.compression:CompressingWebSocketProtocol",
+        "ws_per_message_deflate": settings.WS_PER_MESSAGE_DEFLATE,
+    }
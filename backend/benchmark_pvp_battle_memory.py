@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Measure per-duel memory of PVP BattleState
+
+Builds N battles, plays M turns in each and reports tracemalloc bytes per
+battle for the current slotted/array-backed BattleState next to the
+dict-and-list layout it replaced.
+
+Usage: python benchmark_pvp_battle_memory.py [battles] [turns]
+"""
+import gc
+import random
+import sys
+import tracemalloc
+from datetime import datetime
+
+from app.services.pvp_battle_manager import BattleState, ActionType
+
+
+class DictBattleState:
+    """Previous BattleState layout: instance __dict__, player dicts, dict log"""
+
+    def __init__(self, duel_id, player1_id, player2_id, player1_data, player2_data, gold_stake):
+        self.duel_id = duel_id
+        self.battle_id = f"pvp_{duel_id}_{int(datetime.utcnow().timestamp())}"
+        self.player1_id = player1_id
+        self.player2_id = player2_id
+        self.player1_data = player1_data
+        self.player2_data = player2_data
+        self.player1_hp = player1_data['max_hp']
+        self.player2_hp = player2_data['max_hp']
+        self.player1_max_hp = player1_data['max_hp']
+        self.player2_max_hp = player2_data['max_hp']
+        self.phase = "waiting"
+        self.current_turn = 1
+        self.turn_actions = {player1_id: None, player2_id: None}
+        self.gold_stake = gold_stake
+        self.battle_log = []
+        self.winner_id = None
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self.players_ready = set()
+
+    def mark_ready(self, player_id):
+        self.players_ready.add(player_id)
+
+    def set_action(self, player_id, action):
+        self.turn_actions[player_id] = action
+
+    def record_turn(self, p1_damage_dealt, p2_damage_dealt):
+        self.battle_log.append({
+            "turn": self.current_turn,
+            "p1_action": self.turn_actions[self.player1_id].value,
+            "p2_action": self.turn_actions[self.player2_id].value,
+            "p1_damage_dealt": p1_damage_dealt,
+            "p2_damage_dealt": p2_damage_dealt,
+            "p1_hp": self.player1_hp,
+            "p2_hp": self.player2_hp
+        })
+
+
+def player_data(player_id: int) -> dict:
+    return {
+        'id': player_id,
+        'username': f"player_{player_id}",
+        'level': random.randint(1, 50),
+        'attack': random.randint(10, 200),
+        'defense': random.randint(5, 100),
+        'max_hp': random.randint(100, 1000)
+    }
+
+
+def measure(state_cls, battles: int, turns: int) -> int:
+    """Return traced bytes per battle after building and playing all battles"""
+    random.seed(42)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    states = []
+    for i in range(battles):
+        state = state_cls(i, 2 * i, 2 * i + 1, player_data(2 * i), player_data(2 * i + 1), 100)
+        state.mark_ready(state.player1_id)
+        state.mark_ready(state.player2_id)
+        for turn in range(turns):
+            state.set_action(state.player1_id, ActionType.ATTACK)
+            state.set_action(state.player2_id, ActionType.DEFEND)
+            state.record_turn(random.randint(1, 50), random.randint(1, 50))
+            state.current_turn += 1
+        states.append(state)
+
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) // battles
+
+
+def main():
+    battles = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+
+    old = measure(DictBattleState, battles, turns)
+    new = measure(BattleState, battles, turns)
+
+    print(f"{battles} battles x {turns} turns")
+    print(f"  dict layout:    {old:>8,} bytes/battle")
+    print(f"  slotted layout: {new:>8,} bytes/battle")
+    print(f"  reduction:      {100 - (new * 100 // old)}%")
+
+
+if __name__ == "__main__":
+    main()
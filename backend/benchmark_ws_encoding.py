@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Compare JSON and the compact MessagePack WebSocket encoding
+
+Encodes a stream of representative high-frequency events (raid attacks,
+batched attacks, PVP turn results, presence deltas) with both encodings and
+reports bytes per event and encode time per event, plus the cost of a
+broadcast to many sockets with and without the shared Frame.
+
+Requires msgpack. Usage: python benchmark_ws_encoding.py [events] [recipients]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from app.services import ws_codec
+
+
+def attack(i: int) -> dict:
+    return {
+        "type": "attack",
+        "player_name": f"raider_{i % 50}",
+        "player_level": random.randint(1, 60),
+        "enemy_id": random.randint(1, 5000),
+        "damage": random.randint(10, 5000),
+        "is_critical": random.random() < 0.2,
+        "enemy_hp_remaining": random.randint(0, 1_000_000),
+        "enemy_defeated": False,
+        "battle_completed": False
+    }
+
+
+def attack_batch(i: int) -> dict:
+    hits = [
+        {"enemy_id": random.randint(1, 5000), "damage": random.randint(10, 5000),
+         "is_critical": random.random() < 0.2, "enemy_hp_remaining": random.randint(0, 1_000_000)}
+        for _ in range(5)
+    ]
+    return {
+        "type": "attack_batch",
+        "player_name": f"raider_{i % 50}",
+        "player_level": random.randint(1, 60),
+        "hits": hits,
+        "total_damage": sum(hit["damage"] for hit in hits),
+        "defeated_enemy_ids": [],
+        "battle_completed": False,
+        "phase_transitions": []
+    }
+
+
+def turn_result(i: int, now: datetime) -> dict:
+    p1, p2 = 2 * i, 2 * i + 1
+    return {
+        "type": "turn_result",
+        "turn": i % 30 + 1,
+        "actions": {p1: "attack", p2: "defend"},
+        "damage": {p1: random.randint(0, 80), p2: random.randint(0, 80)},
+        "hp": {p1: random.randint(0, 1000), p2: random.randint(0, 1000)},
+        "effects": [],
+        "battle_id": f"pvp_{i}_1760000000",
+        "timestamp": (now + timedelta(seconds=i)).isoformat()
+    }
+
+
+def presence_delta(i: int) -> dict:
+    return {
+        "type": "presence_delta",
+        "channel": f"tavern:{i % 8 + 1}",
+        "joined": [{"user_id": 1000 + i, "username": f"player_{i}"}],
+        "left": [],
+        "count": random.randint(1, 200)
+    }
+
+
+def events(count: int) -> list:
+    random.seed(42)
+    now = datetime.utcnow()
+    makers = [attack, attack, attack_batch, lambda i: turn_result(i, now), presence_delta]
+    return [makers[i % len(makers)](i) for i in range(count)]
+
+
+def measure(encode, messages: list):
+    """(total bytes, seconds) to encode every message once"""
+    start = time.perf_counter()
+    total = sum(len(encode(message)) for message in messages)
+    return total, time.perf_counter() - start
+
+
+def main():
+    if ws_codec.msgpack is None:
+        sys.exit("msgpack is not installed")
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    recipients = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    messages = events(count)
+
+    json_bytes, json_time = measure(lambda m: ws_codec.encode_json(m).encode(), messages)
+    pack_bytes, pack_time = measure(ws_codec.encode_msgpack, messages)
+
+    print(f"{count} events")
+    print(f"  json:    {json_bytes / count:7.1f} bytes/event  {json_time / count * 1e6:6.2f} us/event")
+    print(f"  msgpack: {pack_bytes / count:7.1f} bytes/event  {pack_time / count * 1e6:6.2f} us/event")
+    print(f"  size reduction: {100 - (pack_bytes * 100 // json_bytes)}%")
+
+    # Broadcast: encoding per recipient (old send_json loop) vs one shared Frame
+    sample = messages[:1000]
+    start = time.perf_counter()
+    for message in sample:
+        for _ in range(recipients):
+            ws_codec.encode_json(message)
+    per_recipient = time.perf_counter() - start
+    start = time.perf_counter()
+    for message in sample:
+        frame = ws_codec.Frame(message)
+        for _ in range(recipients):
+            frame.text
+    shared = time.perf_counter() - start
+
+    print(f"{len(sample)} broadcasts to {recipients} sockets")
+    print(f"  encode per recipient: {per_recipient * 1000:8.1f} ms")
+    print(f"  shared Frame:         {shared * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
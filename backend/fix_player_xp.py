@@ -0,0 +1,19 @@
+"""
+Fix corrupted player XP values in database.
+
+The old buggy code was storing progress within current level instead of total lifetime XP.
+This is now the `player_xp` maintenance job, which runs in small resumable chunks;
+this script is kept as a shortcut for:
+
+    python -m app.maintenance run player_xp [--dry-run] [--restart] ...
+"""
+import sys
+import os
+
+# Add backend directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.maintenance.__main__ import main
+
+if __name__ == "__main__":
+    sys.exit(main(["run", "player_xp", *sys.argv[1:]]))
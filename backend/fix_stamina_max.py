@@ -0,0 +1,20 @@
+"""
+Fix corrupted stamina_max values in database.
+
+Players who had stamina boost potions that expired without restoration
+have permanently increased stamina_max. This is now the `stamina_max`
+maintenance job, which runs in small resumable chunks; this script is kept
+as a shortcut for:
+
+    python -m app.maintenance run stamina_max [--dry-run] [--restart] ...
+"""
+import sys
+import os
+
+# Add backend directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.maintenance.__main__ import main
+
+if __name__ == "__main__":
+    sys.exit(main(["run", "stamina_max", *sys.argv[1:]]))
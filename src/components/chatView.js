@@ -473,6 +473,24 @@ function initializeChat(messagesArea, messageInput, inputForm) {
         }
     }
 
+    // Show who entered/left the room since the last update (sent at most once per second)
+    function handlePresenceDelta(data) {
+        const describe = (users, verb) => {
+            if (users.length === 0) return;
+            const text = users.length <= 3
+                ? `${users.map(u => u.username).join(', ')} ${verb} the tavern`
+                : `${users.length} players ${verb} the tavern`;
+            addMessage({
+                type: 'system',
+                channel: data.channel,
+                message: text,
+                timestamp: new Date().toISOString()
+            });
+        };
+        describe(data.joined, 'entered');
+        describe(data.left, 'left');
+    }
+
     // Initialize WebSocket connection
     function connectWebSocket() {
         if (!token) {
@@ -481,18 +499,22 @@ function initializeChat(messagesArea, messageInput, inputForm) {
         }
 
         try {
-            ws = new WebSocket(`ws://217.182.65.174/ws/chat?token=${token}`);
+            ws = new WebSocket(`ws://217.182.65.174/ws/chat?token=${token}`, WsCodec.protocols());
+            ws.binaryType = 'arraybuffer';
 
             ws.onopen = () => {
                 console.log('Chat WebSocket connected');
             };
 
             ws.onmessage = (event) => {
-                const data = JSON.parse(event.data);
+                const data = WsCodec.decode(event.data);
                 console.log('[Chat] Received WebSocket message:', data);
 
                 // Handle different message types
-                if (data.type === 'online_count') {
+                if (data.type === 'ping') {
+                    // Server liveness check; unanswered sockets are closed after the idle timeout
+                    ws.send(JSON.stringify({ type: 'pong' }));
+                } else if (data.type === 'online_count') {
                     console.log('[Chat] Updating online count:', data.count);
                     updateOnlineCount(data.count);
                 } else if (data.type === 'system') {
@@ -500,9 +522,19 @@ function initializeChat(messagesArea, messageInput, inputForm) {
                     const msgText = data.text || data.message;
                     console.log('[Chat] System message:', msgText);
                     addMessage(data);
-                } else if (data.type === 'message') {
+                } else if (data.type === 'message' || data.type === 'whisper') {
                     console.log('[Chat] User message from:', data.username, '- text:', data.text);
                     addMessage(data);
+                } else if (data.type === 'presence_delta') {
+                    handlePresenceDelta(data);
+                } else if (data.type === 'history_batch') {
+                    // A page of channel history in one frame, oldest first
+                    console.log('[Chat] History loaded for', data.channel, '-', data.messages.length, 'messages, more:', data.next_cursor !== null);
+                    data.messages.forEach(addMessage);
+                } else if (data.type === 'joined' || data.type === 'left') {
+                    console.log('[Chat] Channel', data.type, data.channel);
+                } else if (data.type === 'error') {
+                    NotificationSystem.show(data.message, 'error');
                 } else {
                     console.warn('[Chat] Unknown message type:', data.type, data);
                 }
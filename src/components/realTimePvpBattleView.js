@@ -21,7 +21,8 @@ class PvPBattleConnection {
 
         console.log('[PVP Battle WS] Connecting to:', wsUrl);
 
-        this.ws = new WebSocket(wsUrl);
+        this.ws = new WebSocket(wsUrl, WsCodec.protocols());
+        this.ws.binaryType = 'arraybuffer';
 
         this.ws.onopen = () => {
             console.log('[PVP Battle WS] Connected');
@@ -30,8 +31,13 @@ class PvPBattleConnection {
         };
 
         this.ws.onmessage = (event) => {
-            const data = JSON.parse(event.data);
+            const data = WsCodec.decode(event.data);
             console.log('[PVP Battle WS] Received:', data);
+            if (data.type === 'ping') {
+                // Server liveness check; unanswered sockets are closed after the idle timeout
+                this.send({ type: 'pong' });
+                return;
+            }
             this.emit(data.type, data);
         };
 
@@ -65,6 +71,11 @@ class PvPBattleConnection {
         this.send({ type: 'forfeit' });
     }
 
+    requestHistory() {
+        // Server answers with a 'battle_history' event
+        this.send({ type: 'history' });
+    }
+
     on(event, handler) {
         if (!this.eventHandlers[event]) {
             this.eventHandlers[event] = [];
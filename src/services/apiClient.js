@@ -300,6 +300,20 @@ class APIClient {
         });
     }
 
+    /**
+     * Perform several attacks in a single request
+     * @param {number} battleId - Battle ID
+     * @param {Array<{enemyId: number, attackType: string}>} attacks - Attacks to resolve, in order
+     */
+    async attackEnemyBatch(battleId, attacks) {
+        return this.post(`/api/battles/${battleId}/attack/batch`, {
+            attacks: attacks.map(({ enemyId, attackType = 'normal' }) => ({
+                enemy_id: enemyId,
+                attack_type: attackType
+            }))
+        });
+    }
+
     /**
      * Claim loot from completed battle
      */
@@ -333,6 +347,25 @@ class APIClient {
         return await this.request('/api/inventory/');
     }
 
+    /**
+     * Get one page of inventory items
+     * @param {Object} params - cursor, limit, item_type, rarity, equipped, fields, format ('objects' | 'compact')
+     * Unchanged pages are revalidated by the browser cache via the inventory ETag.
+     */
+    async getInventoryItems(params = {}) {
+        const query = new URLSearchParams();
+        for (const [key, value] of Object.entries(params)) {
+            if (value === undefined || value === null) continue;
+            if (Array.isArray(value)) {
+                value.forEach(v => query.append(key, v));
+            } else {
+                query.append(key, value);
+            }
+        }
+        const qs = query.toString();
+        return await this.request(`/api/inventory/items${qs ? `?${qs}` : ''}`);
+    }
+
     /**
      * Equip an item
      */
@@ -343,6 +376,76 @@ class APIClient {
         });
     }
 
+    /**
+     * Equip a whole loadout in one request
+     * @param {Object} sets - { attack: { weapon: itemId, ring: null, ... }, defense: { ... } }
+     */
+    async equipLoadout(sets) {
+        return await this.request('/api/inventory/equip-loadout', {
+            method: 'POST',
+            body: JSON.stringify({ sets })
+        });
+    }
+
+    /**
+     * Salvage unequipped equipment at or below a rarity for gold
+     */
+    async salvageItems(maxRarity, { olderThanHours = null, itemTypes = null } = {}) {
+        return await this.request('/api/inventory/salvage', {
+            method: 'POST',
+            body: JSON.stringify({
+                max_rarity: maxRarity,
+                older_than_hours: olderThanHours,
+                item_types: itemTypes
+            })
+        });
+    }
+
+    /**
+     * Set the auto-salvage rarity for loot drops (null disables it)
+     */
+    async setAutoSalvage(maxRarity) {
+        return await this.request('/api/inventory/auto-salvage', {
+            method: 'PUT',
+            body: JSON.stringify({ max_rarity: maxRarity })
+        });
+    }
+
+    /**
+     * Get saved loadout presets
+     */
+    async getLoadoutPresets() {
+        return await this.request('/api/inventory/presets');
+    }
+
+    /**
+     * Save the current equipment and pets as a named preset
+     */
+    async saveLoadoutPreset(name) {
+        return await this.request('/api/inventory/presets', {
+            method: 'POST',
+            body: JSON.stringify({ name })
+        });
+    }
+
+    /**
+     * Switch to a saved preset
+     */
+    async activateLoadoutPreset(presetId) {
+        return await this.request(`/api/inventory/presets/${presetId}/activate`, {
+            method: 'POST'
+        });
+    }
+
+    /**
+     * Delete a saved preset
+     */
+    async deleteLoadoutPreset(presetId) {
+        return await this.request(`/api/inventory/presets/${presetId}`, {
+            method: 'DELETE'
+        });
+    }
+
     /**
      * Unequip an item
      */
@@ -408,6 +511,17 @@ class APIClient {
         });
     }
 
+    /**
+     * Buy several items in one checkout
+     * @param {Array} items - [{ item_id: 'food_basic', quantity: 50 }, ...]
+     */
+    async purchaseCart(items, useGems = false) {
+        return await this.request('/api/shop/purchase/cart', {
+            method: 'POST',
+            body: JSON.stringify({ items, use_gems: useGems })
+        });
+    }
+
     /**
      * Get purchase history
      */
@@ -455,6 +569,16 @@ class APIClient {
         });
     }
 
+    /**
+     * Feed a pet several units from one pet food stack at once
+     */
+    async feedPetFood(petId, itemId, quantity = 1) {
+        return await this.request('/api/pets/feed-food', {
+            method: 'POST',
+            body: JSON.stringify({ pet_id: petId, item_id: itemId, quantity })
+        });
+    }
+
     /**
      * Equip a pet to battle set
      */
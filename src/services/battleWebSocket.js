@@ -37,7 +37,8 @@ class BattleWebSocket {
 
         this.isManualDisconnect = false;
         this.connectionStatus = 'connecting';
-        this.ws = new WebSocket(wsURL);
+        this.ws = new WebSocket(wsURL, WsCodec.protocols());
+        this.ws.binaryType = 'arraybuffer';
 
         // Connection opened
         this.ws.onopen = () => {
@@ -51,7 +52,7 @@ class BattleWebSocket {
         // Message received
         this.ws.onmessage = (event) => {
             try {
-                const message = JSON.parse(event.data);
+                const message = WsCodec.decode(event.data);
                 console.log('[BattleWS] Message received:', message);
                 this.handleMessage(message);
             } catch (error) {
@@ -103,6 +104,16 @@ class BattleWebSocket {
                 this.triggerEvent('welcome', data);
                 break;
 
+            case 'ping':
+                // Server liveness check; unanswered sockets are closed after the idle timeout
+                this.ws.send(JSON.stringify({ type: 'pong' }));
+                break;
+
+            case 'history_batch':
+                // Persisted battle log replayed in one frame, oldest first
+                data.messages.forEach((log) => this.handleMessage(log));
+                break;
+
             case 'player_joined':
                 // Another player joined WebSocket
                 console.log(`[BattleWS] Player joined: ${data.username} (${data.player_count} total)`);
@@ -128,6 +139,27 @@ class BattleWebSocket {
                 this.triggerEvent('attack', data);
                 break;
 
+            case 'attack_batch':
+                // Several attacks resolved in one request - replay as individual events
+                console.log(`[BattleWS] ${data.player_name} landed ${data.hits.length} hits for ${data.total_damage} damage`);
+                data.hits.forEach(hit => {
+                    this.triggerEvent('attack', {
+                        ...hit,
+                        player_name: data.player_name,
+                        player_level: data.player_level
+                    });
+                    if (hit.enemy_defeated) {
+                        this.triggerEvent('enemy_defeated', {
+                            enemy_id: hit.enemy_id,
+                            defeated_by: data.player_name
+                        });
+                    }
+                });
+                if (data.battle_completed) {
+                    this.triggerEvent('battle_completed', { message: 'All enemies defeated! Claim your loot!' });
+                }
+                break;
+
             case 'enemy_defeated':
                 // Enemy was defeated
                 console.log(`[BattleWS] Enemy ${data.enemy_id} defeated by ${data.defeated_by}`);
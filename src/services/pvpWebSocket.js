@@ -21,6 +21,7 @@ class PvPWebSocketClient {
         this.heartbeatInterval = null;
         this.eventHandlers = {};
         this.pendingChallenges = new Set();
+        this.username = null;
     }
 
     /**
@@ -48,7 +49,8 @@ class PvPWebSocketClient {
 
             console.log('[PVP WS] Connecting to:', wsUrl);
 
-            this.ws = new WebSocket(wsUrl);
+            this.ws = new WebSocket(wsUrl, WsCodec.protocols());
+            this.ws.binaryType = 'arraybuffer';
 
             this.ws.onopen = () => this.onOpen();
             this.ws.onmessage = (event) => this.onMessage(event);
@@ -84,7 +86,7 @@ class PvPWebSocketClient {
      */
     onMessage(event) {
         try {
-            const data = JSON.parse(event.data);
+            const data = WsCodec.decode(event.data);
             console.log('[PVP WS] Received:', data);
 
             // Route message to appropriate handler
@@ -97,6 +99,11 @@ class PvPWebSocketClient {
                     // Heartbeat response
                     break;
 
+                case 'ping':
+                    // Server liveness check; any message resets the idle timeout
+                    this.ws.send(JSON.stringify({ type: 'pong' }));
+                    break;
+
                 case 'challenge_received':
                     this.handleChallengeReceived(data);
                     break;
@@ -109,6 +116,10 @@ class PvPWebSocketClient {
                     this.handleChallengeCancelled(data);
                     break;
 
+                case 'challenge_expired':
+                    this.handleChallengeExpired(data);
+                    break;
+
                 case 'duel_ready':
                     this.handleDuelReady(data);
                     break;
@@ -117,6 +128,10 @@ class PvPWebSocketClient {
                     this.handleOnlineStatus(data);
                     break;
 
+                case 'presence_delta':
+                    this.handlePresenceDelta(data);
+                    break;
+
                 case 'battle_created':
                     this.handleBattleCreated(data);
                     break;
@@ -225,6 +240,8 @@ class PvPWebSocketClient {
 
     handleConnected(data) {
         console.log('[PVP WS] Server confirmed connection:', data);
+        // Our own presence is in the deltas too; remember who we are to skip it
+        this.username = data.username;
     }
 
     handleChallengeReceived(data) {
@@ -296,6 +313,20 @@ class PvPWebSocketClient {
         }
     }
 
+    handleChallengeExpired(data) {
+        console.log('[PVP WS] Challenge expired:', data.duel_id);
+
+        this.pendingChallenges.delete(data.duel_id);
+
+        // Emit event for UI update
+        this.emit('challenge_expired', data);
+
+        // Reload active duels
+        if (typeof loadActiveDuels === 'function') {
+            loadActiveDuels();
+        }
+    }
+
     handleDuelReady(data) {
         console.log('[PVP WS] Duel ready:', data.duel_id);
 
@@ -340,6 +371,30 @@ class PvPWebSocketClient {
         }
     }
 
+    handlePresenceDelta(data) {
+        // One batched update per second replaces an online_status event per user
+        const joined = data.joined.filter(u => u.username !== this.username);
+        const left = data.left.filter(u => u.username !== this.username);
+        console.log('[PVP WS] Presence:', joined.length, 'online,', left.length, 'offline,', data.count, 'connected');
+        if (joined.length === 0 && left.length === 0) return;
+
+        const parts = [];
+        if (joined.length === 1) parts.push(`🟢 ${joined[0].username} came online`);
+        else if (joined.length > 1) parts.push(`🟢 ${joined.length} players came online`);
+        if (left.length === 1) parts.push(`⚫ ${left[0].username} went offline`);
+        else if (left.length > 1) parts.push(`⚫ ${left.length} players went offline`);
+        NotificationSystem.show(parts.join(', '), 'info', 2000);
+
+        // Keep per-user listeners working
+        joined.forEach(u => this.emit('online_status', { ...u, is_online: true }));
+        left.forEach(u => this.emit('online_status', { ...u, is_online: false }));
+
+        // Refresh online players list once for the whole batch
+        if (typeof loadOnlinePlayers === 'function') {
+            setTimeout(() => loadOnlinePlayers(), 500);
+        }
+    }
+
     handleBattleCreated(data) {
         console.log('[PVP WS] Battle created:', data.battle_id);
 
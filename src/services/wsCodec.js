@@ -0,0 +1,201 @@
+/**
+ * WebSocket Message Codec
+ * Optional MessagePack decoding for high-frequency real-time events
+ *
+ * Sockets speak JSON text unless the client offers the "wg.msgpack.v1"
+ * subprotocol. Opt in per browser with:
+ *   localStorage.setItem('wsEncoding', 'msgpack');
+ * The server then sends attack, turn_result, presence_delta and similar events
+ * as binary MessagePack frames with integer-tagged keys (see the tag tables in
+ * backend/README.md). decode() turns either kind of frame into the object the
+ * JSON encoding would have produced.
+ *
+ * Usage:
+ *   const ws = new WebSocket(url, WsCodec.protocols());
+ *   ws.binaryType = 'arraybuffer';
+ *   ws.onmessage = (event) => { const message = WsCodec.decode(event.data); };
+ */
+
+const WsCodec = {
+    SUBPROTOCOL: 'wg.msgpack.v1',
+
+    // Tag -> name, the reverse of TYPES and FIELDS in backend/app/services/ws_codec.py
+    TYPES: {
+        1: 'attack',
+        2: 'attack_batch',
+        3: 'enemy_defeated',
+        4: 'turn_result',
+        5: 'request_action',
+        6: 'opponent_action_submitted',
+        7: 'presence_delta'
+    },
+
+    FIELDS: {
+        0: 'type',
+        1: 'timestamp',
+        2: 'battle_id',
+        3: 'player_name',
+        4: 'player_level',
+        5: 'username',
+        6: 'user_id',
+        7: 'enemy_id',
+        8: 'enemy_name',
+        9: 'damage',
+        10: 'is_critical',
+        11: 'enemy_hp_remaining',
+        12: 'enemy_defeated',
+        13: 'battle_completed',
+        14: 'hits',
+        15: 'total_damage',
+        16: 'defeated_enemy_ids',
+        17: 'phase_transitions',
+        18: 'turn',
+        19: 'actions',
+        20: 'hp',
+        21: 'effects',
+        22: 'channel',
+        23: 'joined',
+        24: 'left',
+        25: 'count',
+        26: 'defeated_by'
+    },
+
+    /**
+     * Whether this browser opted in to MessagePack frames
+     */
+    enabled() {
+        try {
+            return localStorage.getItem('wsEncoding') === 'msgpack';
+        } catch (error) {
+            return false;
+        }
+    },
+
+    /**
+     * Subprotocols to pass to new WebSocket()
+     */
+    protocols() {
+        return this.enabled() ? [this.SUBPROTOCOL] : [];
+    },
+
+    /**
+     * Decode a text (JSON) or binary (MessagePack) frame's event.data
+     */
+    decode(data) {
+        if (typeof data === 'string') {
+            return JSON.parse(data);
+        }
+        return this.expand(this.unpack(new Uint8Array(data)));
+    },
+
+    /**
+     * Replace integer tags with the names the JSON encoding uses
+     */
+    expand(compact) {
+        const message = {};
+        for (const [key, value] of Object.entries(compact)) {
+            const name = this.FIELDS[key] || key;
+            if (name === 'type') {
+                message.type = this.TYPES[value] || value;
+            } else if (name === 'timestamp' && typeof value === 'number') {
+                // Naive UTC ISO string like the server's datetime.utcnow().isoformat() (millisecond precision)
+                message.timestamp = new Date(value).toISOString().replace('Z', '000');
+            } else if (Array.isArray(value) && value.length && this.isObject(value[0])) {
+                message[name] = value.map((item) => this.expandKeys(item));
+            } else {
+                message[name] = value;
+            }
+        }
+        return message;
+    },
+
+    expandKeys(item) {
+        const result = {};
+        for (const [key, value] of Object.entries(item)) {
+            result[this.FIELDS[key] || key] = value;
+        }
+        return result;
+    },
+
+    isObject(value) {
+        return value !== null && typeof value === 'object' && !Array.isArray(value);
+    },
+
+    /**
+     * Minimal MessagePack decoder (nil, bool, int, float, str, bin, array, map)
+     */
+    unpack(bytes) {
+        const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+        const text = new TextDecoder();
+        let offset = 0;
+
+        const str = (length) => {
+            const value = text.decode(bytes.subarray(offset, offset + length));
+            offset += length;
+            return value;
+        };
+        const bin = (length) => {
+            const value = bytes.slice(offset, offset + length);
+            offset += length;
+            return value;
+        };
+        const array = (length) => {
+            const value = [];
+            for (let i = 0; i < length; i++) value.push(read());
+            return value;
+        };
+        const map = (length) => {
+            const value = {};
+            for (let i = 0; i < length; i++) {
+                const key = read();
+                value[key] = read();
+            }
+            return value;
+        };
+        const next = (size, getter) => {
+            const value = getter(offset);
+            offset += size;
+            return value;
+        };
+
+        const read = () => {
+            const byte = bytes[offset++];
+
+            if (byte <= 0x7f) return byte;
+            if (byte >= 0xe0) return byte - 0x100;
+            if (byte >= 0x80 && byte <= 0x8f) return map(byte & 0x0f);
+            if (byte >= 0x90 && byte <= 0x9f) return array(byte & 0x0f);
+            if (byte >= 0xa0 && byte <= 0xbf) return str(byte & 0x1f);
+
+            switch (byte) {
+                case 0xc0: return null;
+                case 0xc2: return false;
+                case 0xc3: return true;
+                case 0xc4: return bin(next(1, (at) => view.getUint8(at)));
+                case 0xc5: return bin(next(2, (at) => view.getUint16(at)));
+                case 0xc6: return bin(next(4, (at) => view.getUint32(at)));
+                case 0xca: return next(4, (at) => view.getFloat32(at));
+                case 0xcb: return next(8, (at) => view.getFloat64(at));
+                case 0xcc: return next(1, (at) => view.getUint8(at));
+                case 0xcd: return next(2, (at) => view.getUint16(at));
+                case 0xce: return next(4, (at) => view.getUint32(at));
+                case 0xcf: return next(8, (at) => Number(view.getBigUint64(at)));
+                case 0xd0: return next(1, (at) => view.getInt8(at));
+                case 0xd1: return next(2, (at) => view.getInt16(at));
+                case 0xd2: return next(4, (at) => view.getInt32(at));
+                case 0xd3: return next(8, (at) => Number(view.getBigInt64(at)));
+                case 0xd9: return str(next(1, (at) => view.getUint8(at)));
+                case 0xda: return str(next(2, (at) => view.getUint16(at)));
+                case 0xdb: return str(next(4, (at) => view.getUint32(at)));
+                case 0xdc: return array(next(2, (at) => view.getUint16(at)));
+                case 0xdd: return array(next(4, (at) => view.getUint32(at)));
+                case 0xde: return map(next(2, (at) => view.getUint16(at)));
+                case 0xdf: return map(next(4, (at) => view.getUint32(at)));
+                default:
+                    throw new Error(`Unsupported MessagePack type 0x${byte.toString(16)}`);
+            }
+        };
+
+        return read();
+    }
+};